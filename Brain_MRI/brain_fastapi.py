@@ -1,8 +1,10 @@
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import numpy as np
@@ -12,6 +14,12 @@ import io
 import os
 from tensorflow.keras.applications.densenet import preprocess_input
 
+from medvision_common.gradcam import HEATMAP_FORMATS, ExplanationCache, LazyGradCAM, explain_uploads
+from medvision_common.job_queue import expand_upload, queue_from_env
+from medvision_common.modality_gate import ModalityGate
+from medvision_common.phash_index import image_hash, index_from_env
+from medvision_common.tensor_ingest import RAW_IMAGE_TYPES, parse_tensor, raw_content_type
+
 # FastAPI app initialization
 app = FastAPI(
     title="AI Medical Assistant - Brain MRI Classifier",
@@ -45,6 +53,16 @@ display_names = {
     "pituitary": "Pituitary"
 }
 
+# Prediction cache for repeat uploads (opt-in with PHASH_CACHE=1)
+phash_index = index_from_env("brain_mri")
+
+# Rejects skin photos, X-rays etc. before the DenseNet forward pass
+modality_gate = ModalityGate("brain_mri")
+
+# Grad-CAM heatmaps computed in the same pass as the prediction (wrapped on the first /explain call)
+grad_cam = LazyGradCAM(model)
+explanation_cache = ExplanationCache()
+
 # Preprocess incoming images
 def preprocess_image(image_bytes):
     img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
@@ -54,21 +72,12 @@ def preprocess_image(image_bytes):
     img_array = np.expand_dims(img_array, axis=0).astype(np.float32)
     return img_array
 
-# Prediction Endpoint
-@app.post("/predict")
-async def predict_brain(file: UploadFile = File(...)):
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
-        raise HTTPException(status_code=400, detail="Invalid image format. Only JPG/PNG allowed.")
-
-    image_bytes = await file.read()
-    img_array = preprocess_image(image_bytes)
-
-    predictions = model.predict(img_array)
-    pred_idx = int(np.argmax(predictions))
+def format_prediction(probs):
+    pred_idx = int(np.argmax(probs))
 
     predicted_raw = class_names[pred_idx]
     predicted_class = display_names[predicted_raw]
-    confidence = float(np.max(predictions)) * 100
+    confidence = float(np.max(probs)) * 100
 
     message = (
         "No tumor detected ✅"
@@ -76,12 +85,145 @@ async def predict_brain(file: UploadFile = File(...)):
         else f"Possible {predicted_class} tumor detected — please consult a specialist 🔍"
     )
 
-    return JSONResponse(content={
+    return {
         "prediction": predicted_class,
         "confidence": f"{confidence:.2f}%",
         "message": message
+    }
+
+def predict_image_bytes(image_bytes):
+    modality_issue = modality_gate.check(image_bytes)
+    if modality_issue and modality_gate.rejects:
+        raise HTTPException(status_code=400, detail=modality_issue)
+
+    def run_model():
+        img_array = preprocess_image(image_bytes)
+
+        predictions = model.predict(img_array)
+
+        return format_prediction(predictions[0])
+
+    result = phash_index.predict(image_hash(image_bytes), run_model)
+    if modality_issue:
+        result["modality_warning"] = modality_issue
+
+    return result
+
+# Background worker pool for /jobs, backed by a local SQLite queue
+job_queue = queue_from_env(predict_image_bytes)
+
+# Prediction Endpoint
+@app.post("/predict")
+async def predict_brain(file: UploadFile = File(...)):
+    if file.content_type not in RAW_IMAGE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid image format. Only JPG/PNG allowed.")
+
+    image_bytes = await file.read()
+    return JSONResponse(content=predict_image_bytes(image_bytes))
+
+# Raw-body Prediction Endpoint (image bytes as the body, no multipart)
+@app.post("/predict/raw")
+async def predict_brain_raw(request: Request):
+    if raw_content_type(request.headers.get("content-type")) not in RAW_IMAGE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid image format. Only JPG/PNG allowed.")
+
+    image_bytes = await request.body()
+    return JSONResponse(content=predict_image_bytes(image_bytes))
+
+# Pre-tensorized Prediction Endpoint (224x224x3 little-endian float32 or uint8)
+@app.post("/predict/tensor")
+async def predict_brain_tensor(
+    request: Request,
+    x_tensor_shape: str = Header(...),
+    x_tensor_dtype: str = Header("float32")
+):
+    try:
+        img_array = parse_tensor(await request.body(), x_tensor_shape, x_tensor_dtype, (224, 224, 3))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The modality gate needs pixels: uint8 tensors are checked like uploads, float32 ones are
+    # already model-preprocessed and exempt
+    modality_issue = modality_gate.check_pixels(img_array[0]) if img_array.dtype == np.uint8 else None
+    if modality_issue and modality_gate.rejects:
+        raise HTTPException(status_code=400, detail=modality_issue)
+
+    # uint8 tensors are raw pixels; float32 tensors are already DenseNet-preprocessed
+    if img_array.dtype == np.uint8:
+        img_array = preprocess_input(img_array.astype(np.float32))
+
+    predictions = model.predict(img_array)
+    result = format_prediction(predictions[0])
+    if modality_issue:
+        result["modality_warning"] = modality_issue
+    return JSONResponse(content=result)
+
+# Explanation Endpoint
+@app.post("/explain")
+async def explain_brain(
+    files: List[UploadFile] = File(...),
+    heatmap_format: str = Query("png", alias="format")
+):
+    if heatmap_format not in HEATMAP_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {HEATMAP_FORMATS}")
+
+    uploads = []
+    for file in files:
+        if file.content_type not in RAW_IMAGE_TYPES:
+            raise HTTPException(status_code=400, detail=f"{file.filename}: Invalid image format. Only JPG/PNG allowed.")
+        image_bytes = await file.read()
+        modality_issue = modality_gate.check(image_bytes)
+        if modality_issue and modality_gate.rejects:
+            raise HTTPException(status_code=400, detail=f"{file.filename}: {modality_issue}")
+        uploads.append(image_bytes)
+
+    results = explain_uploads(grad_cam, explanation_cache, uploads, preprocess_image, format_prediction, heatmap_format)
+
+    return JSONResponse(content={
+        "format": heatmap_format,
+        "results": [{"filename": file.filename, **result} for file, result in zip(files, results)]
     })
 
+# Asynchronous Job Endpoints (large uploads, zip archives of slices)
+@app.post("/jobs")
+async def submit_job(files: List[UploadFile] = File(...)):
+    items = []
+    for file in files:
+        try:
+            items.extend(expand_upload(file.filename, await file.read()))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    job_id = job_queue.submit(items)
+    return {"job_id": job_id, "status": "queued", "total": len(items)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    if job_queue.get(job_id, with_results=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return StreamingResponse(job_queue.progress_events(job_id), media_type="application/x-ndjson")
+
+@app.get("/health")
+def health_check():
+    return {
+        "status": "healthy",
+        "model_loaded": True,
+        "class_labels": class_names,
+        "phash_index": phash_index.stats(),
+        "modality_gate": modality_gate.stats(),
+        "explanation_cache": explanation_cache.stats(),
+        "jobs": job_queue.stats()
+    }
+
 import os
 import uvicorn
 
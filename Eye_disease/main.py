@@ -2,8 +2,10 @@ import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import numpy as np
 import cv2
@@ -13,6 +15,12 @@ from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
 from tensorflow.keras.applications import EfficientNetB3
 from tensorflow.keras.preprocessing import image
 
+from medvision_common.gradcam import HEATMAP_FORMATS, ExplanationCache, LazyGradCAM, explain_uploads
+from medvision_common.job_queue import expand_upload, queue_from_env
+from medvision_common.modality_gate import ModalityGate
+from medvision_common.phash_index import image_hash, index_from_env
+from medvision_common.tensor_ingest import parse_tensor, raw_content_type
+
 app = FastAPI(title="Eye Disease Classifier API")
 
 # Add CORS middleware
@@ -122,6 +130,16 @@ except Exception as e:
 class_labels = ["Cataracts", "Normal_Eyes", "Uveitis"]
 print(f"Class labels: {class_labels}")
 
+# Prediction cache for repeat uploads (opt-in with PHASH_CACHE=1)
+phash_index = index_from_env("eye")
+
+# Grad-CAM heatmaps computed in the same pass as the prediction (wrapped on the first /explain call)
+grad_cam = LazyGradCAM(model)
+explanation_cache = ExplanationCache()
+
+# Rejects X-rays, CT/MRI slices etc. before the EfficientNet forward pass
+modality_gate = ModalityGate("eye")
+
 @app.get("/")
 def home():
     return {
@@ -131,6 +149,10 @@ def home():
         "endpoints": {
             "health": "/health",
             "predict": "/predict", 
+            "predict_raw": "/predict/raw",
+            "predict_tensor": "/predict/tensor",
+            "explain": "/explain",
+            "jobs": "/jobs",
             "docs": "/docs"
         },
         "instructions": "Use /predict endpoint with POST method to upload an image for classification"
@@ -142,65 +164,217 @@ def health_check():
         "status": "healthy", 
         "model_loaded": True,
         "class_labels": class_labels,
-        "input_shape": model.input_shape
+        "input_shape": model.input_shape,
+        "phash_index": phash_index.stats(),
+        "modality_gate": modality_gate.stats(),
+        "explanation_cache": explanation_cache.stats(),
+        "jobs": job_queue.stats()
+    }
+
+def preprocess_image(contents):
+    """
+    Decode an uploaded image into a (1, 224, 224, 3) EfficientNet input batch
+    """
+    npimg = np.frombuffer(contents, np.uint8)
+    img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    
+    if img is None:
+        raise HTTPException(status_code=400, detail="Could not decode image file")
+    
+    print(f"Original image shape: {img.shape}")
+    
+    # Convert BGR to RGB and resize to 224x224
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img_resized = cv2.resize(img_rgb, (224, 224))
+    
+    # Preprocess for EfficientNet
+    img_array = image.img_to_array(img_resized)
+    img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
+    return np.expand_dims(img_array, axis=0)
+
+def format_prediction(probs):
+    predicted_class_idx = np.argmax(probs)
+    confidence = float(np.max(probs) * 100)
+    predicted_label = class_labels[predicted_class_idx]
+    
+    # Get all confidence scores
+    all_confidences = {
+        class_labels[i]: f"{float(probs[i] * 100):.2f}%"
+        for i in range(len(class_labels))
+    }
+    
+    return {
+        "prediction": predicted_label,
+        "confidence": f"{confidence:.2f}%",
+        "all_predictions": all_confidences,
+        "status": "success"
     }
 
+def predict_image_bytes(contents):
+    try:
+        modality_issue = modality_gate.check(contents)
+        if modality_issue and modality_gate.rejects:
+            raise HTTPException(status_code=400, detail=modality_issue)
+
+        def run_model():
+            img_array = preprocess_image(contents)
+            
+            print(f"Final input shape: {img_array.shape}")
+            
+            # Make prediction
+            predictions = model.predict(img_array, verbose=0)
+            
+            return {
+                **format_prediction(predictions[0]),
+                "input_shape_used": f"{img_array.shape}"
+            }
+
+        # Repeat uploads (exact hash match) are served from the cache
+        result = phash_index.predict(image_hash(contents), run_model)
+        if modality_issue:
+            result["modality_warning"] = modality_issue
+
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+# Background worker pool for /jobs, backed by a local SQLite queue
+job_queue = queue_from_env(predict_image_bytes)
+
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
     """
     Predict eye disease from uploaded image
     Expected diseases: Cataracts, Normal_Eyes, Uveitis
     """
+    # Validate file type
+    if not (file.content_type or "").startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image (JPEG, PNG, etc.)")
+    
+    contents = await file.read()
+    return JSONResponse(predict_image_bytes(contents))
+
+@app.post("/predict/raw")
+async def predict_raw(request: Request):
+    """
+    Same as /predict, but the image bytes are the request body (no multipart)
+    """
+    if not raw_content_type(request.headers.get("content-type")).startswith('image/'):
+        raise HTTPException(status_code=400, detail="Content-Type must be an image type (image/jpeg, image/png, etc.)")
+    
+    contents = await request.body()
+    return JSONResponse(predict_image_bytes(contents))
+
+@app.post("/predict/tensor")
+async def predict_tensor(
+    request: Request,
+    x_tensor_shape: str = Header(...),
+    x_tensor_dtype: str = Header("float32")
+):
+    """
+    Predict from an already-decoded 224x224x3 RGB tensor sent as the request body
+    Headers: X-Tensor-Shape (e.g. 224,224,3), X-Tensor-Dtype (float32 or uint8, little-endian)
+    """
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image (JPEG, PNG, etc.)")
-        
-        # Read and decode image
-        contents = await file.read()
-        npimg = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Could not decode image file")
-        
-        print(f"Original image shape: {img.shape}")
-        
-        # Convert BGR to RGB and resize to 224x224
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_resized = cv2.resize(img_rgb, (224, 224))
-        
-        # Preprocess for EfficientNet
-        img_array = image.img_to_array(img_resized)
-        img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        print(f"Final input shape: {img_array.shape}")
+        img_array = parse_tensor(await request.body(), x_tensor_shape, x_tensor_dtype, (224, 224, 3))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The modality gate needs pixels: uint8 tensors are checked like uploads, float32 ones are
+    # already model-preprocessed and exempt
+    modality_issue = modality_gate.check_pixels(img_array[0]) if img_array.dtype == np.uint8 else None
+    if modality_issue and modality_gate.rejects:
+        raise HTTPException(status_code=400, detail=modality_issue)
+    
+    try:
+        # uint8 tensors are raw RGB pixels; float32 tensors are already EfficientNet-preprocessed
+        if img_array.dtype == np.uint8:
+            img_array = tf.keras.applications.efficientnet.preprocess_input(img_array.astype(np.float32))
         
-        # Make prediction
         predictions = model.predict(img_array, verbose=0)
-        predicted_class_idx = np.argmax(predictions[0])
-        confidence = float(np.max(predictions[0]) * 100)
-        predicted_label = class_labels[predicted_class_idx]
-        
-        # Get all confidence scores
-        all_confidences = {
-            class_labels[i]: f"{float(predictions[0][i] * 100):.2f}%"
-            for i in range(len(class_labels))
-        }
         
-        return JSONResponse({
-            "prediction": predicted_label,
-            "confidence": f"{confidence:.2f}%",
-            "all_predictions": all_confidences,
-            "status": "success",
+        result = {
+            **format_prediction(predictions[0]),
             "input_shape_used": f"{img_array.shape}"
-        })
+        }
+        if modality_issue:
+            result["modality_warning"] = modality_issue
+        return JSONResponse(result)
         
     except Exception as e:
         print(f"Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+@app.post("/explain")
+async def explain(
+    files: List[UploadFile] = File(...),
+    heatmap_format: str = Query("png", alias="format")
+):
+    """
+    Predict and return Grad-CAM heatmaps for one or more uploaded images
+    format=png returns base64 overlays, format=array the raw 7x7 activation grid
+    """
+    if heatmap_format not in HEATMAP_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {HEATMAP_FORMATS}")
+    
+    uploads = []
+    for file in files:
+        if not (file.content_type or "").startswith('image/'):
+            raise HTTPException(status_code=400, detail=f"{file.filename}: File must be an image (JPEG, PNG, etc.)")
+        contents = await file.read()
+        modality_issue = modality_gate.check(contents)
+        if modality_issue and modality_gate.rejects:
+            raise HTTPException(status_code=400, detail=f"{file.filename}: {modality_issue}")
+        uploads.append(contents)
+    
+    try:
+        results = explain_uploads(grad_cam, explanation_cache, uploads, preprocess_image, format_prediction, heatmap_format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Explanation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Explanation error: {str(e)}")
+    
+    return JSONResponse({
+        "format": heatmap_format,
+        "results": [{"filename": file.filename, **result} for file, result in zip(files, results)]
+    })
+
+@app.post("/jobs")
+async def submit_job(files: List[UploadFile] = File(...)):
+    """
+    Queue one or more images (or zip archives of images) for background prediction
+    Returns a job_id to poll with GET /jobs/{job_id} or stream with GET /jobs/{job_id}/events
+    """
+    items = []
+    for file in files:
+        try:
+            items.extend(expand_upload(file.filename, await file.read()))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    
+    job_id = job_queue.submit(items)
+    return {"job_id": job_id, "status": "queued", "total": len(items)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    if job_queue.get(job_id, with_results=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return StreamingResponse(job_queue.progress_events(job_id), media_type="application/x-ndjson")
+
 # For Render deployment
 if __name__ == "__main__":
     import uvicorn
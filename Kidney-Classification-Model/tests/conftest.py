@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+@pytest.fixture(scope="session")
+def service_root(tmp_path_factory):
+    """
+    A deployment directory with a small stand-in for the trained model (same
+    input and output shapes), which is not checked in.
+    """
+    import tensorflow as tf
+
+    root = tmp_path_factory.mktemp("kidney_service")
+    inputs = tf.keras.Input((224, 224, 1))
+    features = tf.keras.layers.Conv2D(4, 3, activation="relu")(inputs)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(tf.keras.layers.GlobalAveragePooling2D()(features))
+    tf.keras.Model(inputs, outputs).save(root / "Kidney_CT_Classifier_clean_dense.h5")
+    return root
+
+
+@pytest.fixture(scope="session")
+def api(service_root):
+    # No modality_gate.json ships, so rejection has to be switched on explicitly
+    settings = {
+        "MODALITY_GATE_MODE": "reject",
+        "MODALITY_GATE_PROFILE": str(service_root / "modality_gate.json"),
+        "JOB_DB_PATH": str(service_root / "jobs.sqlite3"),
+    }
+    saved = {key: os.environ.get(key) for key in settings}
+    cwd = os.getcwd()
+    os.environ.update(settings)
+    os.chdir(service_root)
+    try:
+        import kidney_fastapi
+    finally:
+        os.chdir(cwd)
+        for key, value in saved.items():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+
+    return kidney_fastapi
+
+
+@pytest.fixture(scope="session")
+def client(api):
+    from fastapi.testclient import TestClient
+
+    return TestClient(api.app)
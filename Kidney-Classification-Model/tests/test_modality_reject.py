@@ -0,0 +1,52 @@
+import io
+import os
+
+from PIL import Image
+
+from medvision_common.modality_gate import ModalityGate
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CT_IMAGE = os.path.join(SERVICE_DIR, "Kindey_Stone_Dataset_clean", "test", "Stone", "Stone- (502).jpg")
+
+
+def skin_photo():
+    buffer = io.BytesIO()
+    Image.new("RGB", (224, 224), (200, 130, 90)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def ct_scan():
+    with open(CT_IMAGE, "rb") as f:
+        return f.read()
+
+
+def test_reject_mode_refuses_off_modality_uploads(api, client):
+    assert api.modality_gate.rejects
+    response = client.post("/predict", files={"file": ("skin.png", skin_photo(), "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Image does not look like a kidney CT"
+
+    response = client.post("/explain", files=[
+        ("files", ("ct.jpg", ct_scan(), "image/jpeg")),
+        ("files", ("skin.png", skin_photo(), "image/png")),
+    ])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "skin.png: Image does not look like a kidney CT"
+
+
+def test_reject_mode_passes_ct_scans(client):
+    response = client.post("/predict", files={"file": ("ct.jpg", ct_scan(), "image/jpeg")})
+    assert response.status_code == 200
+    assert "modality_warning" not in response.json()
+
+
+def test_without_a_profile_the_gate_only_warns(api, client, service_root, monkeypatch):
+    # What a deployment gets until a modality_gate.json is trained
+    monkeypatch.delenv("MODALITY_GATE_MODE", raising=False)
+    monkeypatch.delenv("MODALITY_GATE_PROFILE", raising=False)
+    gate = ModalityGate("kidney_ct", profile_path=str(service_root / "modality_gate.json"))
+    monkeypatch.setattr(api, "modality_gate", gate)
+    assert not api.modality_gate.rejects
+    response = client.post("/predict", files={"file": ("skin.png", skin_photo(), "image/png")})
+    assert response.status_code == 200
+    assert response.json()["modality_warning"] == "Image does not look like a kidney CT"
@@ -1,5 +1,7 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from typing import List
+
+from fastapi import FastAPI, File, UploadFile, Request, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import joblib
 import numpy as np
@@ -7,6 +9,12 @@ import cv2
 from skimage.feature import hog
 from PIL import Image
 import io
+import json
+
+from medvision_common.job_queue import expand_upload, queue_from_env
+from medvision_common.modality_gate import ModalityGate
+from medvision_common.phash_index import image_hash, index_from_env
+from medvision_common.tensor_ingest import RAW_IMAGE_TYPES, parse_tensor, raw_content_type
 
 # -----------------------
 # Initialize FastAPI
@@ -33,6 +41,12 @@ except Exception as e:
     print(f"Error loading model: {e}")
     clf = None
 
+# Prediction cache for repeat uploads (opt-in with PHASH_CACHE=1)
+phash_index = index_from_env("chest_xray")
+
+# Rejects skin photos, MRIs etc. before HOG extraction
+modality_gate = ModalityGate("chest_xray")
+
 # -----------------------
 # Helper function
 # -----------------------
@@ -40,6 +54,10 @@ def preprocess_hog(image: Image.Image):
     """Preprocess the uploaded image and extract HOG features."""
     img = np.array(image.convert("L"))
     img = cv2.resize(img, (128, 128))
+    return hog_features(img)
+
+def hog_features(img):
+    """Extract HOG features from a 128x128 grayscale array."""
     features, _ = hog(
         img,
         orientations=9,
@@ -50,27 +68,124 @@ def preprocess_hog(image: Image.Image):
     )
     return features.reshape(1, -1)
 
+label_map = {0: "Normal", 1: "Pneumonia"}
+
+def predict_image_bytes(contents):
+    if clf is None:
+        return JSONResponse({"error": "Model not loaded"}, status_code=500)
+    try:
+        modality_issue = modality_gate.check(contents)
+        if modality_issue and modality_gate.rejects:
+            return JSONResponse({"error": modality_issue}, status_code=400)
+
+        def run_model():
+            image = Image.open(io.BytesIO(contents))
+            features = preprocess_hog(image)
+            pred = clf.predict(features)[0]
+            result = label_map[int(pred)]
+            return {"prediction": result}
+
+        response = phash_index.predict(image_hash(contents), run_model)
+        if modality_issue:
+            response["modality_warning"] = modality_issue
+        return response
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+def predict_job_item(contents):
+    """Job worker handler: same as /predict, with error responses as plain dicts."""
+    response = predict_image_bytes(contents)
+    if isinstance(response, JSONResponse):
+        return json.loads(response.body)
+    return response
+
+# Background worker pool for /jobs, backed by a local SQLite queue
+job_queue = queue_from_env(predict_job_item)
+
 # -----------------------
-# API endpoint
+# API endpoints
 # -----------------------
 @app.post("/predict")
 async def predict_image(file: UploadFile = File(...)):
+    contents = await file.read()
+    return predict_image_bytes(contents)
+
+# Image bytes as the request body, no multipart parsing
+@app.post("/predict/raw")
+async def predict_image_raw(request: Request):
+    if raw_content_type(request.headers.get("content-type")) not in RAW_IMAGE_TYPES:
+        return JSONResponse({"error": "Invalid image format. Only JPG/PNG allowed."}, status_code=400)
+    contents = await request.body()
+    return predict_image_bytes(contents)
+
+# Already-resized 128x128 grayscale image as a little-endian uint8/float32 tensor
+@app.post("/predict/tensor")
+async def predict_image_tensor(
+    request: Request,
+    x_tensor_shape: str = Header(...),
+    x_tensor_dtype: str = Header("float32")
+):
     if clf is None:
         return JSONResponse({"error": "Model not loaded"}, status_code=500)
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        features = preprocess_hog(image)
-        pred = clf.predict(features)[0]
-        label_map = {0: "Normal", 1: "Pneumonia"}
-        result = label_map[int(pred)]
-        return {"prediction": result}
+        img = parse_tensor(await request.body(), x_tensor_shape, x_tensor_dtype, (128, 128))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    # The modality gate needs pixels: uint8 tensors are checked like uploads, float32 ones are exempt
+    modality_issue = modality_gate.check_pixels(img[0]) if img.dtype == np.uint8 else None
+    if modality_issue and modality_gate.rejects:
+        return JSONResponse({"error": modality_issue}, status_code=400)
+    try:
+        pred = clf.predict(hog_features(img[0]))[0]
+        response = {"prediction": label_map[int(pred)]}
+        if modality_issue:
+            response["modality_warning"] = modality_issue
+        return response
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+# -----------------------
+# Asynchronous job endpoints (large uploads, zip archives)
+# -----------------------
+@app.post("/jobs")
+async def submit_job(files: List[UploadFile] = File(...)):
+    items = []
+    for file in files:
+        try:
+            items.extend(expand_upload(file.filename, await file.read()))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+    if not items:
+        return JSONResponse({"error": "No images found in upload"}, status_code=400)
+    job_id = job_queue.submit(items)
+    return {"job_id": job_id, "status": "queued", "total": len(items)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+def stream_job(job_id: str):
+    if job_queue.get(job_id, with_results=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return StreamingResponse(job_queue.progress_events(job_id), media_type="application/x-ndjson")
+
 # -----------------------
 # Root endpoint
 # -----------------------
 @app.get("/")
 def home():
     return {"message": "Chest X-ray HOG-SVM API is running!"}
+
+@app.get("/health")
+def health_check():
+    return {
+        "status": "healthy",
+        "model_loaded": clf is not None,
+        "phash_index": phash_index.stats(),
+        "modality_gate": modality_gate.stats(),
+        "jobs": job_queue.stats()
+    }
@@ -0,0 +1,16 @@
+"""
+Modules shared by the MedVision AI services and dashboards.
+
+Each service installs this package from its requirements file
+(``../common``), so the helpers below exist once instead of being copied
+into every service directory:
+
+- image services: ``phash_index``, ``modality_gate``, ``gradcam``,
+  ``tensor_ingest``, ``job_queue``
+- drug services and dashboards: ``reloader``, ``arabic_names``,
+  ``drug_entities``, ``drug_snapshot``, ``ddi_store``
+
+Submodules are imported explicitly (``from medvision_common.gradcam import
+GradCAM``); nothing is imported here, so a service only pulls in the
+dependencies of the modules it uses.
+"""
@@ -0,0 +1,200 @@
+"""
+Arabic-script lookup of Latin drug names.
+
+Drug names in the tables are Latin-script, but users type them the way they
+are written on Arabic packaging (e.g. بنادول for PANADOL). Both scripts are
+reduced to the same consonant skeleton (short and long vowels dropped,
+letters that transliterate to each other merged into one class, doubled
+consonants collapsed), so PANADOL and بنادول both become ب ن د ل. The
+skeleton of every name token is precomputed into an inverted index, so an
+Arabic query costs one dictionary lookup per word plus a short edit-distance
+ranking of the few names sharing that skeleton.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+ARABIC_RE = re.compile(r"[\u0600-\u06ff\u0750-\u077f]")
+# Harakat/tanween/superscript alef and tatweel, dropped before matching
+ARABIC_DIACRITICS_RE = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_FOLD = str.maketrans({
+    "آ": "ا", "أ": "ا", "إ": "ا", "ٱ": "ا",  # alef variants
+    "ى": "ي", "ی": "ي", "ئ": "ي",  # alef maqsura, farsi yeh, yeh hamza
+    "ة": "ه",  # taa marbuta
+    "ؤ": "و",  # waw hamza
+    "ک": "ك",  # keheh
+})
+TOKEN_RE = re.compile(r"\w+")
+
+# Latin spellings checked longest-first, then single letters. Vowels map to "".
+LATIN_CLASSES = [
+    ("ph", "ف"), ("th", "ت"), ("sh", "ش"), ("ch", "ك"), ("kh", "ك"), ("gh", "ج"),
+    ("ck", "ك"), ("qu", "ك"), ("ce", "س"), ("ci", "س"), ("cy", "س"), ("x", "كس"),
+    ("b", "ب"), ("p", "ب"), ("d", "د"), ("f", "ف"), ("v", "ف"), ("g", "ج"), ("j", "ج"),
+    ("h", "ه"), ("k", "ك"), ("q", "ك"), ("c", "ك"), ("l", "ل"), ("m", "م"), ("n", "ن"),
+    ("r", "ر"), ("s", "س"), ("t", "ت"), ("z", "ز"),
+    ("a", ""), ("e", ""), ("i", ""), ("o", ""), ("u", ""), ("y", ""), ("w", ""),
+]
+ARABIC_CLASSES = {
+    "ب": "ب", "پ": "ب", "ت": "ت", "ط": "ت", "ث": "ت", "ج": "ج", "غ": "ج", "گ": "ج",
+    "ح": "ه", "ه": "ه", "خ": "ك", "د": "د", "ض": "د", "ذ": "ز", "ز": "ز", "ظ": "ز",
+    "ر": "ر", "س": "س", "ص": "س", "ش": "ش", "ف": "ف", "ڤ": "ف", "ق": "ك", "ك": "ك",
+    "ل": "ل", "م": "م", "ن": "ن",
+}
+# Display transliteration: consonant classes plus long-vowel letters
+LATIN_VOWELS = {"a": "ا", "e": "ي", "i": "ي", "o": "و", "u": "و", "y": "ي", "w": "و"}
+
+
+def has_arabic(text):
+    return bool(ARABIC_RE.search(text))
+
+
+def normalize_arabic(text):
+    """NFKC, case-fold, strip diacritics/tatweel and unify alef/yaa/taa-marbuta variants."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(ARABIC_DIACRITICS_RE.sub("", text).translate(ARABIC_FOLD).split())
+
+
+def _latin_units(word):
+    i = 0
+    while i < len(word):
+        for spelling, cls in LATIN_CLASSES:
+            if word.startswith(spelling, i):
+                yield spelling, cls
+                i += len(spelling)
+                break
+        else:
+            yield word[i], None
+            i += 1
+
+
+def phonetic_key(word):
+    """Consonant skeleton of a single Latin or Arabic word."""
+    word = normalize_arabic(word)
+    classes = []
+    if has_arabic(word):
+        classes = [ARABIC_CLASSES.get(ch, "") for ch in word]
+    else:
+        for unit, cls in _latin_units(word):
+            # Digits and other characters are kept so strengths like 500 still disambiguate
+            classes.append(unit if cls is None else cls)
+    key = []
+    for cls in "".join(classes):
+        if not key or key[-1] != cls:
+            key.append(cls)
+    return "".join(key)
+
+
+def transliterate(name):
+    """Approximate Arabic-script rendering of a Latin drug name, for display."""
+    words = []
+    for word in TOKEN_RE.findall(name.lower()):
+        units = list(_latin_units(word))
+        if len(units) > 3 and units[-1][0] == "e":
+            units.pop()  # silent final e: cetirizine, omeprazole
+        out = []
+        for unit, cls in units:
+            if cls is None:
+                out.append(unit)
+            elif cls:
+                if not out or out[-1] != cls:
+                    out.append(cls)
+            elif not out:
+                out.append("ا" if unit == "a" else "ا" + LATIN_VOWELS[unit])
+            elif out[-1][-1] not in "اوي":
+                out.append(LATIN_VOWELS[unit])
+        words.append("".join(out))
+    return " ".join(words)
+
+
+def phonetic_name(text):
+    """Space-joined phonetic keys of every word in a name."""
+    keys = (phonetic_key(word) for word in TOKEN_RE.findall(normalize_arabic(text)))
+    return " ".join(key for key in keys if key)
+
+
+def _distance(a, b):
+    """Levenshtein distance, used to rank candidates that share a phonetic key."""
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+class PhoneticIndex:
+    """
+    Phonetic-key lookups over one or more name columns.
+
+    Every name is transliterated once at build time. ``postings`` maps the
+    key of each name word to {transliterated word: row IDs} (whole-word
+    search); ``phrases`` does the same for full names, one dict per column
+    (exact-name lookup). Names sharing a key (PANADOL / BOPINDOLOL) are
+    ranked by edit distance between the typed Arabic and the transliteration.
+    """
+
+    def __init__(self, columns, min_key_length=2):
+        """columns: list of equally long lists of names, one entry per row."""
+        self.min_key_length = min_key_length
+        postings = defaultdict(lambda: defaultdict(set))
+        self.phrases = []
+        forms = {}  # word -> (key, transliteration); names share most of their words
+        for values in columns:
+            phrases = defaultdict(lambda: defaultdict(list))
+            for row_id, value in enumerate(values):
+                words = TOKEN_RE.findall(normalize_arabic(str(value)))
+                for word in words:
+                    if word not in forms:
+                        forms[word] = (phonetic_key(word), transliterate(word))
+                    key, arabic = forms[word]
+                    if len(key) >= min_key_length:
+                        postings[key][arabic].add(row_id)
+                key = " ".join(forms[word][0] for word in words if forms[word][0])
+                if key:
+                    phrases[key][" ".join(forms[word][1] for word in words)].append(row_id)
+            self.phrases.append({key: dict(variants) for key, variants in phrases.items()})
+        self.postings = {
+            key: {arabic: sorted(ids) for arabic, ids in variants.items()}
+            for key, variants in postings.items()
+        }
+
+    def search(self, query):
+        """
+        Rows where every query word's key matches a name word, as
+        (row_id, total_distance) ranked by distance then table order.
+        """
+        scores = None
+        for word in set(TOKEN_RE.findall(normalize_arabic(query))):
+            key = phonetic_key(word)
+            if len(key) < self.min_key_length:
+                continue
+            best = {}
+            for arabic, row_ids in self.postings.get(key, {}).items():
+                distance = _distance(word, arabic)
+                for row_id in row_ids:
+                    if distance < best.get(row_id, distance + 1):
+                        best[row_id] = distance
+            if scores is None:
+                scores = best
+            else:
+                scores = {row_id: scores[row_id] + d for row_id, d in best.items() if row_id in scores}
+            if not scores:
+                return []
+        return sorted((scores or {}).items(), key=lambda item: (item[1], item[0]))
+
+    def lookup(self, query):
+        """
+        Rows whose full name has the query's key, from the closest
+        transliteration; earlier columns win ties.
+        """
+        key = phonetic_name(query)
+        query = normalize_arabic(query)
+        best = None
+        for priority, phrases in enumerate(self.phrases):
+            for arabic, row_ids in phrases.get(key, {}).items():
+                rank = (_distance(query, arabic), priority, row_ids[0])
+                if best is None or rank < best[0]:
+                    best = (rank, row_ids)
+        return best[1] if best else []
@@ -0,0 +1,258 @@
+"""
+Compact, memory-mapped storage for the DDI (drug-drug interaction) table.
+
+Every column of ``DDI_data.csv`` is interned: each distinct value is stored
+once in a vocabulary and rows hold integer codes into it. ``drug1_<x>`` and
+``drug2_<x>`` share one vocabulary, so a pair of drugs is two int32 IDs in
+the same ID space; other columns such as ``interaction_type`` get the
+smallest integer code type that fits. With DrugBank's five columns that is
+17 bytes per pair, about 16 MB per million pairs, instead of hundreds of MB
+of Python strings.
+
+The codes are written to a single binary artifact next to the CSV (a JSON
+header with the vocabularies and the SHA-256 of the source, then the
+aligned code arrays) and memory-mapped at startup, so workers on one host
+share the same page-cached file. The CSV is ingested in chunks, so building
+needs memory for one chunk plus the vocabularies, not for the whole table.
+It is rebuilt automatically when the CSV's hash changes; build it ahead of
+deployment with:
+
+    python -m medvision_common.ddi_store [path/to/DDI_data.csv]
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+ARTIFACT_VERSION = 1
+MAGIC = b"DDIPAIRS"
+ALIGNMENT = 64
+CHUNK_ROWS = 500_000
+PAIR_COLUMN_RE = re.compile(r"drug[12]_(.+)")
+
+
+def vocabulary_of(column):
+    """drug1_name and drug2_name share the "name" vocabulary; other columns have their own."""
+    match = PAIR_COLUMN_RE.fullmatch(column)
+    return match.group(1) if match else column
+
+
+def code_dtype(column, vocabulary_size):
+    if PAIR_COLUMN_RE.fullmatch(column):
+        return np.dtype(np.int32)
+    for dtype in (np.int8, np.int16):
+        if vocabulary_size <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int32)
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def artifact_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".ddi"
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class DDITable:
+    """
+    The DDI table as integer codes plus vocabularies.
+
+    ``codes[column]`` is an array with one code per row (-1 for a missing
+    value) into ``vocabularies[vocabulary_of(column)]``. Rows are materialised
+    as strings only for the positions a request returns.
+    """
+
+    def __init__(self, columns, codes, vocabularies, memory_mapped=False):
+        self.columns = list(columns)
+        self.codes = codes
+        self.vocabularies = {name: np.asarray(values, dtype=object) for name, values in vocabularies.items()}
+        self.size = len(codes[self.columns[0]]) if self.columns else 0
+        self.memory_mapped = memory_mapped
+        # Vocabulary with a trailing None, so code -1 decodes to None
+        self._decode = {name: np.append(values, None) for name, values in self.vocabularies.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        columns = list(df.columns)
+        vocabularies = {}
+        codes = {}
+        for column in columns:
+            vocabulary = vocabularies.setdefault(vocabulary_of(column), {})
+            codes[column] = _intern(df[column], vocabulary)
+        vocabularies = {name: list(vocabulary) for name, vocabulary in vocabularies.items()}
+        codes = {column: codes[column].astype(code_dtype(column, len(vocabularies[vocabulary_of(column)])))
+                 for column in columns}
+        return cls(columns, codes, vocabularies)
+
+    def __len__(self):
+        return self.size
+
+    def vocabulary(self, column):
+        return self.vocabularies[vocabulary_of(column)]
+
+    def values(self, column, positions=None):
+        codes = self.codes[column] if positions is None else self.codes[column][positions]
+        return self._decode[vocabulary_of(column)][codes]
+
+    def frame(self, positions=None, categorical=False):
+        """
+        The rows at positions (all rows by default) as a DataFrame of strings,
+        or, with categorical=True, of pandas categoricals over the vocabularies.
+        """
+        if categorical:
+            return pd.DataFrame({
+                column: pd.Categorical.from_codes(
+                    self.codes[column] if positions is None else self.codes[column][positions],
+                    categories=pd.Index(self.vocabulary(column), dtype=object),
+                )
+                for column in self.columns
+            })
+        return pd.DataFrame({column: self.values(column, positions) for column in self.columns})
+
+    def row(self, position):
+        return {column: self._decode[vocabulary_of(column)][self.codes[column][position]] for column in self.columns}
+
+    def rows(self, positions):
+        decoded = [self.values(column, positions).tolist() for column in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*decoded)]
+
+    def nbytes(self):
+        return sum(codes.nbytes for codes in self.codes.values())
+
+    def stats(self):
+        code_bytes = self.nbytes()
+        return {
+            "rows": self.size,
+            "memory_mapped": self.memory_mapped,
+            "code_bytes": code_bytes,
+            "vocabularies": {name: len(values) for name, values in self.vocabularies.items()},
+            "mb_per_million_pairs": round(code_bytes / self.size * 1_000_000 / 2 ** 20, 2) if self.size else 0.0,
+        }
+
+
+def _intern(values, vocabulary):
+    """int32 codes for a column, adding new values to vocabulary (value -> code) in order of appearance."""
+    codes, uniques = pd.factorize(values)
+    ids = np.array([vocabulary.setdefault(value, len(vocabulary)) for value in uniques.tolist()] + [-1], dtype=np.int32)
+    # factorize marks missing values -1, which picks the trailing -1
+    return ids[codes]
+
+
+def build_artifact(csv_path, artifact_path=None, digest=None, chunk_rows=CHUNK_ROWS):
+    """Stream the CSV in chunks into a DDI artifact; returns its path."""
+    artifact_path = artifact_path or artifact_path_for(csv_path)
+    digest = digest or file_digest(csv_path)
+    tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+
+    columns = None
+    vocabularies = {}
+    spools = {}
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, dtype=str, chunksize=chunk_rows):
+            if columns is None:
+                columns = list(chunk.columns)
+                spools = {column: open(f"{tmp_path}.{i}", "wb") for i, column in enumerate(columns)}
+            for column in columns:
+                vocabulary = vocabularies.setdefault(vocabulary_of(column), {})
+                _intern(chunk[column], vocabulary).tofile(spools[column])
+            rows += len(chunk)
+        for spool in spools.values():
+            spool.close()
+        columns = columns or []
+
+        layout = []
+        offset = 0
+        for column in columns:
+            dtype = code_dtype(column, len(vocabularies[vocabulary_of(column)]))
+            layout.append({"name": column, "dtype": dtype.str, "offset": offset})
+            offset = _aligned(offset + rows * dtype.itemsize)
+        header = json.dumps({
+            "version": ARTIFACT_VERSION,
+            "source_sha256": digest,
+            "rows": rows,
+            "columns": layout,
+            "vocabularies": {name: list(vocabulary) for name, vocabulary in vocabularies.items()},
+        }).encode()
+        data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+        with open(tmp_path, "wb") as out:
+            out.write(MAGIC + len(header).to_bytes(8, "little") + header)
+            for column, spec in zip(columns, layout):
+                out.seek(data_start + spec["offset"])
+                with open(spools[column].name, "rb") as spool:
+                    while True:
+                        block = np.fromfile(spool, dtype=np.int32, count=chunk_rows)
+                        if not len(block):
+                            break
+                        block.astype(spec["dtype"]).tofile(out)
+            out.truncate(data_start + offset)
+        # Written beside the target and renamed, so concurrent workers never read a partial file
+        os.replace(tmp_path, artifact_path)
+    finally:
+        for spool in spools.values():
+            spool.close()
+            if os.path.exists(spool.name):
+                os.remove(spool.name)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return artifact_path
+
+
+def read_artifact(artifact_path, digest=None):
+    """Memory-map an artifact; None if it is missing, unreadable or (given digest) stale."""
+    try:
+        with open(artifact_path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length))
+    except (FileNotFoundError, ValueError):
+        return None
+    if header.get("version") != ARTIFACT_VERSION or (digest is not None and header.get("source_sha256") != digest):
+        return None
+
+    rows = header["rows"]
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+    codes = {}
+    for spec in header["columns"]:
+        dtype = np.dtype(spec["dtype"])
+        if rows:
+            codes[spec["name"]] = np.memmap(
+                artifact_path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=(rows,)
+            )
+        else:
+            codes[spec["name"]] = np.empty(0, dtype=dtype)
+    return DDITable([spec["name"] for spec in header["columns"]], codes, header["vocabularies"], memory_mapped=True)
+
+
+def load_ddi(csv_path="DDI_data.csv", artifact_path=None):
+    """DDI table memory-mapped from its artifact, (re)building it if the CSV changed."""
+    artifact_path = artifact_path or artifact_path_for(csv_path)
+    digest = file_digest(csv_path)
+    table = read_artifact(artifact_path, digest)
+    if table is None:
+        build_artifact(csv_path, artifact_path, digest)
+        table = read_artifact(artifact_path, digest)
+    return table
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "DDI_data.csv"
+    table = read_artifact(build_artifact(csv_path))
+    stats = table.stats()
+    print(f"Saved {artifact_path_for(csv_path)} ({stats['rows']} rows, "
+          f"{stats['mb_per_million_pairs']} MB per million pairs, vocabularies {stats['vocabularies']})")
@@ -0,0 +1,381 @@
+"""
+Drug entities shared by the description and interaction services.
+
+Both services resolve a name to the same entity: one per active ingredient
+across the Saudi formulary, the description table and the DDI table.
+Scientific names are merged when they differ only by a salt or ester
+(ATORVASTATIN CALCIUM = Atorvastatin) or are listed as spellings of one
+ingredient in ``SYNONYMS`` (PARACETAMOL = Acetaminophen); the first spelling
+seen names the entity and the others are kept as its synonyms. Each entity
+carries its scientific name, synonyms, every trade name, Arabic-script
+forms, and cross-links to the description table rows and the DDI drug name
+describing it. A description row is linked to the entity of its scientific
+name and, when its trade name starts with a formulary trade name
+(``PANADOL 500MG TAB``), to that brand's entity too, so combination
+products are found from the brand. Names resolve with one rule everywhere:
+scientific names and synonyms first, then trade names (formulary first,
+earlier rows first), then, for Arabic-script input, the consonant skeleton
+of a scientific or formulary trade name.
+
+The table is built from the three source files and written as one gzipped,
+column-oriented JSON artifact holding the SHA-256 of each source. Both
+services load the same artifact, DRUG_ENTITIES_PATH (default
+``drug_entities.json.gz`` at the repository root), from the same sources
+and never override them, so their digests agree and whichever starts first
+builds it for both. It is rebuilt when any source changes; if the artifact
+cannot be written the service serves the freshly built table anyway. Build
+it ahead of deployment (e.g. for a read-only image) with:
+
+    python -m medvision_common.drug_entities [path/to/drug_entities.json.gz]
+
+Source paths default to this repository's layout and can be overridden with
+DRUG_DESCRIPTION_CSV, SAUDI_DRUGS_CSV and DDI_CSV.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+
+import pandas as pd
+
+from .arabic_names import _distance, has_arabic, normalize_arabic, phonetic_name, transliterate
+
+ARTIFACT_VERSION = 2
+CHUNK_ROWS = 500_000
+# common/medvision_common/ -> repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SOURCES = {
+    "descriptions": os.environ.get(
+        "DRUG_DESCRIPTION_CSV", os.path.join(ROOT, "drug_description_fastapi", "Drugs_discription.csv")
+    ),
+    "formulary": os.environ.get(
+        "SAUDI_DRUGS_CSV", os.path.join(ROOT, "durg_interactions_fast_api", "Complete_Saudi_Drugs_Database.csv")
+    ),
+    "interactions": os.environ.get("DDI_CSV", os.path.join(ROOT, "durg_interactions_fast_api", "DDI_data.csv")),
+}
+# One artifact for both services
+ARTIFACT_PATH = os.environ.get("DRUG_ENTITIES_PATH", os.path.join(ROOT, "drug_entities.json.gz"))
+# Fillers that stand for "no name" in the sources, never resolved to a drug
+PLACEHOLDER_NAMES = {"", "unknown", "under research", "various brands"}
+# Salt / ester words dropped from the end of a single-ingredient name (not nitrates: mono- and
+# dinitrates are different drugs, nor acids: mycophenolic acid is not mycophenolate)
+SALT_WORDS = {
+    "acetate", "acetonide", "besilate", "besylate", "calcium", "citrate", "cypionate", "diethylamine",
+    "dihydrate", "dihydrochloride", "dipropionate", "epolamine", "fumarate", "gluconate", "hcl", "hydrobromide",
+    "hydrochloride", "lactate", "magnesium", "maleate", "medoxomil", "mesilate", "mesylate", "monohydrate",
+    "phosphate", "potassium", "propionate", "sodium", "succinate", "sulfate", "sulphate", "tartrate",
+    "trihydrate", "tromethamine", "valerate",
+}
+# International (INN / BAN) spelling -> the US one, for ingredients the sources name both ways
+SYNONYMS = {
+    "acetylsalicylic acid": "aspirin",
+    "aciclovir": "acyclovir",
+    "adrenaline": "epinephrine",
+    "amoxycillin": "amoxicillin",
+    "beclometasone": "beclomethasone",
+    "cefalexin": "cephalexin",
+    "chlorphenamine": "chlorpheniramine",
+    "ciclosporin": "cyclosporine",
+    "clomifene": "clomiphene",
+    "colecalciferol": "cholecalciferol",
+    "frusemide": "furosemide",
+    "glibenclamide": "glyburide",
+    "hyoscine": "scopolamine",
+    "indometacin": "indomethacin",
+    "lignocaine": "lidocaine",
+    "mesalazine": "mesalamine",
+    "metamizole": "dipyrone",
+    "noradrenaline": "norepinephrine",
+    "oestradiol": "estradiol",
+    "paracetamol": "acetaminophen",
+    "pethidine": "meperidine",
+    "phenobarbitone": "phenobarbital",
+    "rifampicin": "rifampin",
+    "salbutamol": "albuterol",
+    "torasemide": "torsemide",
+    "valaciclovir": "valacyclovir",
+}
+COMBINATION_RE = re.compile(r"[,+/&]| and | with ")
+
+logger = logging.getLogger(__name__)
+
+
+def entity_key(name):
+    return normalize_arabic(name)
+
+
+def ingredient_key(name):
+    """Key shared by the spellings of one ingredient: salt words dropped, then SYNONYMS applied."""
+    key = entity_key(name)
+    if not COMBINATION_RE.search(key):
+        words = key.split()
+        # "sodium chloride" keeps its cation
+        while len(words) > 1 and words[-1] in SALT_WORDS and words[-2] not in SALT_WORDS:
+            words.pop()
+        key = " ".join(words)
+    return SYNONYMS.get(key, key)
+
+
+def _words(name):
+    return tuple(re.findall(r"[^\W_]+", entity_key(name)))
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def source_digests(sources):
+    """SHA-256 of each source file, None for a missing one."""
+    return {name: file_digest(path) if os.path.exists(path) else None for name, path in sources.items()}
+
+
+def read_descriptions(csv_path):
+    """The description table cleaned as drug_snapshot.clean does, so row positions match the service's."""
+    df = pd.read_csv(csv_path, dtype=str, low_memory=False)
+    df.columns = df.columns.str.strip()
+    return df.dropna(how="all").drop_duplicates().fillna("Unknown")
+
+
+def _names(values):
+    """Usable names from a column: strings that are not placeholders."""
+    return [
+        value.strip() if isinstance(value, str) and entity_key(value) not in PLACEHOLDER_NAMES else None
+        for value in values
+    ]
+
+
+def build_entities(sources):
+    """Column-oriented entity table (a JSON-ready dict) from the source files that exist."""
+    ids = {}
+    scientific, synonyms, trade_names, arabic, description_rows, ddi_names = [], [], [], [], [], []
+
+    def entity(name):
+        key = ingredient_key(name)
+        if key not in ids:
+            ids[key] = len(scientific)
+            scientific.append(name)
+            synonyms.append([])
+            trade_names.append([])
+            arabic.append([transliterate(name)])
+            description_rows.append([])
+            ddi_names.append(None)
+        entity_id = ids[key]
+        if entity_key(name) != entity_key(scientific[entity_id]) and name not in synonyms[entity_id]:
+            synonyms[entity_id].append(name)
+        return entity_id
+
+    def add_trade(entity_id, trade, with_arabic):
+        if trade not in trade_names[entity_id]:
+            trade_names[entity_id].append(trade)
+            form = transliterate(trade)
+            if with_arabic and form not in arabic[entity_id]:
+                arabic[entity_id].append(form)
+
+    if os.path.exists(sources["formulary"]):
+        formulary = pd.read_csv(sources["formulary"], dtype=str)
+        for sci, trade in zip(_names(formulary["scientific_name"]), _names(formulary["trade_name_saudi"])):
+            if sci is not None:
+                entity_id = entity(sci)
+                if trade is not None:
+                    add_trade(entity_id, trade, with_arabic=True)
+    formulary_trades = [list(names) for names in trade_names]
+    # Formulary brand (as words) -> its entity, first row wins
+    brands = {}
+    for entity_id, trades in enumerate(formulary_trades):
+        for trade in trades:
+            brands.setdefault(_words(trade), entity_id)
+    brands.pop((), None)
+    longest_brand = max(map(len, brands), default=0)
+
+    if os.path.exists(sources["descriptions"]):
+        descriptions = read_descriptions(sources["descriptions"])
+        rows = zip(_names(descriptions["ScientificName"]), _names(descriptions["TradeName"]))
+        for row_id, (sci, trade) in enumerate(rows):
+            linked = []
+            if sci is not None:
+                linked.append(entity(sci))
+            if trade is not None:
+                words = _words(trade)
+                brand = next(
+                    (brands[words[:n]] for n in range(min(len(words), longest_brand), 0, -1) if words[:n] in brands),
+                    None,
+                )
+                if brand is not None and brand not in linked:
+                    linked.append(brand)
+            for entity_id in linked:
+                description_rows[entity_id].append(row_id)
+                if trade is not None:
+                    # Description trade names carry strength and form, so they get no Arabic form
+                    add_trade(entity_id, trade, with_arabic=False)
+
+    if os.path.exists(sources["interactions"]):
+        for chunk in pd.read_csv(
+            sources["interactions"], dtype=str, usecols=["drug1_name", "drug2_name"], chunksize=CHUNK_ROWS
+        ):
+            for name in pd.unique(pd.concat([chunk["drug1_name"], chunk["drug2_name"]]).dropna()):
+                if entity_key(name) not in PLACEHOLDER_NAMES:
+                    entity_id = entity(name.strip())
+                    if ddi_names[entity_id] is None:
+                        ddi_names[entity_id] = name.lower()
+
+    # Lookup keys, first entity wins: scientific names and synonyms, then trade names, each in entity order
+    names = {}
+    for entity_id, spellings in enumerate(zip(scientific, synonyms)):
+        for name in [spellings[0], *spellings[1]]:
+            names.setdefault(entity_key(name), entity_id)
+    for entity_id, trades in enumerate(formulary_trades):
+        for trade in trades:
+            names.setdefault(entity_key(trade), entity_id)
+    for entity_id, trades in enumerate(trade_names):
+        for trade in trades:
+            names.setdefault(entity_key(trade), entity_id)
+    # Consonant skeleton -> entities with a scientific / formulary trade name of that skeleton, in priority order
+    arabic_keys = {}
+    for entity_id, name in enumerate(scientific):
+        arabic_keys.setdefault(phonetic_name(name), []).append(entity_id)
+    for entity_id, trades in enumerate(formulary_trades):
+        for trade in trades:
+            candidates = arabic_keys.setdefault(phonetic_name(trade), [])
+            if entity_id not in candidates:
+                candidates.append(entity_id)
+    arabic_keys.pop("", None)
+
+    return {
+        "scientific": scientific,
+        "synonyms": synonyms,
+        "trade_names": trade_names,
+        "arabic": arabic,
+        "description_rows": description_rows,
+        "ddi_names": ddi_names,
+        "names": names,
+        "arabic_keys": arabic_keys,
+    }
+
+
+def write_artifact(table, digests, artifact_path=ARTIFACT_PATH):
+    tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": ARTIFACT_VERSION, "sources": digests, **table}, f, ensure_ascii=False,
+                  separators=(",", ":"))
+    # Written beside the target and renamed, so the other service never reads a partial file
+    os.replace(tmp_path, artifact_path)
+    return artifact_path
+
+
+def read_artifact(artifact_path=ARTIFACT_PATH, digests=None):
+    """The stored table, or None if it is missing, unreadable or (given digests) stale."""
+    try:
+        with gzip.open(artifact_path, "rt", encoding="utf-8") as f:
+            table = json.load(f)
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+    if table.get("version") != ARTIFACT_VERSION or (digests is not None and table.get("sources") != digests):
+        return None
+    return table
+
+
+class EntityTable:
+    def __init__(self, table):
+        self.sources = table.get("sources", {})
+        self.scientific = table["scientific"]
+        self.synonyms = table["synonyms"]
+        self.trade_names = table["trade_names"]
+        self.arabic = table["arabic"]
+        self.description_rows = table["description_rows"]
+        self.ddi_names = table["ddi_names"]
+        self.names = table["names"]
+        self.arabic_keys = table["arabic_keys"]
+
+    def __len__(self):
+        return len(self.scientific)
+
+    def resolve(self, name):
+        """Entity ID for a scientific, trade or Arabic-script name, or None."""
+        entity_id = self.names.get(entity_key(name))
+        if entity_id is None:
+            # Salts and spellings not in any source (METFORMIN HCL)
+            entity_id = self.names.get(ingredient_key(name))
+        if entity_id is None and has_arabic(name):
+            # Entities sharing the skeleton (PANADOL / BOPINDOLOL) are ranked by the closest Arabic form
+            query = normalize_arabic(name)
+            candidates = self.arabic_keys.get(phonetic_name(name), [])
+            ranked = [
+                (min(_distance(query, form) for form in self.arabic[candidate]), rank, candidate)
+                for rank, candidate in enumerate(candidates)
+            ]
+            entity_id = min(ranked)[2] if ranked else None
+        return entity_id
+
+    def ddi_name(self, entity_id, ids=None):
+        """
+        Lowercased DDI name of an entity, or None. Given the served DDI table's
+        names (``PairIndex.ids``), the first of the name seen in the DDI source
+        and the lowercased scientific name and synonyms that the table has (the
+        built-in sample is not a source); otherwise the DDI source's name.
+        """
+        if ids is None:
+            return self.ddi_names[entity_id]
+        spellings = [self.scientific[entity_id], *self.synonyms[entity_id]]
+        for name in (self.ddi_names[entity_id], *(spelling.lower() for spelling in spellings)):
+            if name is not None and name in ids:
+                return name
+        return None
+
+    def ddi_nodes(self, ids):
+        """DDI node per entity (``PairIndex.ids`` maps lowercased DDI names to nodes), None where it has none."""
+        return [
+            None if name is None else ids[name]
+            for name in (self.ddi_name(entity_id, ids) for entity_id in range(len(self.scientific)))
+        ]
+
+    def record(self, entity_id, ids=None):
+        """The entity as a response dict; ``ids`` as for ddi_name."""
+        return {
+            "id": entity_id,
+            "scientific_name": self.scientific[entity_id],
+            "synonyms": self.synonyms[entity_id],
+            "trade_names": self.trade_names[entity_id],
+            "arabic_names": self.arabic[entity_id],
+            "description_rows": self.description_rows[entity_id],
+            "ddi_name": self.ddi_name(entity_id, ids),
+        }
+
+    def stats(self):
+        return {
+            "entities": len(self.scientific),
+            "synonyms": sum(map(len, self.synonyms)),
+            "names": len(self.names),
+            "arabic_keys": len(self.arabic_keys),
+            "with_descriptions": sum(1 for rows in self.description_rows if rows),
+            "with_interactions": sum(1 for name in self.ddi_names if name is not None),
+            "sources": {name: digest is not None for name, digest in self.sources.items()},
+        }
+
+
+def load_entities(sources=None, artifact_path=ARTIFACT_PATH):
+    """Entity table from the artifact, (re)building it if any source changed."""
+    sources = {**SOURCES, **(sources or {})}
+    digests = source_digests(sources)
+    table = read_artifact(artifact_path, digests)
+    if table is None:
+        table = {"sources": digests, **build_entities(sources)}
+        try:
+            write_artifact(table, digests, artifact_path)
+        except OSError as e:
+            logger.warning("Could not save %s (%s); the entity table is rebuilt on every load", artifact_path, e)
+    return EntityTable(table)
+
+
+if __name__ == "__main__":
+    artifact_path = sys.argv[1] if len(sys.argv) > 1 else ARTIFACT_PATH
+    digests = source_digests(SOURCES)
+    write_artifact(build_entities(SOURCES), digests, artifact_path)
+    entities = EntityTable(read_artifact(artifact_path))
+    print(f"Saved {artifact_path} ({entities.stats()})")
@@ -0,0 +1,105 @@
+"""
+Columnar snapshot of the cleaned drug description table.
+
+Parsing ``Drugs_discription.csv`` and deduplicating it on every boot is the
+bulk of startup time. The cleaned table is instead written once to an
+uncompressed Feather (Arrow IPC) file next to the CSV, with low-cardinality
+columns (classes, uses, side-effect lists...) dictionary-encoded, and the
+SHA-256 of the source CSV stored in the file metadata. At startup the snapshot
+is read instead of the CSV; it is rebuilt automatically when the CSV's hash no
+longer matches. The DataFrame is a full in-memory copy, so the gain is parse
+time plus the compact categorical columns, which the API keeps; callers that
+want plain string columns (the dashboard) pass ``categorical=False``. Build it
+ahead of deployment with:
+
+    python -m medvision_common.drug_snapshot [path/to/Drugs_discription.csv]
+"""
+import hashlib
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+SNAPSHOT_VERSION = "1"
+CATEGORICAL_COLUMNS = ["Therapeutic Class", "Chemical Class", "Habit Forming"]
+# Other columns are dictionary-encoded when they repeat at least this much
+MAX_DISTINCT_RATIO = 0.5
+
+
+def clean(df):
+    """The cleaning both consumers have always applied to the raw CSV."""
+    df.columns = df.columns.str.strip()
+    return df.dropna(how="all").drop_duplicates().fillna("Unknown")
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def snapshot_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".feather"
+
+
+def build_snapshot(csv_path, snapshot_path=None, digest=None):
+    """Clean the CSV and write it as a dictionary-encoded Feather file. Returns the DataFrame."""
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    digest = digest or file_digest(csv_path)
+    df = clean(pd.read_csv(csv_path, dtype=str, low_memory=False))
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS or df[col].nunique() <= MAX_DISTINCT_RATIO * len(df):
+            df[col] = df[col].astype("category")
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"source_sha256": digest.encode(),
+        b"snapshot_version": SNAPSHOT_VERSION.encode(),
+    })
+    # Written beside the target and renamed, so concurrent workers never read a partial file
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, snapshot_path)
+    return df
+
+
+def read_snapshot(snapshot_path, digest):
+    """Read a snapshot into a DataFrame, or return None if it is missing or stale."""
+    try:
+        # Not memory-mapped: to_pandas copies every column anyway
+        table = feather.read_table(snapshot_path)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if (metadata.get(b"source_sha256") != digest.encode()
+            or metadata.get(b"snapshot_version") != SNAPSHOT_VERSION.encode()):
+        return None
+    return table.to_pandas()
+
+
+def load_table(csv_path="Drugs_discription.csv", snapshot_path=None, categorical=True):
+    """
+    Cleaned drug table from the snapshot, (re)building it if the CSV changed.
+    With categorical=False, dictionary-encoded columns come back as strings,
+    as they are in the CSV.
+    """
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    digest = file_digest(csv_path)
+    df = read_snapshot(snapshot_path, digest)
+    if df is None:
+        df = build_snapshot(csv_path, snapshot_path, digest)
+    if not categorical:
+        for col in df.columns[df.dtypes == "category"]:
+            df[col] = df[col].astype(str)
+    return df
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "Drugs_discription.csv"
+    df = build_snapshot(csv_path)
+    print(f"Saved {snapshot_path_for(csv_path)} ({len(df)} rows)")
@@ -0,0 +1,304 @@
+"""
+Durable background job queue for large uploads.
+
+Jobs and their per-image items live in a local SQLite database (WAL mode), so
+work submitted through ``POST /jobs`` survives a restart. A worker claims a
+job under a lease that a heartbeat thread renews while the process is alive;
+a job whose lease has run out (its process died) is claimed again and resumes
+from the first item without a stored result. Several processes can share one
+database without taking over each other's live jobs. A small thread pool runs
+the service's prediction handler on each item; finished jobs are purged on a
+timer, ``ttl`` seconds after they finish.
+
+Zip archives (e.g. multi-slice volumes) are expanded into one item per image,
+within limits on entry count and uncompressed size.
+"""
+import io
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Zip bomb limits for expand_upload
+MAX_ZIP_ENTRIES = 2000
+MAX_ZIP_BYTES = 512 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    claimed_by TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    payload BLOB,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+def expand_upload(filename, data, max_entries=MAX_ZIP_ENTRIES, max_bytes=MAX_ZIP_BYTES):
+    """
+    Split an upload into (name, bytes) items, unpacking zip archives.
+
+    Raises ValueError for an archive with more than max_entries entries or
+    whose images decompress to more than max_bytes. Sizes come from the
+    archive's headers, which zipfile holds each entry's data to.
+    """
+    if not zipfile.is_zipfile(io.BytesIO(data)):
+        return [(filename or "upload", data)]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        infos = archive.infolist()
+        if len(infos) > max_entries:
+            raise ValueError(f"{filename}: archive has more than {max_entries} entries")
+        images = [
+            info for info in sorted(infos, key=lambda i: i.filename)
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        if sum(info.file_size for info in images) > max_bytes:
+            raise ValueError(f"{filename}: archive images exceed {max_bytes // (1024 * 1024)} MB uncompressed")
+        return [(info.filename, archive.read(info)) for info in images]
+
+
+class JobQueue:
+    def __init__(
+        self, handler, db_path="jobs.sqlite3", workers=2, ttl=24 * 3600, poll_interval=0.5, lease=30, purge_interval=60
+    ):
+        """
+        handler: callable(bytes) -> JSON-serialisable dict, run once per item.
+        Exceptions are stored as that item's {"error": ...} result.
+        lease: seconds a claimed job stays with this process without a heartbeat.
+        """
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.purge_interval = purge_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._claim_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Databases created before leases
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in [("claimed_by", "TEXT"), ("lease_until", "REAL")]:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        targets = [(self._work, f"job-worker-{i}") for i in range(self.workers)]
+        targets += [(self._heartbeat, "job-heartbeat"), (self._purge_periodically, "job-purge")]
+        for target, name in targets:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, items):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, len(items), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, name, payload) VALUES (?, ?, ?, ?)",
+                [(job_id, i, name, sqlite3.Binary(data)) for i, (name, data) in enumerate(items)],
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id, with_results=True):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, total, done, created_at, updated_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            # Expired jobs stay hidden until the next purge removes them
+            if row is None or (row[5] is not None and row[5] < time.time() - self.ttl):
+                return None
+            status, total, done, created_at, updated_at, finished_at = row
+            job = {
+                "job_id": job_id,
+                "status": status,
+                "total": total,
+                "done": done,
+                "progress": round(done / total, 4) if total else 1.0,
+                "created_at": created_at,
+                "updated_at": updated_at,
+            }
+            if finished_at is not None:
+                job["expires_at"] = finished_at + self.ttl
+            if with_results:
+                job["results"] = [
+                    {"name": name, **json.loads(result)}
+                    for name, result in conn.execute(
+                        "SELECT name, result FROM job_items WHERE job_id = ? AND result IS NOT NULL ORDER BY idx",
+                        (job_id,),
+                    )
+                ]
+        return job
+
+    def progress_events(self, job_id):
+        """Yield NDJSON progress lines until the job finishes or disappears."""
+        last = None
+        while True:
+            job = self.get(job_id, with_results=False)
+            if job is None:
+                return
+            state = (job["status"], job["done"])
+            if state != last:
+                last = state
+                yield json.dumps(job) + "\n"
+            if job["status"] == "finished":
+                return
+            time.sleep(self.poll_interval)
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            expired = [
+                row[0] for row in conn.execute(
+                    "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                    (time.time() - self.ttl,),
+                )
+            ]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(expired)
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+            stale = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'running' AND lease_until < ?", (time.time(),)
+            ).fetchone()[0]
+        return {
+            "workers": self.workers,
+            "worker_id": self.worker_id,
+            "ttl_seconds": self.ttl,
+            "lease_seconds": self.lease,
+            "jobs": counts,
+            "expired_leases": stale,
+        }
+
+    def _claim(self):
+        """Take the oldest queued job, or a running one whose lease has expired."""
+        now = time.time()
+        claimable = "(status = 'queued' OR (status = 'running' AND (lease_until IS NULL OR lease_until < ?)))"
+        with self._claim_lock, self._connect() as conn:
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE {claimable} ORDER BY created_at LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', claimed_by = ?, lease_until = ?, updated_at = ? "
+                f"WHERE id = ? AND {claimable}",
+                (self.worker_id, now + self.lease, now, row[0], now),
+            ).rowcount
+            return row[0] if claimed else None
+
+    def renew_leases(self):
+        """Extend the lease on every job this process is running."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE claimed_by = ? AND status = 'running'",
+                (time.time() + self.lease, self.worker_id),
+            ).rowcount
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease / 3)
+            self.renew_leases()
+
+    def _purge_periodically(self):
+        while True:
+            self.purge_expired()
+            time.sleep(self.purge_interval)
+
+    def _work(self):
+        while True:
+            job_id = self._claim()
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval * 10)
+                self._wakeup.clear()
+                continue
+            self._run(job_id)
+
+    def _run(self, job_id):
+        with self._connect() as conn:
+            pending = conn.execute(
+                "SELECT idx FROM job_items WHERE job_id = ? AND result IS NULL ORDER BY idx", (job_id,)
+            ).fetchall()
+
+        for (idx,) in pending:
+            with self._connect() as conn:
+                (payload,) = conn.execute(
+                    "SELECT payload FROM job_items WHERE job_id = ? AND idx = ?", (job_id, idx)
+                ).fetchone()
+            try:
+                result = self.handler(bytes(payload))
+            except Exception as e:
+                result = {"error": str(getattr(e, "detail", e))}
+            with self._connect() as conn:
+                # Drop the payload once its result is stored to keep the database small
+                stored = conn.execute(
+                    "UPDATE job_items SET result = ?, payload = NULL WHERE job_id = ? AND idx = ? AND result IS NULL",
+                    (json.dumps(result), job_id, idx),
+                ).rowcount
+                if stored:
+                    conn.execute(
+                        "UPDATE jobs SET done = done + 1, updated_at = ? WHERE id = ?", (time.time(), job_id)
+                    )
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'finished', updated_at = ?, finished_at = ?, claimed_by = NULL, "
+                "lease_until = NULL WHERE id = ? AND status = 'running'",
+                (now, now, job_id),
+            )
+
+
+def queue_from_env(handler):
+    """Start a queue configured by JOB_DB_PATH / JOB_WORKERS / JOB_RESULT_TTL / JOB_LEASE_SECONDS."""
+    return JobQueue(
+        handler,
+        db_path=os.environ.get("JOB_DB_PATH", "jobs.sqlite3"),
+        workers=int(os.environ.get("JOB_WORKERS", 2)),
+        ttl=int(os.environ.get("JOB_RESULT_TTL", 24 * 3600)),
+        lease=int(os.environ.get("JOB_LEASE_SECONDS", 30)),
+    ).start()
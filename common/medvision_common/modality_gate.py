@@ -0,0 +1,217 @@
+"""
+Cheap modality gate shared by the image services.
+
+Rejects (or flags) uploads that clearly belong to another imaging modality,
+e.g. a skin photo sent to the brain MRI endpoint, before the full model runs.
+Features come from a 32x32 thumbnail (JPEGs are DCT-downscaled by
+``Image.draft``, so the full image is never decoded): chroma, an 8-bin
+luminance histogram, dark-pixel fraction and log aspect ratio. Decoded
+uint8 pixels (a ``/predict/tensor`` body) are checked the same way with
+``check_pixels``; float tensors are already model-preprocessed, so the
+services exempt them.
+
+If a trained profile (``modality_gate.json``) is present, a diagonal-Gaussian
+nearest-centroid classifier over those features picks the modality and
+off-modality uploads are rejected. Without one, a grayscale/colour rule is
+applied and only flags them (``modality_warning``), unless
+``MODALITY_GATE_MODE`` says otherwise. Train a profile from the dataset
+folders with:
+
+    python -m medvision_common.modality_gate brain_mri=path/to/mri kidney_ct=path/to/ct ...
+"""
+import io
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+MODALITIES = ["brain_mri", "kidney_ct", "chest_xray", "skin", "eye"]
+GRAYSCALE_MODALITIES = {"brain_mri", "kidney_ct", "chest_xray"}
+DISPLAY_NAMES = {
+    "brain_mri": "a brain MRI",
+    "kidney_ct": "a kidney CT",
+    "chest_xray": "a chest X-ray",
+    "skin": "a skin photo",
+    "eye": "an eye photo",
+}
+
+THUMB_SIZE = 32
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Fallback rule thresholds (mean per-pixel chroma in [0, 1])
+MAX_GRAYSCALE_CHROMA = 0.08
+MIN_COLOR_CHROMA = 0.02
+MAX_ASPECT_RATIO = 3.0
+
+logger = logging.getLogger(__name__)
+
+
+def extract_features(image_bytes):
+    """Return the gate feature vector for an encoded image, or None if undecodable."""
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        width, height = img.size
+        img.draft("RGB", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+        img = img.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+    except Exception:
+        return None
+    return _thumbnail_features(img, width, height)
+
+
+def pixel_features(pixels):
+    """Return the gate feature vector for decoded uint8 pixels (HxW, HxWx1 or HxWx3)."""
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    if pixels.ndim == 3 and pixels.shape[-1] == 1:
+        pixels = pixels[..., 0]
+    height, width = pixels.shape[:2]
+    img = Image.fromarray(pixels).convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+    return _thumbnail_features(img, width, height)
+
+
+def _thumbnail_features(img, width, height):
+    rgb = np.asarray(img, dtype=np.float32) / 255.0
+    lum = rgb @ LUMA
+    chroma = float((rgb.max(axis=2) - rgb.min(axis=2)).mean())
+    hist = np.bincount(np.minimum((lum * 8).astype(np.int64), 7).ravel(), minlength=8) / lum.size
+    dark = float((lum < 0.06).mean())
+    aspect = math.log(width / height) if width and height else 0.0
+    return np.concatenate([[chroma], hist, [dark, aspect]]).astype(np.float32)
+
+
+class ModalityGate:
+    """Per-service gate; ``check`` returns None for in-modality images, else a reason."""
+
+    def __init__(self, modality, profile_path="modality_gate.json", mode=None):
+        if modality not in MODALITIES:
+            raise ValueError(f"Unknown modality: {modality}")
+        self.modality = modality
+        self.profile = None
+        profile_path = os.environ.get("MODALITY_GATE_PROFILE", profile_path)
+        if os.path.exists(profile_path):
+            with open(profile_path) as f:
+                data = json.load(f)
+            if modality in data["modalities"]:
+                self.profile = load_profile(data)
+            else:
+                logger.warning("%s has no %s profile, using the grayscale/colour rule", profile_path, modality)
+        # The untrained rule is too coarse to reject uploads on its own
+        default_mode = "reject" if self.profile is not None else "warn"
+        self.mode = (mode or os.environ.get("MODALITY_GATE_MODE", default_mode)).lower()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+        self.flagged = 0
+        self._seconds = 0.0
+
+    @property
+    def rejects(self):
+        return self.mode == "reject"
+
+    def classify(self, features):
+        """Most likely modality for a feature vector."""
+        if self.profile is not None:
+            names, means, inv_vars, log_norms = self.profile
+            scores = log_norms - 0.5 * (((features - means) ** 2) * inv_vars).sum(axis=1)
+            return names[int(np.argmax(scores))]
+
+        chroma = features[0]
+        if self.modality in GRAYSCALE_MODALITIES:
+            return self.modality if chroma <= MAX_GRAYSCALE_CHROMA else None
+        return self.modality if chroma >= MIN_COLOR_CHROMA else None
+
+    def check(self, image_bytes):
+        return self._check(extract_features, image_bytes)
+
+    def check_pixels(self, pixels):
+        """``check`` for decoded uint8 pixels, e.g. a /predict/tensor body."""
+        return self._check(pixel_features, pixels)
+
+    def _check(self, features_of, image):
+        if self.mode == "off":
+            return None
+        start = time.perf_counter()
+        features = features_of(image)
+        reason = None
+        if features is not None:
+            predicted = self.classify(features)
+            if abs(features[-1]) > math.log(MAX_ASPECT_RATIO):
+                reason = "Unusual aspect ratio for a medical image"
+            elif predicted != self.modality:
+                expected = DISPLAY_NAMES[self.modality]
+                if predicted is None:
+                    reason = f"Image does not look like {expected}"
+                else:
+                    reason = f"Image looks like {DISPLAY_NAMES[predicted]}, not {expected}"
+        with self._lock:
+            self.checked += 1
+            self._seconds += time.perf_counter() - start
+            if reason is not None:
+                if self.rejects:
+                    self.rejected += 1
+                else:
+                    self.flagged += 1
+        return reason
+
+    def stats(self):
+        with self._lock:
+            return {
+                "modality": self.modality,
+                "mode": self.mode,
+                "trained_profile": self.profile is not None,
+                "checked": self.checked,
+                "rejected": self.rejected,
+                "flagged": self.flagged,
+                "avg_ms": round(1000 * self._seconds / self.checked, 4) if self.checked else 0.0,
+            }
+
+
+def load_profile(data):
+    names = list(data["modalities"])
+    means = np.array([data["means"][n] for n in names], dtype=np.float32)
+    variances = np.array([data["variances"][n] for n in names], dtype=np.float32)
+    return names, means, 1.0 / variances, -0.5 * np.log(variances).sum(axis=1)
+
+
+def _image_paths(folder):
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                yield os.path.join(root, name)
+
+
+def train_profile(folders, max_per_class=2000):
+    """Fit per-modality feature means/variances from {modality: folder} image trees."""
+    means, variances = {}, {}
+    for modality, folder in folders.items():
+        rows = []
+        for path in _image_paths(folder):
+            with open(path, "rb") as f:
+                features = extract_features(f.read())
+            if features is not None:
+                rows.append(features)
+            if len(rows) >= max_per_class:
+                break
+        if not rows:
+            raise ValueError(f"No images found for {modality} in {folder}")
+        rows = np.stack(rows)
+        means[modality] = rows.mean(axis=0).tolist()
+        variances[modality] = (rows.var(axis=0) + 1e-4).tolist()
+        logger.info("%s: %d images", modality, len(rows))
+    return {"modalities": list(folders), "means": means, "variances": variances}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    folders = dict(arg.split("=", 1) for arg in sys.argv[1:])
+    unknown = set(folders) - set(MODALITIES)
+    if len(folders) < 2 or unknown:
+        sys.exit(f"usage: python -m medvision_common.modality_gate {'=DIR '.join(MODALITIES)}=DIR (at least two)")
+    with open("modality_gate.json", "w") as f:
+        json.dump(train_profile(folders), f)
+    print("Saved modality_gate.json")
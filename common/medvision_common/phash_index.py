@@ -0,0 +1,231 @@
+"""
+Perceptual-hash index of previous prediction results.
+
+Each upload is reduced to a 64-bit difference hash (dHash) computed from a
+tiny grayscale thumbnail, and previous predictions are looked up by Hamming
+distance using multi-index hashing: the hash is split into
+``max_distance + 1`` chunks, and by the pigeonhole principle any hash within
+``max_distance`` bits shares at least one chunk exactly with the query.
+
+Only an exact hash match is served from the cache. Images of different
+classes can be a few bits apart (kidney CT slices of different classes come
+as close as 2 bits), so a near match never stands in for the model: it is
+run anyway, and the response reports the distance and whether the model
+agreed with the cached prediction. The radius a modality may use is capped
+by ``VALIDATED_MAX_DISTANCE``, measured on that modality's labelled images
+with:
+
+    python -m medvision_common.phash_index path/to/dataset
+
+The cache is off unless ``PHASH_CACHE=1``. It is an LRU with a fixed number
+of entries, so memory stays bounded.
+"""
+import io
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Widest Hamming radius checked against each modality's labelled images: below the closest pair of
+# images from different classes. Modalities not listed (no dataset checked yet) match exact hashes only.
+VALIDATED_MAX_DISTANCE = {
+    # Kindey_Stone_Dataset_clean: no Normal/Stone pair within 1 bit, 81 pairs at 2
+    "kidney_ct": 1,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def image_hash(image_bytes):
+    """
+    Compute the dHash of an encoded image, or None if it cannot be decoded.
+
+    JPEG uploads are decoded at reduced resolution through ``Image.draft`` so
+    the full-size pixel buffer is never materialised.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+        img = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    except Exception:
+        return None
+
+    pixels = img.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _chunk_layout(num_chunks):
+    """Split HASH_BITS into num_chunks (shift, mask) pairs of near-equal width."""
+    layout = []
+    shift = 0
+    for i in range(num_chunks):
+        width = HASH_BITS // num_chunks + (1 if i < HASH_BITS % num_chunks else 0)
+        layout.append((shift, (1 << width) - 1))
+        shift += width
+    return layout
+
+
+class PHashIndex:
+    """Bounded LRU of hash -> cached result with Hamming-radius lookup."""
+
+    def __init__(self, max_entries=1024, max_distance=0):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be in [0, {HASH_BITS})")
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._layout = _chunk_layout(max_distance + 1)
+        self._buckets = [dict() for _ in self._layout]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _chunks(self, value):
+        return [(value >> shift) & mask for shift, mask in self._layout]
+
+    def lookup(self, value):
+        """Return (result, distance) of the nearest cached hash, or None."""
+        if value is None:
+            return None
+        with self._lock:
+            best = None
+            for bucket, chunk in zip(self._buckets, self._chunks(value)):
+                for candidate in bucket.get(chunk, ()):
+                    distance = bin(candidate ^ value).count("1")
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (candidate, distance)
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best[0])
+            self.hits += 1
+            return dict(self._entries[best[0]]), best[1]
+
+    def predict(self, value, run):
+        """
+        Prediction for an image with hash value: the cached result on an exact
+        match, else ``run()`` (whose result is cached). A near match is only
+        compared with the model's answer, never returned in its place.
+        """
+        match = self.lookup(value)
+        if match is not None and match[1] == 0:
+            return {**match[0], "near_duplicate": True, "hamming_distance": 0}
+        result = run()
+        self.add(value, result)
+        if match is None:
+            return result
+        cached, distance = match
+        return {
+            **result,
+            "near_duplicate": True,
+            "hamming_distance": distance,
+            "near_duplicate_agrees": cached.get("prediction") == result.get("prediction"),
+        }
+
+    def add(self, value, result):
+        """Cache a prediction result under its hash, evicting the LRU entry if full."""
+        if value is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            if value in self._entries:
+                self._entries.move_to_end(value)
+                self._entries[value] = dict(result)
+                return
+            self._entries[value] = dict(result)
+            for bucket, chunk in zip(self._buckets, self._chunks(value)):
+                bucket.setdefault(chunk, set()).add(value)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, value):
+        del self._entries[value]
+        for bucket, chunk in zip(self._buckets, self._chunks(value)):
+            members = bucket[chunk]
+            members.discard(value)
+            if not members:
+                del bucket[chunk]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.max_entries > 0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def index_from_env(modality):
+    """
+    The prediction cache of a modality's service: off unless PHASH_CACHE=1,
+    sized by PHASH_CACHE_SIZE, matching within PHASH_MAX_DISTANCE bits
+    (default 0, exact hashes only) up to the modality's validated radius.
+    """
+    if os.environ.get("PHASH_CACHE", "0") != "1":
+        return PHashIndex(max_entries=0, max_distance=0)
+    max_distance = int(os.environ.get("PHASH_MAX_DISTANCE", 0))
+    validated = VALIDATED_MAX_DISTANCE.get(modality, 0)
+    if max_distance > validated:
+        logger.warning(
+            "PHASH_MAX_DISTANCE=%d exceeds the radius validated for %s; using %d", max_distance, modality, validated
+        )
+        max_distance = validated
+    return PHashIndex(max_entries=int(os.environ.get("PHASH_CACHE_SIZE", 1024)), max_distance=max_distance)
+
+
+def cross_class_distances(folder, max_distance=8):
+    """
+    Count image pairs from different classes by Hamming distance (0 to
+    max_distance). An image's class is its parent directory's name, so
+    split/class trees (train/Normal, test/Normal) pool each class.
+    """
+    classes = {}
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                with open(os.path.join(root, name), "rb") as f:
+                    value = image_hash(f.read())
+                if value is not None:
+                    classes.setdefault(os.path.basename(root), []).append(value)
+    counts = [0] * (max_distance + 1)
+    labels = sorted(classes)
+    for i, label in enumerate(labels):
+        for other in labels[i + 1:]:
+            for value in classes[label]:
+                for candidate in classes[other]:
+                    distance = (value ^ candidate).bit_count()
+                    if distance <= max_distance:
+                        counts[distance] += 1
+    return {label: len(values) for label, values in classes.items()}, counts
+
+
+def safe_distance(counts):
+    """Widest radius below the closest cross-class pair (counts as from cross_class_distances)."""
+    closest = next((distance for distance, n in enumerate(counts) if n), len(counts))
+    return max(closest - 1, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m medvision_common.phash_index path/to/dataset")
+    sizes, counts = cross_class_distances(sys.argv[1])
+    print(f"images per class: {sizes}")
+    for distance, n in enumerate(counts):
+        print(f"cross-class pairs at distance {distance}: {n}")
+    print(f"widest safe radius: {safe_distance(counts)}")
@@ -0,0 +1,124 @@
+"""
+Hot reload of a service's data tables and indexes.
+
+``build`` loads the source files and returns an object holding everything
+requests need (tables, indexes, caches). The built object is published by a
+single reference assignment, so a request that read ``reloader.current`` at
+its start keeps using that version until it returns, while new requests see
+the new one. Builds run in a background thread and never overlap; a failed
+build keeps the current version and records the error. ``close``, if given,
+is called with the replaced version after a swap to release what it holds
+(connection pools...); requests still using that version must keep working
+until they finish.
+
+Reloads are triggered by ``POST /admin/reload`` (refused unless
+``RELOAD_TOKEN`` is set and sent as ``X-Admin-Token``) or, when
+``DATA_WATCH_INTERVAL`` is above zero, by a watcher that polls the source
+files' size and modification time.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class Reloader:
+    def __init__(self, build, paths, watch_interval=0, close=None):
+        self.build = build
+        self.close = close
+        self.paths = list(paths)
+        self.watch_interval = watch_interval
+        self.current = None
+        self.version = 0
+        self.loaded_at = None
+        self.load_seconds = None
+        self.last_error = None
+        self.reloading = False
+        self._signature = None
+        self._build_lock = threading.Lock()
+        self._flag_lock = threading.Lock()
+
+    def start(self):
+        """Load synchronously (startup fails loudly on bad data), then start the watcher."""
+        self._load()
+        if self.watch_interval > 0:
+            threading.Thread(target=self._watch, name="data-watcher", daemon=True).start()
+        return self
+
+    def _load(self):
+        with self._build_lock:
+            # Recorded up front so the watcher doesn't retry a failing build until the files change again
+            self._signature = _signature(self.paths)
+            start = time.perf_counter()
+            built = self.build()
+            # Only the swap is visible to requests; everything above ran off to the side
+            previous, self.current = self.current, built
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.loaded_at = time.time()
+            self.version += 1
+            self.last_error = None
+        if previous is not None and self.close is not None:
+            try:
+                self.close(previous)
+            except Exception:
+                logger.exception("Closing data version %d failed", self.version - 1)
+
+    def _reload(self):
+        try:
+            self._load()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            self.reloading = False
+
+    def reload(self):
+        """Start a background rebuild; False if one is already running."""
+        with self._flag_lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+        threading.Thread(target=self._reload, name="data-reload", daemon=True).start()
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            signature = _signature(self.paths)
+            # A source that vanished since the last load is usually mid-replacement; wait for it
+            if any(now[1] is None and before[1] is not None for now, before in zip(signature, self._signature)):
+                continue
+            if not self.reloading and signature != self._signature:
+                self.reload()
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "reloading": self.reloading,
+            "last_error": self.last_error,
+            "watch_interval": self.watch_interval,
+            "sources": self.paths,
+        }
+
+
+def authorized(token):
+    """Admin token check; always fails when RELOAD_TOKEN is unset."""
+    expected = os.environ.get("RELOAD_TOKEN")
+    if not expected or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
@@ -0,0 +1,49 @@
+"""
+Helpers for the multipart-free ingestion routes.
+
+``/predict/raw`` takes the encoded image as the request body.
+``/predict/tensor`` takes an already-decoded little-endian tensor described by
+the ``X-Tensor-Shape`` (e.g. ``224,224,3``) and ``X-Tensor-Dtype``
+(``float32`` or ``uint8``) headers; the body is viewed in place with
+``np.frombuffer`` rather than copied.
+"""
+import numpy as np
+
+RAW_IMAGE_TYPES = ["image/jpeg", "image/png", "image/jpg"]
+TENSOR_DTYPES = {"float32": np.dtype("<f4"), "uint8": np.dtype("u1")}
+
+
+def raw_content_type(content_type):
+    """Media type of a Content-Type header, without parameters."""
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def parse_tensor(body, shape_header, dtype_header, expected_shape):
+    """
+    View a raw tensor body as a (1, *expected_shape) array without copying.
+
+    A leading batch dimension of 1 in the shape header is accepted. Raises
+    ValueError with a client-facing message on any mismatch.
+    """
+    dtype = TENSOR_DTYPES.get((dtype_header or "float32").strip().lower())
+    if dtype is None:
+        raise ValueError(f"X-Tensor-Dtype must be one of {list(TENSOR_DTYPES)}")
+
+    try:
+        shape = tuple(int(dim) for dim in (shape_header or "").replace("x", ",").split(","))
+    except ValueError:
+        raise ValueError("X-Tensor-Shape must be comma-separated integers, e.g. 224,224,3")
+    expected_shape = tuple(expected_shape)
+    if len(shape) == len(expected_shape) + 1 and shape[0] == 1:
+        shape = shape[1:]
+    if shape != expected_shape:
+        raise ValueError(f"Expected tensor shape {expected_shape}, got {shape}")
+
+    expected_bytes = int(np.prod(shape)) * dtype.itemsize
+    if len(body) != expected_bytes:
+        raise ValueError(f"Body is {len(body)} bytes, expected {expected_bytes} for {shape} {dtype.name}")
+
+    tensor = np.frombuffer(body, dtype=dtype).reshape((1, *shape))
+    if dtype.kind == "f" and not np.isfinite(tensor).all():
+        raise ValueError("Tensor contains NaN or infinite values")
+    return tensor
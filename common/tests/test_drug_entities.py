@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from medvision_common.drug_entities import load_entities
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = {name: tmp_path / f"{name}.csv" for name in ["descriptions", "formulary", "interactions"]}
+    pd.DataFrame({
+        "TradeName": ["Coumadin 5mg Tablet", "PANADOL 500MG TAB", "LIPITOR 10MG", "CONCOR PLUS 5MG", "SODIUM CHLORIDE 0.9%"],
+        "ScientificName": [
+            "Warfarin", "PARACETAMOL", "ATORVASTATIN CALCIUM", "BISOPROLOL FUMARATE, HYDROCHLOROTHIAZIDE",
+            "SODIUM CHLORIDE",
+        ],
+    }).to_csv(paths["descriptions"], index=False)
+    pd.DataFrame({
+        "scientific_name": ["Warfarin", "Aspirin", "Acetaminophen", "Atorvastatin", "Bisoprolol"],
+        "trade_name_saudi": ["Coumadin", "Aspirin", "Panadol", "Lipitor", "Concor"],
+    }).to_csv(paths["formulary"], index=False)
+    pd.DataFrame({
+        "drug1_name": ["Warfarin"], "drug2_name": ["Aspirin"], "interaction_type": ["Bleeding"],
+    }).to_csv(paths["interactions"], index=False)
+    return {name: str(path) for name, path in paths.items()}
+
+
+def test_each_artifact_path_is_built_and_reused(sources, tmp_path):
+    first, second = tmp_path / "a" / "entities.json.gz", tmp_path / "b" / "entities.json.gz"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    entities = load_entities(sources, str(first))
+    load_entities(sources, str(second))
+    mtime = first.stat().st_mtime_ns
+    assert load_entities(sources, str(first)).record(entities.resolve("coumadin")) == entities.record(
+        entities.resolve("coumadin")
+    )
+    assert first.stat().st_mtime_ns == mtime
+
+
+def test_unwritable_artifact_still_serves(sources, tmp_path):
+    entities = load_entities(sources, str(tmp_path / "missing-dir" / "entities.json.gz"))
+    assert entities.scientific[entities.resolve("coumadin")] == "Warfarin"
+    assert not (tmp_path / "missing-dir").exists()
+
+
+def test_salts_and_synonyms_merge_and_brands_link_rows(sources, tmp_path):
+    entities = load_entities(sources, str(tmp_path / "entities.json.gz"))
+    acetaminophen = entities.resolve("panadol")
+    assert entities.resolve("paracetamol") == acetaminophen == entities.resolve("Acetaminophen")
+    assert entities.record(acetaminophen)["synonyms"] == ["PARACETAMOL"]
+    assert entities.description_rows[acetaminophen] == [1]
+    atorvastatin = entities.resolve("lipitor")
+    assert entities.resolve("atorvastatin calcium") == entities.resolve("Atorvastatin hydrochloride") == atorvastatin
+    assert entities.description_rows[atorvastatin] == [2]
+    # A combination product stays its own entity, and is linked to its brand's too
+    combination = entities.resolve("BISOPROLOL FUMARATE, HYDROCHLOROTHIAZIDE")
+    assert combination != entities.resolve("concor")
+    assert entities.description_rows[combination] == entities.description_rows[entities.resolve("concor")] == [3]
+    assert entities.scientific[entities.resolve("sodium chloride")] == "SODIUM CHLORIDE"
@@ -0,0 +1,20 @@
+import pandas as pd
+
+from medvision_common.drug_snapshot import load_table
+
+
+def test_snapshot_round_trip_and_plain_columns(tmp_path):
+    csv_path = tmp_path / "drugs.csv"
+    rows = [{"TradeName": f"Drug {i}", "Therapeutic Class": ["PAIN", "CARDIAC"][i % 2], " Habit Forming": "No"} for i in range(6)]
+    pd.DataFrame(rows + rows[:1]).to_csv(csv_path, index=False)
+
+    built = load_table(str(csv_path))
+    assert (tmp_path / "drugs.feather").exists()
+    read = load_table(str(csv_path))
+    assert read["Therapeutic Class"].dtype == "category"
+    assert read.astype(str).equals(built.astype(str))
+    assert len(read) == 6 and "Habit Forming" in read.columns
+
+    plain = load_table(str(csv_path), categorical=False)
+    assert not (plain.dtypes == "category").any()
+    assert plain["Therapeutic Class"].tolist() == ["PAIN", "CARDIAC"] * 3
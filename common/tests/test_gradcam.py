@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def tf():
+    # Imported when the tests run, not at collection: TensorFlow bundles an SQLite
+    # build without FTS5 that would otherwise load before the sqlite3 module's
+    return pytest.importorskip("tensorflow")
+
+
+@pytest.fixture(scope="module")
+def gradcam(tf):
+    from medvision_common import gradcam
+
+    return gradcam
+
+
+def nested_sequential(tf):
+    base = tf.keras.Sequential([tf.keras.Input((16, 16, 3)), tf.keras.layers.Conv2D(4, 3)], name="base")
+    return tf.keras.Sequential([
+        tf.keras.Input((16, 16, 3)),
+        base,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(3, activation="softmax"),
+    ])
+
+
+def test_sequential_with_nested_base_model(tf, gradcam):
+    model = nested_sequential(tf)
+    batch = np.random.default_rng(0).random((2, 16, 16, 3)).astype(np.float32)
+    predictions, cams = gradcam.LazyGradCAM(model).explain(batch)
+    assert np.allclose(predictions, model.predict(batch, verbose=0), atol=1e-5)
+    assert cams.shape == (2, 14, 14)
+    assert cams.min() >= 0 and cams.max() <= 1
+
+
+def test_wrapping_failure_is_deferred_to_explain(tf, gradcam):
+    grad_cam = gradcam.LazyGradCAM(tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2)]))
+    with pytest.raises(ValueError):
+        grad_cam.explain(np.zeros((1, 4), dtype=np.float32))
+
+
+def test_array_heatmap_rounds_to_three_decimals(gradcam):
+    cam = np.array([[0.689, 1 / 3]], dtype=np.float32)
+    assert gradcam.render_heatmap(cam, b"", "array") == [[0.689, 0.333]]
@@ -0,0 +1,73 @@
+import io
+import time
+import zipfile
+
+import pytest
+
+from medvision_common.job_queue import JobQueue, expand_upload
+
+
+def zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] == "finished":
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_expand_upload_limits():
+    data = zip_bytes({"b.png": b"2", "a.jpg": b"1", "notes.txt": b"x"})
+    assert expand_upload("scan.zip", data) == [("a.jpg", b"1"), ("b.png", b"2")]
+    assert expand_upload("a.png", b"raw") == [("a.png", b"raw")]
+    with pytest.raises(ValueError, match="entries"):
+        expand_upload("scan.zip", data, max_entries=2)
+    # Highly compressible: small upload, large once inflated
+    bomb = zip_bytes({"slice.png": b"\0" * 100_000})
+    assert len(bomb) < 1000
+    with pytest.raises(ValueError, match="uncompressed"):
+        expand_upload("bomb.zip", bomb, max_bytes=50_000)
+
+
+def test_live_lease_is_not_taken_over(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    first = JobQueue(lambda data: {"size": len(data)}, db_path=db_path, lease=30)
+    job_id = first.submit([("a.png", b"12")])
+    assert first._claim() == job_id
+
+    # Another process starting up (or polling) leaves the running job alone
+    second = JobQueue(lambda data: {"size": len(data)}, db_path=db_path, lease=30)
+    assert second._claim() is None
+    assert second.get(job_id)["status"] == "running"
+    assert first.renew_leases() == 1
+
+    # Once the lease runs out without a heartbeat, the job is claimed again and finished
+    with first._connect() as conn:
+        conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+    assert second.stats()["expired_leases"] == 1
+    assert second._claim() == job_id
+    assert first.renew_leases() == 0
+    second._run(job_id)
+    job = second.get(job_id)
+    assert job["status"] == "finished" and job["results"] == [{"name": "a.png", "size": 2}]
+
+
+def test_workers_finish_jobs_and_expired_jobs_are_hidden(tmp_path):
+    queue = JobQueue(lambda data: {"size": len(data)}, db_path=str(tmp_path / "jobs.sqlite3"), ttl=3600).start()
+    job_id = queue.submit([("a.png", b"1"), ("b.png", b"22")])
+    job = wait_for(queue, job_id)
+    assert job["done"] == 2 and [item["size"] for item in job["results"]] == [1, 2]
+
+    queue.ttl = 0
+    time.sleep(0.01)
+    assert queue.get(job_id) is None
+    assert queue.purge_expired() == 1
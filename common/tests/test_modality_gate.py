@@ -0,0 +1,62 @@
+import io
+import json
+
+import numpy as np
+from PIL import Image
+
+from medvision_common import modality_gate
+from medvision_common.modality_gate import ModalityGate, train_profile
+
+
+def write_png(path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(buffer, format="PNG")
+    path.write_bytes(buffer.getvalue())
+
+
+def test_untrained_gate_only_warns(monkeypatch, tmp_path):
+    monkeypatch.delenv("MODALITY_GATE_MODE", raising=False)
+    gate = ModalityGate("kidney_ct", profile_path=str(tmp_path / "missing.json"))
+    assert gate.mode == "warn" and not gate.rejects
+    monkeypatch.setenv("MODALITY_GATE_MODE", "reject")
+    assert ModalityGate("kidney_ct", profile_path=str(tmp_path / "missing.json")).rejects
+
+
+def test_trained_profile_rejects_and_caps_each_class(monkeypatch, tmp_path):
+    monkeypatch.delenv("MODALITY_GATE_MODE", raising=False)
+    for split in ["train", "test"]:
+        for i in range(3):
+            write_png(tmp_path / "ct" / split / f"{i}.png", (20 + 10 * i,) * 3)
+            write_png(tmp_path / "skin" / split / f"{i}.png", (200, 120 + 10 * i, 90))
+    folders = {"kidney_ct": str(tmp_path / "ct"), "skin": str(tmp_path / "skin")}
+    extracted = []
+    extract_features = modality_gate.extract_features
+    monkeypatch.setattr(modality_gate, "extract_features", lambda data: extracted.append(1) or extract_features(data))
+    profile = train_profile(folders, max_per_class=4)
+    # Capped across each class's whole tree, not per directory
+    assert len(extracted) == 8
+    profile_path = tmp_path / "modality_gate.json"
+    profile_path.write_text(json.dumps(profile))
+
+    gate = ModalityGate("kidney_ct", profile_path=str(profile_path))
+    assert gate.rejects
+    skin = io.BytesIO()
+    Image.new("RGB", (40, 40), (200, 130, 90)).save(skin, format="PNG")
+    assert gate.check(skin.getvalue()) == "Image looks like a skin photo, not a kidney CT"
+
+
+def test_pixels_checked_like_encoded_images(monkeypatch, tmp_path):
+    monkeypatch.setenv("MODALITY_GATE_MODE", "reject")
+    gate = ModalityGate("brain_mri", profile_path=str(tmp_path / "missing.json"))
+    gray = np.full((224, 224, 3), 90, dtype=np.uint8)
+    skin = np.empty((224, 224, 3), dtype=np.uint8)
+    skin[...] = (200, 130, 90)
+    assert gate.check_pixels(gray) is None
+    # Single-channel tensors, as /predict/tensor parses them for the kidney service
+    assert gate.check_pixels(gray[..., :1]) is None
+    assert gate.check_pixels(skin) == "Image does not look like a brain MRI"
+    encoded = io.BytesIO()
+    Image.fromarray(skin).save(encoded, format="PNG")
+    assert modality_gate.pixel_features(skin).tolist() == modality_gate.extract_features(encoded.getvalue()).tolist()
+    assert gate.stats()["rejected"] == 1
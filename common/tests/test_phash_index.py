@@ -0,0 +1,56 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from medvision_common import phash_index
+from medvision_common.phash_index import PHashIndex, cross_class_distances, index_from_env, safe_distance
+
+
+def png(pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(np.asarray(pixels, dtype=np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_exact_match_served_from_cache():
+    index = PHashIndex(max_entries=4)
+    calls = []
+    run = lambda: calls.append(1) or {"prediction": "Normal"}
+    assert index.predict(7, run) == {"prediction": "Normal"}
+    assert index.predict(7, run) == {"prediction": "Normal", "near_duplicate": True, "hamming_distance": 0}
+    assert len(calls) == 1
+
+
+def test_near_match_still_runs_model():
+    index = PHashIndex(max_entries=4, max_distance=1)
+    index.predict(0b100, lambda: {"prediction": "Normal"})
+    result = index.predict(0b101, lambda: {"prediction": "Stone"})
+    assert result == {"prediction": "Stone", "near_duplicate": True, "hamming_distance": 1, "near_duplicate_agrees": False}
+    assert index.predict(0b111, lambda: {"prediction": "Stone"})["near_duplicate_agrees"]
+
+
+def test_index_from_env_is_opt_in_and_capped(monkeypatch):
+    monkeypatch.delenv("PHASH_CACHE", raising=False)
+    monkeypatch.setenv("PHASH_MAX_DISTANCE", "4")
+    assert not index_from_env("kidney_ct").stats()["enabled"]
+
+    monkeypatch.setenv("PHASH_CACHE", "1")
+    assert index_from_env("kidney_ct").max_distance == phash_index.VALIDATED_MAX_DISTANCE["kidney_ct"]
+    assert index_from_env("skin").max_distance == 0
+    monkeypatch.delenv("PHASH_MAX_DISTANCE")
+    assert index_from_env("kidney_ct").max_distance == 0
+
+
+def test_cross_class_distances(tmp_path):
+    gradient = np.tile(np.arange(0, 250, 25), (10, 1))
+    images = {"a/Normal/1.png": gradient, "b/Normal/2.png": gradient[:, ::-1], "a/Stone/3.png": gradient}
+    for name, pixels in images.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(png(pixels))
+    sizes, counts = cross_class_distances(str(tmp_path))
+    assert sizes == {"Normal": 2, "Stone": 1}
+    # The identical Normal/Stone pair sits at distance 0: no radius is safe
+    assert counts[0] == 1
+    assert safe_distance(counts) == 0
+    assert safe_distance([0, 0, 5]) == 1
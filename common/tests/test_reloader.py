@@ -0,0 +1,25 @@
+from medvision_common.reloader import Reloader, authorized
+
+
+def test_reload_refused_without_configured_token(monkeypatch):
+    monkeypatch.delenv("RELOAD_TOKEN", raising=False)
+    assert not authorized(None)
+    assert not authorized("")
+    monkeypatch.setenv("RELOAD_TOKEN", "")
+    assert not authorized("")
+
+
+def test_reload_token_must_match(monkeypatch):
+    monkeypatch.setenv("RELOAD_TOKEN", "s3cret")
+    assert authorized("s3cret")
+    assert not authorized("s3cre")
+    assert not authorized(None)
+
+
+def test_replaced_version_is_closed_after_swap():
+    closed = []
+    versions = iter(["v1", "v2", "v3"])
+    reloader = Reloader(lambda: next(versions), [], close=closed.append).start()
+    assert reloader.current == "v1" and closed == []
+    reloader._load()
+    assert reloader.current == "v2" and closed == ["v1"]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from medvision_common.tensor_ingest import parse_tensor, raw_content_type
+
+
+@pytest.mark.parametrize("shape_header", ["1x224x224x3", "224,224,3", "1,224,224,3"])
+def test_shape_header_forms(shape_header):
+    pixels = np.arange(224 * 224 * 3, dtype=np.uint8)
+    tensor = parse_tensor(pixels.tobytes(), shape_header, "uint8", (224, 224, 3))
+    assert tensor.shape == (1, 224, 224, 3)
+    assert np.array_equal(tensor.ravel(), pixels)
+
+
+@pytest.mark.parametrize("dtype_header", ["float32", "FLOAT32", " Float32 ", None])
+def test_dtype_header_is_case_insensitive(dtype_header):
+    values = np.linspace(0, 1, 128 * 128, dtype="<f4")
+    tensor = parse_tensor(values.tobytes(), "128,128", dtype_header, (128, 128))
+    assert tensor.dtype == np.float32
+    assert np.array_equal(tensor[0], values.reshape(128, 128))
+
+
+def test_body_viewed_without_copy():
+    body = bytearray(np.zeros(4 * 4, dtype=np.uint8).tobytes())
+    tensor = parse_tensor(body, "4,4", "uint8", (4, 4))
+    body[0] = 7
+    assert tensor[0, 0, 0] == 7
+
+
+@pytest.mark.parametrize("body, shape_header, dtype_header, message", [
+    (b"\0" * (224 * 224 * 3 - 1), "224,224,3", "uint8", "Body is 150527 bytes, expected 150528"),
+    (b"\0" * (224 * 224 * 3 * 4), "224,224,3", "uint8", "expected 150528"),
+    (b"\0" * (224 * 224 * 3), "224,224,3", "float64", "X-Tensor-Dtype must be one of"),
+    (b"\0" * (224 * 224 * 3), "224,224,3", "int16", "X-Tensor-Dtype must be one of"),
+    (b"\0" * (224 * 224 * 3), "3,224,224", "uint8", "Expected tensor shape (224, 224, 3), got (3, 224, 224)"),
+    (b"\0" * (224 * 224 * 3), "2,224,224,3", "uint8", "got (2, 224, 224, 3)"),
+    (b"\0" * (224 * 224 * 3), "224,224", "uint8", "got (224, 224)"),
+    (b"\0" * (224 * 224 * 3), "224 by 224", "uint8", "comma-separated integers"),
+])
+def test_rejected_tensors(body, shape_header, dtype_header, message):
+    with pytest.raises(ValueError, match=message.replace("(", r"\(").replace(")", r"\)")):
+        parse_tensor(body, shape_header, dtype_header, (224, 224, 3))
+
+
+def test_non_finite_floats_rejected():
+    values = np.zeros(4, dtype="<f4")
+    values[2] = np.nan
+    with pytest.raises(ValueError, match="NaN or infinite"):
+        parse_tensor(values.tobytes(), "2,2", "float32", (2, 2))
+
+
+def test_raw_content_type_drops_parameters():
+    assert raw_content_type("Image/PNG; charset=binary") == "image/png"
+    assert raw_content_type(None) == ""
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The shared package, importable without installing it
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+# Keep the test runs' entity artifact out of the repository
+os.environ.setdefault("DRUG_ENTITIES_PATH", os.path.join(tempfile.mkdtemp(prefix="medvision-tests-"), "drug_entities.json.gz"))
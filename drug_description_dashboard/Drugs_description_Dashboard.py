@@ -1,9 +1,10 @@
 # Medicine App: Bilingual + Full EDA + Smart Search UI
 
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
+from medvision_common.drug_snapshot import load_table
+
 # PAGE CONFIG
 st.set_page_config(
     page_title="Drugs Data Dashboard",
@@ -14,14 +15,8 @@ st.set_page_config(
 # LOAD DATA
 @st.cache_data
 def load_data():
-    df = pd.read_csv(
-        "Drugs_discription.csv",
-        dtype=str,
-        low_memory=False
-    )
-    df.columns = df.columns.str.strip()
-    df = df.dropna(how="all").drop_duplicates().fillna("Unknown")
-    return df
+    # Cleaned, deduplicated table from the Feather snapshot (rebuilt when the CSV changes)
+    return load_table("Drugs_discription.csv", categorical=False)
 
 data = load_data()
 
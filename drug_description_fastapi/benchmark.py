@@ -0,0 +1,469 @@
+"""
+Benchmarks for the drug description search indexes.
+
+Run from this directory:
+
+    python benchmark.py
+
+The dataset is enlarged synthetically (each copy is a set of new, distinct drug
+names) while the query set stays fixed, to show how per-query latency scales
+with the number of rows.
+"""
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from medvision_common.arabic_names import PhoneticIndex, phonetic_key, transliterate
+from medvision_common.drug_snapshot import build_snapshot
+
+from drug_graph import SubstituteGraph
+from drug_records import ResultCache, format_list, split_list
+from drug_store import PandasStore, SQLiteFacetIndex, SQLiteStore, SQLiteSubstituteGraph, build_database
+from drug_description_api import load_data
+from drug_index import (
+    FACET_COLUMNS,
+    TEXT_COLUMNS,
+    FacetIndex,
+    FuzzyNameIndex,
+    NameIndex,
+    SuggestIndex,
+    allowed_distance,
+    edit_distance,
+    name_suggestions,
+    normalize_name,
+    tokenize,
+)
+
+SCALES = [1, 4, 16]
+
+
+def regex_search(df, query):
+    """The original per-request scan, kept as the reference implementation."""
+    q = query.lower().strip()
+    search_columns = [col for col in ["TradeName", "ScientificName"] if col in df.columns]
+    mask = pd.Series(False, index=df.index)
+    pattern = rf"\b{re.escape(q)}\b"
+    for col in search_columns:
+        mask |= df[col].astype(str).str.lower().str.contains(pattern, na=False, regex=True)
+    return df[mask]
+
+
+def enlarge(df, factor):
+    """Append factor-1 copies whose name tokens are all suffixed, i.e. new distinct drugs."""
+    copies = [df]
+    for i in range(1, factor):
+        copy = df.copy()
+        for col in ["TradeName", "ScientificName"]:
+            copy[col] = copy[col].str.replace(r"(\w+)", rf"\1q{i}", regex=True)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def sample_queries(df, n=200, seed=0):
+    rng = random.Random(seed)
+    names = df["TradeName"].tolist() + df["ScientificName"].tolist()
+    queries = []
+    for _ in range(n):
+        words = rng.choice(names).split()
+        start = rng.randrange(len(words))
+        queries.append(" ".join(words[start:start + rng.choice([1, 1, 2])]))
+    return queries + ["paracetamol", "PANADOL", "  amoxicillin ", "xyz-not-a-drug", "5mg/ml"]
+
+
+# Checked for identical results only: queries with no word characters fall back to a scan
+EDGE_QUERIES = ["-", "", " / "]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def bench_name_index(base):
+    print("== Token index vs regex scan (/search)")
+    for factor in SCALES:
+        df = enlarge(base, factor)
+        start = time.perf_counter()
+        index = NameIndex(df)
+        build_ms = 1000 * (time.perf_counter() - start)
+        queries = sample_queries(base)
+
+        mismatches = sum(
+            regex_search(df, q).index.tolist() != df.iloc[index.search(q)].index.tolist()
+            for q in queries + EDGE_QUERIES
+        )
+        regex_ms = timed(lambda q: regex_search(df, q), queries[:50])
+        index_ms = timed(index.search, queries)
+        print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  regex={regex_ms:7.3f} ms/query  "
+              f"index={index_ms:6.3f} ms/query  mismatches={mismatches}")
+
+
+def brute_force_fuzzy(index, query, max_distance):
+    """Reference fuzzy search: edit distance against every vocabulary token."""
+    scores = None
+    for token in set(tokenize(query)):
+        budget = allowed_distance(token, max_distance)
+        best = {}
+        for candidate, row_ids in index.postings.items():
+            distance = edit_distance(token, candidate) if budget else (0 if candidate == token else 1)
+            if distance <= budget:
+                for row_id in row_ids:
+                    best[row_id] = min(best.get(row_id, distance), distance)
+        scores = best if scores is None else {r: scores[r] + d for r, d in best.items() if r in scores}
+    return sorted((scores or {}).items(), key=lambda item: (item[1], item[0]))
+
+
+def typo(word, rng):
+    """Introduce one random deletion, insertion, substitution or transposition."""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    op = rng.choice("disx")
+    if op == "d":
+        return word[:i] + word[i + 1:]
+    if op == "i":
+        return word[:i] + rng.choice("aeiou") + word[i:]
+    if op == "s":
+        return word[:i] + rng.choice("aeiou") + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def bench_fuzzy(base, budget_ms=2.0):
+    print(f"== Fuzzy search (/search?mode=fuzzy), budget {budget_ms} ms/query")
+    rng = random.Random(1)
+    queries = [typo(q, rng) for q in sample_queries(base, n=100)]
+    queries += ["amoxicilin", "panadl", "paracetmol", "augmentn"]
+    for factor in SCALES:
+        df = enlarge(base, factor)
+        index = NameIndex(df)
+        start = time.perf_counter()
+        fuzzy = FuzzyNameIndex(index, max_distance=2)
+        build_ms = 1000 * (time.perf_counter() - start)
+
+        mismatches = sum(fuzzy.search(q, 2) != brute_force_fuzzy(index, q, 2) for q in queries[:20])
+        brute_ms = timed(lambda q: brute_force_fuzzy(index, q, 2), queries[:5])
+        fuzzy_ms = timed(lambda q: fuzzy.search(q, 2), queries)
+        verdict = "OK" if fuzzy_ms <= budget_ms else "OVER BUDGET"
+        print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  brute={brute_ms:8.2f} ms/query  "
+              f"symspell={fuzzy_ms:6.3f} ms/query  mismatches={mismatches}  {verdict}")
+
+
+def bench_suggest(base):
+    print("== Prefix autocomplete (/suggest), top 10")
+    rng = random.Random(2)
+    names = [normalize_name(n) for n in base["TradeName"].tolist() + base["ScientificName"].tolist()]
+    prefixes = [name[:rng.randint(1, 6)] for name in rng.sample(names, 200)]
+    for factor in SCALES:
+        df = enlarge(base, factor)
+        start = time.perf_counter()
+        index = SuggestIndex(name_suggestions(df))
+        build_ms = 1000 * (time.perf_counter() - start)
+        all_names = [normalize_name(n) for n in set(df["TradeName"]) | set(df["ScientificName"])]
+        scan_ms = timed(lambda p: [n for n in all_names if n.startswith(p)], prefixes[:20])
+        suggest_ms = timed(lambda p: index.suggest(p, 10), prefixes)
+        print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  scan={scan_ms:6.3f} ms/query  "
+              f"suggest={suggest_ms:6.3f} ms/query")
+
+
+def bench_arabic(base):
+    print("== Arabic-script lookup (/search with e.g. بنادول)")
+    rng = random.Random(3)
+    words = sorted({
+        w for n in base["TradeName"].str.lower() for w in tokenize(n)
+        if w.isalpha() and len(phonetic_key(w)) >= 2
+    })
+    sample = rng.sample(words, 200)
+    queries = [transliterate(w) for w in sample]
+    for factor in SCALES:
+        df = enlarge(base, factor)
+        names = [df[col].str.lower().tolist() for col in ["TradeName", "ScientificName"]]
+        start = time.perf_counter()
+        index = PhoneticIndex(names)
+        build_ms = 1000 * (time.perf_counter() - start)
+
+        def scan(q):
+            key = phonetic_key(q)
+            return [i for i in range(len(df)) if any(key in map(phonetic_key, tokenize(v[i])) for v in names)]
+
+        results = [index.search(q) for q in queries]
+        found = sum(bool(r) for r in results)
+        # The word that was transliterated should be in the top-ranked row
+        top_hits = sum(
+            bool(r) and any(word in tokenize(v[r[0][0]]) for v in names)
+            for word, r in zip(sample, results)
+        )
+        scan_ms = timed(scan, queries[:3])
+        index_ms = timed(index.search, queries)
+        print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  scan={scan_ms:8.2f} ms/query  "
+              f"index={index_ms:6.3f} ms/query  found={found}/{len(queries)}  top1={top_hits}/{len(queries)}")
+
+
+def bench_bulk(base):
+    print("== Prescription lookup: one /search_bulk vs sequential /search calls")
+    from fastapi.testclient import TestClient
+    import drug_description_api
+
+    client = TestClient(drug_description_api.app)
+    rng = random.Random(4)
+    names = sample_queries(base, n=400)
+    for size in [5, 10, 20]:
+        prescriptions = [rng.sample(names, size) for _ in range(20)]
+        start = time.perf_counter()
+        for prescription in prescriptions:
+            for name in prescription:
+                client.get("/search", params={"name": name})
+        sequential_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for prescription in prescriptions:
+            client.post("/search_bulk", json={"names": prescription})
+        bulk_s = time.perf_counter() - start
+        print(f"drugs={size:>3}  sequential={1000 * sequential_s / len(prescriptions):7.2f} ms/prescription  "
+              f"bulk={1000 * bulk_s / len(prescriptions):7.2f} ms/prescription  "
+              f"speedup={sequential_s / bulk_s:4.1f}x")
+
+
+def iterrows_render(df, rows, fields):
+    """The original per-request rendering, kept as the reference implementation."""
+    data = []
+    for _, row in df.iloc[rows].head(5).iterrows():
+        item = {"main": row.get("TradeName", "Unknown")}
+        for toggle, col in [("use", "use"), ("side", "sideEffect"), ("sub", "substitute"),
+                            ("tclass", "Therapeutic Class"), ("cclass", "Chemical Class"),
+                            ("habit", "Habit Forming")]:
+            if fields[toggle]:
+                value = row.get(col, "Unknown")
+                item[toggle] = format_list(value) if col in ("sideEffect", "substitute") else value
+        data.append(item)
+    return data
+
+
+def bench_render(base):
+    print("== /search rendering: iterrows vs precompiled records vs result cache")
+    import drug_description_api as api
+
+    data = api.reloader.current
+    fields = {"use": True, "side": True, "sub": True, "tclass": True, "cclass": True, "habit": False}
+    rng = random.Random(5)
+    queries = [q for q in sample_queries(base) if api.search_drug(data, q)]
+    # Zipf-like traffic: a few hot names account for most requests
+    traffic = [queries[min(int(rng.paretovariate(1.2)) - 1, len(queries) - 1)] for _ in range(2000)]
+    rows = {q: api.search_drug(data, q) for q in queries}
+
+    iterrows_ms = timed(lambda q: iterrows_render(base, rows[q], fields), queries)
+    records_ms = timed(lambda q: api.render_results(data, q, rows[q], None, "english", fields, "exact"), queries)
+    data.result_cache = ResultCache(max_entries=1024)
+    cached_ms = timed(lambda q: api.cached_search(data, q, "english", fields), traffic)
+    stats = data.result_cache.stats()
+    print(f"iterrows={iterrows_ms:6.3f} ms  records={records_ms:6.3f} ms  "
+          f"search+cache={cached_ms:6.4f} ms/query  hit_rate={stats['hit_rate']:.2f}")
+
+
+# Peak RSS is read from VmHWM: ru_maxrss would carry over the benchmark process's own peak
+STARTUP_PROBE = """
+import sys, time
+start = time.perf_counter()
+import pandas as pd
+from medvision_common.drug_snapshot import clean, load_table
+if sys.argv[1] == "csv":
+    df = clean(pd.read_csv(sys.argv[2], dtype=str, low_memory=False))
+else:
+    df = load_table(sys.argv[2])
+elapsed = 1000 * (time.perf_counter() - start)
+status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+print(elapsed, int(status["VmHWM"].split()[0]) / 1024)
+"""
+
+
+def bench_snapshot(base):
+    print("== Startup: CSV parse + clean vs Feather snapshot (fresh process each)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in [1, 16, 64]:
+            csv_path = os.path.join(tmp, f"drugs_{factor}.csv")
+            enlarge(base, factor).to_csv(csv_path, index=False)
+            build_snapshot(csv_path)
+            row = [f"rows={len(base) * factor:>7}"]
+            for source in ["csv", "snapshot"]:
+                out = subprocess.run(
+                    [sys.executable, "-c", STARTUP_PROBE, source, csv_path],
+                    capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                ).stdout.split()
+                row.append(f"{source}={float(out[0]):7.1f} ms rss={float(out[1]):6.1f} MB")
+            print("  ".join(row))
+
+
+WORKER_PROBE = """
+import drug_description_api
+status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+print(*(int(status[key].split()[0]) / 1024 for key in ["VmRSS", "RssAnon", "RssFile"]))
+"""
+
+
+def bench_storage(base):
+    print("== Storage backends: pandas vs SQLite FTS5 (search + render top 5)")
+    from drug_description_api import LABELS
+
+    queries = sample_queries(base)
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in SCALES:
+            df = enlarge(base, factor)
+            db_path = os.path.join(tmp, f"drugs_{factor}.sqlite3")
+            build_database(df, db_path)
+            stores = {"pandas": PandasStore(df, LABELS), "sqlite": SQLiteStore(db_path, LABELS)}
+            mismatches = sum(stores["pandas"].search(q) != stores["sqlite"].search(q) for q in queries + EDGE_QUERIES)
+            row = [f"rows={len(df):>6}"]
+            for name, store in stores.items():
+                ms = timed(lambda q: store.records(store.search(q)[:5], "english"), queries)
+                row.append(f"{name}={ms:6.3f} ms/query")
+            print("  ".join(row) + f"  mismatches={mismatches}")
+
+    # One API worker per backend, on the real table; RssAnon is the memory a worker does not share
+    here = os.path.dirname(os.path.abspath(__file__))
+    for backend in ["pandas", "sqlite"]:
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER_PROBE], capture_output=True, text=True, check=True, cwd=here,
+            env={**os.environ, "DRUG_STORAGE_BACKEND": backend},
+        ).stdout.split()
+        rss, anon, file_backed = map(float, out)
+        print(f"worker backend={backend:<6}  rss={rss:6.1f} MB  private={anon:6.1f} MB  file-backed={file_backed:5.1f} MB")
+
+
+def scan_query(df, side_effect, tclass):
+    """Reference /query: token match on sideEffect, class filter and facet counts by scanning."""
+    tokens = tokenize(side_effect)
+    side = df["sideEffect"].astype(str)
+    mask = side.ne("Unknown") & side.map(lambda v: set(tokens) <= set(tokenize(v)))
+    counts = df.loc[mask, "Therapeutic Class"].astype(str).value_counts()
+    mask &= df["Therapeutic Class"].astype(str).str.casefold() == tclass.casefold()
+    return int(mask.sum()), {k: int(v) for k, v in counts.items()}
+
+
+def bench_query(base):
+    print("== Faceted /query: bitmap postings vs SQLite FTS5 vs DataFrame scan")
+    from drug_description_api import LABELS
+
+    rng = random.Random(6)
+    terms = sorted({t for v in base["sideEffect"] for t in tokenize(v) if len(t) > 4})
+    classes = sorted(base["Therapeutic Class"].astype(str).unique())
+    queries = [(rng.choice(terms), rng.choice(classes)) for _ in range(100)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in SCALES:
+            df = enlarge(base, factor)
+            start = time.perf_counter()
+            index = FacetIndex(df[list(TEXT_COLUMNS.values()) + [c for c in FACET_COLUMNS if c in df.columns]])
+            build_ms = 1000 * (time.perf_counter() - start)
+            db_path = os.path.join(tmp, f"drugs_{factor}.sqlite3")
+            build_database(df, db_path)
+            sql_index = SQLiteFacetIndex(SQLiteStore(db_path, LABELS))
+
+            def indexed(query):
+                side_effect, tclass = query
+                bitmap, counts = index.query(fields={"side_effect": side_effect}, facets={"Therapeutic Class": [tclass]})
+                return bitmap.bit_count(), counts["Therapeutic Class"]
+
+            def sql(query):
+                side_effect, tclass = query
+                rows, counts = sql_index.query(fields={"side_effect": side_effect}, facets={"Therapeutic Class": [tclass]})
+                return len(rows), counts["Therapeutic Class"]
+
+            mismatches = sum(indexed(q) != scan_query(df, *q) or sql(q) != indexed(q) for q in queries[:20])
+            scan_ms = timed(lambda q: scan_query(df, *q), queries[:10])
+            index_ms = timed(indexed, queries)
+            sql_ms = timed(sql, queries)
+            print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  scan={scan_ms:7.2f} ms/query  "
+                  f"index={index_ms:6.3f} ms/query  sqlite={sql_ms:6.3f} ms/query  mismatches={mismatches}")
+
+
+def scan_substitutes(df, row_id):
+    """Reference 2-hop lookup: listed names, then every row listing one of them (full scan)."""
+    listed = {normalize_name(p) for p in split_list(str(df["substitute"].iloc[row_id]))} - {"unknown"}
+    trades = {normalize_name(t): i for i, t in reversed(list(enumerate(df["TradeName"].astype(str))))}
+    hop1 = {trades.get(name, name) for name in listed} - {row_id}
+    hop2 = set()
+    for other, value in enumerate(df["substitute"].astype(str)):
+        if other != row_id and other not in hop1 and listed & {normalize_name(p) for p in split_list(value)}:
+            hop2.add(other)
+    return hop1, hop2
+
+
+def bench_substitutes(base):
+    print("== /substitutes: CSR graph vs SQLite edge table vs substitute-column scan (2 hops)")
+    from drug_description_api import LABELS
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in SCALES:
+            df = enlarge(base, factor)
+            start = time.perf_counter()
+            graph = SubstituteGraph(df)
+            build_ms = 1000 * (time.perf_counter() - start)
+            db_path = os.path.join(tmp, f"drugs_{factor}.sqlite3")
+            build_database(df, db_path)
+            sql_graph = SQLiteSubstituteGraph(SQLiteStore(db_path, LABELS))
+            listed_rows = [i for i, v in enumerate(df["substitute"].astype(str)) if v != "Unknown"]
+            sources = rng.sample(listed_rows, 100)
+
+            def graph_sets(row_id):
+                found = graph.within((row_id,), 2)
+                hop1 = {graph.names[n] if n >= graph.size else n for n, d in found.items() if d == 1}
+                return {normalize_name(n) if isinstance(n, str) else n for n in hop1}, \
+                    {n for n, d in found.items() if d == 2 and n < graph.size}
+
+            mismatches = sum(
+                graph_sets(r) != scan_substitutes(df, r)
+                or sql_graph.substitutes([r], hops=2) != graph.substitutes([r], hops=2)
+                for r in sources[:10]
+            )
+            scan_ms = timed(lambda r: scan_substitutes(df, r), sources[:3])
+            graph.within.cache_clear()
+            sql_graph.within.cache_clear()
+            cold_ms = timed(lambda r: graph.substitutes([r], hops=2), sources)
+            warm_ms = timed(lambda r: graph.substitutes([r], hops=2), sources)
+            sql_ms = timed(lambda r: sql_graph.substitutes([r], hops=2), sources)
+            print(f"rows={len(df):>6}  build={build_ms:7.1f} ms  scan={scan_ms:8.2f} ms/query  "
+                  f"graph={cold_ms:6.3f} ms/query (cached {warm_ms:6.3f})  sqlite={sql_ms:6.3f} ms/query  "
+                  f"mismatches={mismatches}")
+
+
+def bench_reload(base):
+    print("== Hot reload: /search latency while a new version is built and swapped in")
+    from fastapi.testclient import TestClient
+    import drug_description_api as api
+
+    client = TestClient(api.app)
+    queries = sample_queries(base, n=200)
+    idle_ms = timed(lambda q: client.get("/search", params={"name": q, "mode": "fuzzy"}), queries)
+    version = api.reloader.version
+    api.reloader.reload()
+    served = 0
+    start = time.perf_counter()
+    while api.reloader.reloading:
+        client.get("/search", params={"name": queries[served % len(queries)], "mode": "fuzzy"})
+        served += 1
+    during_ms = 1000 * (time.perf_counter() - start) / max(served, 1)
+    stats = api.reloader.stats()
+    print(f"build={stats['load_seconds']:.3f} s  version {version}->{stats['version']}  "
+          f"idle={idle_ms:6.3f} ms/query  during reload={during_ms:6.3f} ms/query ({served} served)  "
+          f"errors={stats['last_error']}")
+
+
+if __name__ == "__main__":
+    base = load_data()
+    bench_name_index(base)
+    bench_fuzzy(base)
+    bench_suggest(base)
+    bench_arabic(base)
+    bench_bulk(base)
+    bench_render(base)
+    bench_snapshot(base)
+    bench_storage(base)
+    bench_query(base)
+    bench_substitutes(base)
+    bench_reload(base)
@@ -1,7 +1,21 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import re
+from pydantic import BaseModel, Field
+from types import SimpleNamespace
+from typing import List, Optional
+import os
+
+from medvision_common.arabic_names import PhoneticIndex, has_arabic, phonetic_name
+from medvision_common.drug_entities import SOURCES as ENTITY_SOURCES, load_entities
+from medvision_common.drug_snapshot import load_table
+from medvision_common.reloader import Reloader, authorized
+
+from drug_index import (
+    FACET_COLUMNS, TEXT_COLUMNS, FacetIndex, FuzzyNameIndex, NameIndex, SuggestIndex, name_suggestions
+)
+from drug_graph import SubstituteGraph
+from drug_records import ResultCache
+from drug_store import PandasStore, SQLiteFacetIndex, SQLiteStore, SQLiteSubstituteGraph, ensure_database
 
 # Configuration
 app = FastAPI(
@@ -19,21 +33,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load and Clean Data
-def load_data():
-    df = pd.read_csv("Drugs_discription.csv", dtype=str, low_memory=False)
-    df.columns = df.columns.str.strip()
-    df = df.dropna(how="all").drop_duplicates().fillna("Unknown")
-    return df
-
-df = load_data()
+# Load and Clean Data (Feather snapshot, rebuilt whenever the CSV changes)
+DATA_FILE = "Drugs_discription.csv"
 
-def format_list(text):
-    if not isinstance(text, str):
-        return text
-    parts = re.split(r'[;,]', text)
-    parts = [p.strip() for p in parts if p.strip()]
-    return "\n".join(f"- {p}" for p in parts)
+def load_data():
+    return load_table(DATA_FILE)
 
 # Language dictionaries
 EN = {
@@ -63,15 +67,87 @@ AR = {
 def get_text(lang, key):
     return (AR if lang == "arabic" else EN)[key]
 
-# Smart search
-def search_drug(query: str):
-    q = query.lower().strip()
-    search_columns = [col for col in ["TradeName", "ScientificName"] if col in df.columns]
-    mask = pd.Series(False, index=df.index)
-    pattern = rf"\b{re.escape(q)}\b"
-    for col in search_columns:
-        mask |= df[col].astype(str).str.lower().str.contains(pattern, na=False, regex=True)
-    return df[mask]
+# Table storage: "pandas" (in memory, default) or "sqlite" (shared on-disk FTS5 database)
+STORAGE_BACKEND = os.environ.get("DRUG_STORAGE_BACKEND", "pandas")
+LABELS = {"english": EN, "arabic": AR}
+def build_state():
+    """Load the table and build every index requests use, as one swappable version."""
+    if STORAGE_BACKEND == "sqlite":
+        store = SQLiteStore(
+            ensure_database(DATA_FILE),
+            LABELS,
+            pool_size=int(os.environ.get("DRUG_SQLITE_POOL_SIZE", 4))
+        )
+        name_index = NameIndex(store.names())
+        # /query and /substitutes run as SQL, so the descriptive columns stay on disk
+        facet_index = SQLiteFacetIndex(store)
+        substitute_graph = SQLiteSubstituteGraph(store)
+    elif STORAGE_BACKEND == "pandas":
+        df = load_data()
+        name_index = NameIndex(df)
+        store = PandasStore(df, LABELS, name_index)
+        # Side effect / use / substitute tokens and class facets, for /query
+        facet_index = FacetIndex(store.columns(list(TEXT_COLUMNS.values()) + FACET_COLUMNS))
+        # Drug -> listed alternatives graph, for /substitutes
+        substitute_graph = SubstituteGraph(
+            store.columns(["TradeName", "ScientificName", "substitute", "Therapeutic Class"])
+        )
+    else:
+        raise ValueError(f"Unknown DRUG_STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+    names = store.names()
+    return SimpleNamespace(
+        store=store,
+        # Name-only indexes (typo-tolerant, Arabic-script and autocomplete lookups)
+        fuzzy_index=FuzzyNameIndex(name_index, max_distance=2),
+        suggest_index=SuggestIndex(name_suggestions(names)),
+        # Arabic-script queries (e.g. بنادول) are matched by consonant skeleton against the Latin names
+        arabic_index=PhoneticIndex(name_index.names),
+        arabic_suggest_index=SuggestIndex(name_suggestions(names), normalize=phonetic_name),
+        facet_index=facet_index,
+        substitute_graph=substitute_graph,
+        # Drug entities shared with the interaction API (one artifact, DRUG_ENTITIES_PATH); every name
+        # lookup resolves through them, so both services agree on what a name means
+        entities=load_entities(),
+        # LRU of whole rendered responses; a fresh one per version, so no stale results survive a reload
+        result_cache=ResultCache(max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", 1024))),
+    )
+
+# Current data version; each request reads reloader.current once and uses it throughout.
+# The formulary and DDI table feed the entities, so a change to either reloads too
+reloader = Reloader(
+    build_state,
+    [DATA_FILE, ENTITY_SOURCES["formulary"], ENTITY_SOURCES["interactions"]],
+    watch_interval=float(os.environ.get("DATA_WATCH_INTERVAL", 0))
+).start()
+
+def get_records(data, rows, lang):
+    return data.store.records(rows, "arabic" if lang == "arabic" else "english")
+
+# Smart search (whole-word match on trade or scientific name, via the token index), then the rest of
+# the rows of the drug entity the name resolves to (e.g. PARACETAMOL rows for "acetaminophen"); returns row positions
+def search_drug(data, query: str):
+    if has_arabic(query):
+        rows = [row_id for row_id, _ in data.arabic_index.search(query)]
+    else:
+        rows = data.store.search(query)
+    entity_id = data.entities.resolve(query)
+    if entity_id is not None:
+        matched = set(rows)
+        rows = rows + [row for row in data.entities.description_rows[entity_id] if row not in matched]
+    return rows
+
+# Typo-tolerant search, ranked by total edit distance; a name that resolves to a drug entity is an exact hit
+def fuzzy_search_drug(data, query: str, max_distance: int):
+    if data.entities.resolve(query) is not None:
+        rows = search_drug(data, query)
+        return rows, [0] * len(rows)
+    if has_arabic(query):
+        # Already spelling-tolerant; distance is to the transliterated name
+        matches = data.arabic_index.search(query)
+    else:
+        matches = data.fuzzy_index.search(query, max_distance)
+    return [row_id for row_id, _ in matches], [distance for _, distance in matches]
 
 # API Endpoint
 @app.get("/search")
@@ -83,11 +159,28 @@ def search_drug_api(
     sub: bool = Query(True),
     tclass: bool = Query(True),
     cclass: bool = Query(True),
-    habit: bool = Query(False)
+    habit: bool = Query(False),
+    mode: str = Query("exact", pattern="^(exact|fuzzy)$"),
+    max_distance: int = Query(2, ge=0, le=2)
 ):
-    results = search_drug(name)
+    fields = {"use": use, "side": side, "sub": sub, "tclass": tclass, "cclass": cclass, "habit": habit}
+    return cached_search(reloader.current, name, language, fields, mode, max_distance)
 
-    if results.empty:
+def cached_search(data, name, language, fields, mode="exact", max_distance=2):
+    # Rendering only depends on the lowercased name, so "Panadol" and "PANADOL" share an entry
+    key = (name.lower(), language, mode, max_distance if mode == "fuzzy" else None, tuple(fields.values()))
+    response = data.result_cache.get(key)
+    if response is None:
+        if mode == "fuzzy":
+            rows, distances = fuzzy_search_drug(data, name, max_distance)
+        else:
+            rows, distances = search_drug(data, name), None
+        response = render_results(data, name, rows, distances, language, fields, mode)
+        data.result_cache.put(key, response)
+    return {**response, "query": name}
+
+def render_results(data, name, rows, distances, language, fields, mode):
+    if not rows:
         return {
             "query": name,
             "count": 0,
@@ -95,42 +188,179 @@ def search_drug_api(
             "results": []
         }
 
-    data = []
-    for _, row in results.head(5).iterrows():
-        trade = row.get("TradeName", "Unknown")
-        sci = row.get("ScientificName", "Unknown")
-        q = name.lower()
+    items = []
+    q = name.lower()
+    for i, record in enumerate(get_records(data, rows[:5], language)):
+        item = dict(record["as_sci"] if q in record["sci_lower"] else record["as_trade"])
 
-        if q in str(sci).lower():
-            main = {"main": f"{sci}", "secondary": f"{get_text(language, 'trade')}: {trade}"}
-        else:
-            main = {"main": f"{trade}", "secondary": f"{get_text(language, 'sci')}: {sci}"}
+        if distances is not None:
+            item["match_distance"] = distances[i]
 
-        item = {**main}
+        for toggle, label, value in record["fields"]:
+            if fields[toggle]:
+                item[label] = value
 
-        if use:
-            item[get_text(language, "use")] = row.get("use", "Unknown")
+        items.append(item)
+
+    return {
+        "query": name,
+        "count": len(items),
+        "language": language,
+        "mode": mode,
+        "results": items
+    }
 
-        if side:
-            item[get_text(language, "side")] = format_list(row.get("sideEffect", "Unknown"))
+# Bulk Endpoint (a whole prescription in one request)
+class BulkSearchQuery(BaseModel):
+    names: List[str] = Field(..., min_length=1, max_length=100)
+    language: str = "english"
+    use: bool = True
+    side: bool = True
+    sub: bool = True
+    tclass: bool = True
+    cclass: bool = True
+    habit: bool = False
 
-        if sub:
-            item[get_text(language, "sub")] = format_list(row.get("substitute", "Unknown"))
+@app.post("/search_bulk")
+def search_bulk_api(query: BulkSearchQuery):
+    fields = {key: getattr(query, key) for key in ["use", "side", "sub", "tclass", "cclass", "habit"]}
+    data = reloader.current
+    # Repeated names (in any letter case) resolve and render once
+    rendered = {}
+    results = {}
+    for name in query.names:
+        key = name.lower()
+        if key not in rendered:
+            rendered[key] = cached_search(data, name, query.language, fields)
+        results[name] = {**rendered[key], "query": name}
 
-        if tclass:
-            item[get_text(language, "tclass")] = row.get("Therapeutic Class", "Unknown")
+    return {
+        "count": len(results),
+        "unique": len(rendered),
+        "language": query.language,
+        "unmatched": [name for name, result in results.items() if result["count"] == 0],
+        "results": results
+    }
 
-        if cclass:
-            item[get_text(language, "cclass")] = row.get("Chemical Class", "Unknown")
+# Faceted full-text Endpoint
+@app.get("/query")
+def query_drugs_api(
+    text: Optional[str] = Query(None),
+    side_effect: Optional[str] = Query(None),
+    indication: Optional[str] = Query(None),
+    substitute: Optional[str] = Query(None),
+    tclass: List[str] = Query([]),
+    cclass: List[str] = Query([]),
+    habit: List[str] = Query([]),
+    language: str = Query("english"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100)
+):
+    data = reloader.current
+    selected = {"Therapeutic Class": tclass, "Chemical Class": cclass, "Habit Forming": habit}
+    # Filtering on a column the loaded table lacks (e.g. "Habit Forming") would just match nothing
+    missing = [col for col, values in selected.items() if values and col not in data.facet_index.facet_columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"No such column to filter on: {', '.join(missing)}")
+    # A row bitmap from FacetIndex, row IDs from SQLiteFacetIndex; rows() turns either into row IDs
+    matched, facets = data.facet_index.query(
+        text=text,
+        fields={"side_effect": side_effect, "indication": indication, "substitute": substitute},
+        facets=selected
+    )
+    rows = data.facet_index.rows(matched)
+    page_rows = rows[(page - 1) * page_size:page * page_size]
 
-        if habit:
-            item[get_text(language, "habit")] = row.get("Habit Forming", "Unknown")
+    items = []
+    for record in get_records(data, page_rows, language):
+        item = dict(record["as_trade"])
+        for toggle, label, value in record["fields"]:
+            if toggle != "habit":
+                item[label] = value
+        items.append(item)
 
-        data.append(item)
+    return {
+        "total": len(rows),
+        "page": page,
+        "page_size": page_size,
+        "pages": -(-len(rows) // page_size),
+        "language": language,
+        "facets": facets,
+        "results": items
+    }
 
+# Substitutes Endpoint (stock-out alternatives)
+@app.get("/substitutes")
+def substitutes_api(
+    name: str = Query(...),
+    hops: int = Query(1, ge=1, le=3),
+    tclass: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    # Same drug resolution as /search: the top 5 matching rows
+    data = reloader.current
+    rows = search_drug(data, name)[:5]
+    substitutes = data.substitute_graph.substitutes(rows, hops, tclass) if rows else []
     return {
         "query": name,
-        "count": len(data),
-        "language": language,
-        "results": data
+        "matched": [data.substitute_graph.names[row_id] for row_id in rows],
+        "hops": hops,
+        "count": len(substitutes),
+        "substitutes": substitutes[:limit]
+    }
+
+# Type-ahead Endpoint
+@app.get("/suggest")
+def suggest_drug_api(
+    prefix: str = Query(...),
+    limit: int = Query(10, ge=1, le=50)
+):
+    data = reloader.current
+    index = data.arabic_suggest_index if has_arabic(prefix) else data.suggest_index
+    suggestions = index.suggest(prefix, limit)
+    return {
+        "prefix": prefix,
+        "count": len(suggestions),
+        "suggestions": suggestions
+    }
+
+# Shared entity Endpoint: resolves names exactly as the interaction API's /entity does
+@app.get("/entity")
+def entity_api(
+    name: str = Query(...),
+    language: str = Query("english")
+):
+    data = reloader.current
+    entity_id = data.entities.resolve(name)
+    rows = [] if entity_id is None else data.entities.description_rows[entity_id]
+    if rows:
+        # Rows the name itself matches (a brand's own products) first, then the rest of the entity's
+        entity_rows = set(rows)
+        matched = [row for row in search_drug(data, name) if row in entity_rows]
+        rows = matched + sorted(entity_rows - set(matched))
+    fields = {"use": True, "side": True, "sub": True, "tclass": True, "cclass": True, "habit": False}
+    return {
+        **render_results(data, name, rows, None, language, fields, "entity"),
+        "entity": None if entity_id is None else data.entities.record(entity_id)
+    }
+
+# Admin: rebuild tables and indexes from the source files, then swap them in
+@app.post("/admin/reload", status_code=202)
+def reload_api(x_admin_token: Optional[str] = Header(None)):
+    if not authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    started = reloader.reload()
+    return {"started": started, **reloader.stats()}
+
+# Health / cache statistics
+@app.get("/health")
+def health():
+    data = reloader.current
+    return {
+        "status": "ok",
+        "data": reloader.stats(),
+        "storage": data.store.stats(),
+        "result_cache": data.result_cache.stats(),
+        "substitute_graph": data.substitute_graph.stats(),
+        "entities": data.entities.stats()
     }
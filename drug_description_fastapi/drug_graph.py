@@ -0,0 +1,115 @@
+"""
+Substitute graph over the drug description table.
+
+The ``substitute`` column lists alternative products for each row. It is
+parsed once into an undirected graph over integer node IDs: IDs below
+``size`` are table rows, the rest are listed products that are not in the
+table. A listed name resolves to a row when its normalised form equals that
+row's normalised trade name. Adjacency is stored CSR-style (``indptr`` /
+``indices`` int32 arrays), so a node's neighbours are one array slice.
+
+One hop from a drug gives its listed substitutes; two hops also reach the
+other table drugs that list the same products, i.e. alternatives that are
+actually stocked.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from drug_index import normalize_name
+from drug_records import split_list
+
+
+class SubstituteGraph:
+    def __init__(self, df):
+        trades = df["TradeName"].astype(str).tolist()
+        scis = df["ScientificName"].astype(str).tolist() if "ScientificName" in df.columns else ["Unknown"] * len(df)
+        classes = (
+            df["Therapeutic Class"].astype(str).tolist() if "Therapeutic Class" in df.columns
+            else ["Unknown"] * len(df)
+        )
+        self.size = len(df)
+        self.names = list(trades)
+        self.scientific = scis
+
+        row_by_name = {}
+        for row_id, trade in enumerate(trades):
+            row_by_name.setdefault(normalize_name(trade), row_id)
+
+        external = {}
+        node_classes = [{cls} for cls in classes]
+        edges = set()
+        for row_id, value in enumerate(df["substitute"].astype(str)):
+            if value == "Unknown":
+                continue
+            for part in split_list(value):
+                key = normalize_name(part)
+                node = row_by_name.get(key)
+                if node is None:
+                    node = external.get(key)
+                    if node is None:
+                        node = external[key] = len(self.names)
+                        self.names.append(part)
+                        node_classes.append(set())
+                    # A listed product inherits the classes of the drugs listing it
+                    node_classes[node].add(classes[row_id])
+                if node != row_id:
+                    edges.add((row_id, node))
+                    edges.add((node, row_id))
+
+        self.node_classes = [frozenset(c) for c in node_classes]
+        self.class_keys = {cls.casefold(): cls for c in node_classes for cls in c}
+        pairs = np.array(sorted(edges), dtype=np.int32).reshape(-1, 2)
+        self.indptr = np.zeros(len(self.names) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=len(self.names)), out=self.indptr[1:])
+        self.indices = pairs[:, 1].copy()
+        self.edge_count = len(edges) // 2
+        self.within = lru_cache(maxsize=4096)(self._within)
+
+    def neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def _within(self, sources, hops):
+        """{node: hop distance} for nodes within hops of any source, sources excluded."""
+        seen = set(sources)
+        found = {}
+        frontier = list(sources)
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            for node in frontier:
+                for neighbour in self.neighbours(node).tolist():
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        found[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return found
+
+    def substitutes(self, rows, hops=1, therapeutic_class=None):
+        """
+        Alternatives of the given rows within hops, as dicts sorted by hop
+        distance, then in-table first, then name. ``therapeutic_class``
+        (case-insensitive) keeps only nodes carrying that class.
+        """
+        found = self.within(tuple(sorted(set(rows))), hops)
+        wanted = self.class_keys.get(therapeutic_class.casefold(), therapeutic_class) if therapeutic_class else None
+        results = []
+        # In node order, so equal sort keys come out as the SQLite graph gives them
+        for node, distance in sorted(found.items()):
+            if wanted is not None and wanted not in self.node_classes[node]:
+                continue
+            item = {"name": self.names[node], "hops": distance, "in_table": node < self.size}
+            if node < self.size:
+                item["scientific_name"] = self.scientific[node]
+            item["therapeutic_classes"] = sorted(self.node_classes[node])
+            results.append(item)
+        results.sort(key=lambda item: (item["hops"], not item["in_table"], item["name"]))
+        return results
+
+    def stats(self):
+        return {
+            "nodes": len(self.names),
+            "table_rows": self.size,
+            "edges": self.edge_count,
+            "cached_lookups": self.within.cache_info().currsize,
+        }
@@ -0,0 +1,360 @@
+"""
+Search indexes over the drug description table.
+
+Built once at load time so a request costs dictionary lookups instead of a
+regex scan over every row.
+"""
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from medvision_common.arabic_names import normalize_arabic
+
+TOKEN_RE = re.compile(r"\w+")
+NAME_COLUMNS = ["TradeName", "ScientificName"]
+# /query filter name -> column, and the columns with facet counts
+TEXT_COLUMNS = {"side_effect": "sideEffect", "indication": "use", "substitute": "substitute"}
+FACET_COLUMNS = ["Therapeutic Class", "Chemical Class", "Habit Forming"]
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def normalize_name(text):
+    """Case-fold, collapse whitespace and fold Arabic letter variants / diacritics."""
+    return normalize_arabic(text)
+
+
+class NameIndex:
+    """
+    Word-token inverted index over TradeName / ScientificName.
+
+    ``search`` returns the same rows, in the same order, as matching
+    ``\\b<query>\\b`` against the lowercased name columns: every word run in
+    the query must be a whole token of the name, so the postings
+    intersection is a superset of the regex matches, and only those
+    candidates are checked with the regex.
+    """
+
+    def __init__(self, df, columns=NAME_COLUMNS):
+        self.columns = [col for col in columns if col in df.columns]
+        self.names = [df[col].astype(str).str.lower().tolist() for col in self.columns]
+        self.size = len(df)
+
+        postings = defaultdict(set)
+        for values in self.names:
+            for row_id, value in enumerate(values):
+                for token in TOKEN_RE.findall(value):
+                    postings[token].add(row_id)
+        self.postings = {token: sorted(ids) for token, ids in postings.items()}
+
+    def candidates(self, tokens):
+        """Row IDs containing every token, in either name column."""
+        lists = [self.postings.get(token) for token in set(tokens)]
+        if not lists or any(ids is None for ids in lists):
+            return []
+        lists.sort(key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+        return sorted(result)
+
+    def search(self, query):
+        """Row positions whose names match ``\\b<query>\\b`` (query lowercased and stripped)."""
+        q = query.lower().strip()
+        pattern = re.compile(rf"\b{re.escape(q)}\b")
+        tokens = TOKEN_RE.findall(q)
+        # Queries without a word character can't use the index; keep the scan semantics
+        row_ids = self.candidates(tokens) if tokens else range(self.size)
+        return [
+            row_id for row_id in row_ids
+            if any(pattern.search(values[row_id]) for values in self.names)
+        ]
+
+
+def _deletes(word, max_distance):
+    """All strings reachable from word by deleting up to max_distance characters."""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)."""
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def allowed_distance(token, max_distance):
+    """Short tokens get a tighter budget so 'tab' doesn't match half the table."""
+    if len(token) < 3:
+        return 0
+    if len(token) < 6:
+        return min(max_distance, 1)
+    return max_distance
+
+
+class FuzzyNameIndex:
+    """
+    Typo-tolerant lookup over the NameIndex vocabulary (SymSpell-style).
+
+    Every vocabulary token is stored under each string obtained by deleting
+    up to ``max_distance`` characters. A query token's own deletes then hit
+    every vocabulary token within that edit distance, and only those few
+    candidates are verified with a real edit-distance computation.
+    """
+
+    def __init__(self, name_index, max_distance=2):
+        self.name_index = name_index
+        self.max_distance = max_distance
+        deletes = defaultdict(list)
+        for token in name_index.postings:
+            for variant in _deletes(token, allowed_distance(token, max_distance)):
+                deletes[variant].append(token)
+        self.deletes = dict(deletes)
+
+    def similar_tokens(self, token, max_distance):
+        """{vocabulary token: distance} for tokens within the allowed distance."""
+        budget = allowed_distance(token, min(max_distance, self.max_distance))
+        if budget == 0:
+            return {token: 0} if token in self.name_index.postings else {}
+        found = {}
+        for variant in _deletes(token, budget):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate not in found:
+                    found[candidate] = edit_distance(token, candidate)
+        return {candidate: d for candidate, d in found.items() if d <= budget}
+
+    def search(self, query, max_distance=None):
+        """
+        Rows matching every query token within the edit budget, as
+        (row_id, total_distance) ranked by distance then table order.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        scores = None
+        for token in set(tokenize(query)):
+            best = {}
+            for candidate, distance in self.similar_tokens(token, max_distance).items():
+                for row_id in self.name_index.postings[candidate]:
+                    if distance < best.get(row_id, max_distance + 1):
+                        best[row_id] = distance
+            if scores is None:
+                scores = best
+            else:
+                scores = {row_id: scores[row_id] + d for row_id, d in best.items() if row_id in scores}
+            if not scores:
+                return []
+        return sorted((scores or {}).items(), key=lambda item: (item[1], item[0]))
+
+
+class SuggestIndex:
+    """
+    Prefix autocomplete over distinct drug names.
+
+    Every word-start suffix of each normalised name ("panadol extra",
+    "extra") is kept in one sorted list, so a prefix is a bisect range.
+    Candidates are ranked by whether the prefix matches the start of the
+    name, then by weight, then alphabetically. Top-k lists for prefixes of
+    up to ``cached_prefix_length`` characters, whose ranges are the largest,
+    are precomputed.
+    """
+
+    def __init__(self, entries, cached_prefix_length=2, cached_limit=20, normalize=normalize_name):
+        """
+        entries: iterable of (display_name, kind, weight). ``normalize`` maps
+        both names and typed prefixes to the strings that are matched.
+        """
+        self.normalize = normalize
+        self.entries = []
+        seen = {}
+        keys = []
+        for display, kind, weight in entries:
+            norm = normalize(display)
+            if not norm:
+                continue
+            if (display, kind) in seen:
+                entry_id = seen[(display, kind)]
+                self.entries[entry_id]["score"] = max(self.entries[entry_id]["score"], weight)
+                continue
+            entry_id = seen[(display, kind)] = len(self.entries)
+            self.entries.append({"name": display, "type": kind, "score": weight})
+            for match in re.finditer(r"\S+", norm):
+                keys.append((norm[match.start():], match.start() == 0, entry_id))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.key_entries = [(is_full, entry_id) for _, is_full, entry_id in keys]
+
+        self.cached_prefix_length = cached_prefix_length
+        self.cached_limit = cached_limit
+        prefixes = {key[:n] for key in self.keys for n in range(1, cached_prefix_length + 1)}
+        self._top = {prefix: self._rank(prefix, cached_limit) for prefix in prefixes}
+
+    def _rank(self, prefix, limit):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\U0010ffff")
+        best = {}
+        for is_full, entry_id in self.key_entries[lo:hi]:
+            best[entry_id] = best.get(entry_id, False) or is_full
+        return heapq.nsmallest(
+            limit,
+            best,
+            key=lambda i: (not best[i], -self.entries[i]["score"], self.entries[i]["name"]),
+        )
+
+    def suggest(self, prefix, limit=10):
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= self.cached_prefix_length and limit <= self.cached_limit:
+            ranked = self._top.get(prefix, [])[:limit]
+        else:
+            ranked = self._rank(prefix, limit)
+        return [self.entries[i] for i in ranked]
+
+
+def name_suggestions(df):
+    """
+    (name, kind, weight) entries for SuggestIndex. A name's weight is the
+    number of products sharing its scientific name, i.e. how widely the
+    molecule is stocked.
+    """
+    sci_counts = Counter(df["ScientificName"].astype(str))
+    for trade, sci in zip(df["TradeName"].astype(str), df["ScientificName"].astype(str)):
+        yield trade, "trade", sci_counts[sci]
+    for sci, count in sci_counts.items():
+        yield sci, "scientific", count
+
+
+def to_bitmap(row_ids, size):
+    """Pack row IDs into an int with bit i set for row i."""
+    bits = bytearray((size + 7) // 8)
+    for row_id in row_ids:
+        bits[row_id >> 3] |= 1 << (row_id & 7)
+    return int.from_bytes(bits, "little")
+
+
+def from_bitmap(bitmap, size):
+    """Row IDs of the set bits, ascending."""
+    packed = np.frombuffer(bitmap.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, bitorder="little")).tolist()
+
+
+class FacetIndex:
+    """
+    Boolean full-text and facet filtering over the descriptive columns.
+
+    Every posting list is a row bitmap (a Python int), so combining filters
+    is a chain of ``&``/``|`` and a facet count is the popcount of the facet
+    value's bitmap ANDed with the result, with no pass over the table.
+    Text columns (side effects, uses, substitutes) are indexed by word
+    token; facet columns map each distinct value to its rows.
+    """
+
+    def __init__(self, df, text_columns=TEXT_COLUMNS, facet_columns=FACET_COLUMNS):
+        """text_columns: {filter name: column}; facet_columns: columns to facet on."""
+        self.size = len(df)
+        self.all_rows = (1 << self.size) - 1
+        self.text_columns = {name: col for name, col in text_columns.items() if col in df.columns}
+        self.facet_columns = [col for col in facet_columns if col in df.columns]
+
+        self.text = {}
+        for name, col in self.text_columns.items():
+            postings = defaultdict(list)
+            for row_id, value in enumerate(df[col].astype(str)):
+                if value == "Unknown":
+                    continue
+                for token in set(tokenize(value)):
+                    postings[token].append(row_id)
+            self.text[name] = {token: to_bitmap(ids, self.size) for token, ids in postings.items()}
+
+        self.facets = {}
+        self.facet_keys = {}
+        for col in self.facet_columns:
+            postings = defaultdict(list)
+            for row_id, value in enumerate(df[col].astype(str)):
+                postings[value].append(row_id)
+            self.facets[col] = {value: to_bitmap(ids, self.size) for value, ids in postings.items()}
+            # Filters match facet values case-insensitively
+            self.facet_keys[col] = {value.casefold(): value for value in postings}
+
+    def _text_match(self, names, query):
+        """Rows where every query token appears in at least one of the named text columns; none without tokens."""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return 0
+        result = self.all_rows
+        for token in tokens:
+            union = 0
+            for name in names:
+                union |= self.text.get(name, {}).get(token, 0)
+            result &= union
+            if not result:
+                break
+        return result
+
+    def _facet_match(self, col, values):
+        """Rows having any of the values in col (case-insensitive); every row if no values."""
+        if not values:
+            return self.all_rows
+        keys, postings = self.facet_keys.get(col, {}), self.facets.get(col, {})
+        union = 0
+        for value in values:
+            union |= postings.get(keys.get(value.casefold()), 0)
+        return union
+
+    def query(self, text=None, fields=None, facets=None):
+        """
+        (bitmap of matching rows, facet counts). ``text`` searches every
+        text column; ``fields`` is {filter name: query} for single columns;
+        ``facets`` is {column: [values]}, values OR-ed within a column and
+        columns AND-ed.
+
+        Counts are disjunctive: each facet is counted with every filter
+        except its own, so the other values of a selected facet still show
+        how many rows picking them instead would give. Counts are listed
+        largest first and only for values with matches.
+        """
+        base = self.all_rows
+        if text:
+            base &= self._text_match(list(self.text), text)
+        for name, value in (fields or {}).items():
+            if value:
+                base &= self._text_match([name], value)
+        selected = {col: self._facet_match(col, values) for col, values in (facets or {}).items()}
+
+        bitmap = base
+        for rows in selected.values():
+            bitmap &= rows
+
+        counts = {}
+        for col, values in self.facets.items():
+            scope = base
+            for other, rows in selected.items():
+                if other != col:
+                    scope &= rows
+            col_counts = ((value, (rows & scope).bit_count()) for value, rows in values.items())
+            counts[col] = dict(sorted(
+                ((value, n) for value, n in col_counts if n),
+                key=lambda item: (-item[1], item[0]),
+            ))
+        return bitmap, counts
+
+    def rows(self, bitmap):
+        return from_bitmap(bitmap, self.size)
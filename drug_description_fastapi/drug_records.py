@@ -0,0 +1,111 @@
+"""
+Render-ready drug records and a result cache for /search.
+
+The table is immutable between restarts, so every row is compiled once per
+language into the pieces a response is assembled from: the two main/secondary
+headings and the localized (label, value) pairs for each field toggle, with
+the semicolon/comma lists already split and formatted. Whole responses are
+then kept in an LRU keyed on the normalized query, language, mode and toggles,
+so a hot query is one dictionary lookup.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+LIST_SPLIT_RE = re.compile(r"[;,]")
+
+# Toggle -> source column, in response order
+FIELD_COLUMNS = [
+    ("use", "use"),
+    ("side", "sideEffect"),
+    ("sub", "substitute"),
+    ("tclass", "Therapeutic Class"),
+    ("cclass", "Chemical Class"),
+    ("habit", "Habit Forming"),
+]
+LIST_COLUMNS = {"sideEffect", "substitute"}
+
+
+def split_list(text):
+    """Split a semicolon/comma separated cell into its stripped, non-empty parts."""
+    return [p.strip() for p in LIST_SPLIT_RE.split(text) if p.strip()]
+
+
+def format_list(text):
+    if not isinstance(text, str):
+        return text
+    return "\n".join(f"- {p}" for p in split_list(text))
+
+
+def compile_record(row, text):
+    """
+    Render-ready record for one row (a column -> value mapping), with the
+    labels of one language. Holds "sci_lower" (for choosing the heading),
+    "as_sci"/"as_trade" headings, "fields": [(toggle, label, value)] and
+    "lists": the pre-split sideEffect/substitute parts.
+    """
+    trade, sci = row.get("TradeName", "Unknown"), row.get("ScientificName", "Unknown")
+    values = {col: row.get(col, "Unknown") for _, col in FIELD_COLUMNS}
+    return {
+        "sci_lower": str(sci).lower(),
+        "as_sci": {"main": f"{sci}", "secondary": f"{text['trade']}: {trade}"},
+        "as_trade": {"main": f"{trade}", "secondary": f"{text['sci']}: {sci}"},
+        "fields": [
+            (toggle, text[toggle], format_list(values[col]) if col in LIST_COLUMNS else values[col])
+            for toggle, col in FIELD_COLUMNS
+        ],
+        "lists": {
+            col: split_list(values[col]) if isinstance(values[col], str) else []
+            for col in LIST_COLUMNS
+        },
+    }
+
+
+def compile_records(df, labels):
+    """{language: [record per row]} for labels = {language: {label key: text}} as used by get_text."""
+    rows = df.to_dict("records")
+    return {language: [compile_record(row, text) for row in rows] for language, text in labels.items()}
+
+
+class ResultCache:
+    """Thread-safe LRU of rendered responses with hit/miss counters."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,364 @@
+"""
+Storage backends for the drug description table.
+
+``PandasStore`` keeps the whole table, and its pre-rendered records, in the
+worker's memory. ``SQLiteStore`` keeps it in an on-disk SQLite database with
+an FTS5 index over names, uses and side effects, read through a pool of
+read-only connections, so several workers share one page-cached file and only
+hold the two name columns (needed by the fuzzy, Arabic and autocomplete
+indexes) themselves.
+
+Both answer ``search`` with the same row positions, in the same order, and
+``records`` with the same render-ready records, so ``/search`` responses are
+identical whichever backend is configured (``DRUG_STORAGE_BACKEND``).
+
+With SQLite, ``/query`` and ``/substitutes`` are answered from the database
+too: ``SQLiteFacetIndex`` runs the text filters on a second, contentless FTS5
+table over the text columns and the facet counts as ``GROUP BY`` queries, and
+``SQLiteSubstituteGraph`` walks a substitute edge table (parsed once, at build
+time, by ``SubstituteGraph``) with a recursive CTE. Their results match
+``FacetIndex`` and ``SubstituteGraph``, so the in-memory versions of those
+are only built for the pandas backend.
+"""
+import json
+import os
+import queue
+import re
+import sqlite3
+from contextlib import contextmanager
+from functools import lru_cache
+
+import pandas as pd
+
+from medvision_common.drug_snapshot import file_digest, load_table
+
+from drug_graph import SubstituteGraph
+from drug_index import FACET_COLUMNS, NAME_COLUMNS, TEXT_COLUMNS, TOKEN_RE, NameIndex, tokenize
+from drug_records import compile_record, compile_records
+
+FTS_COLUMNS = ["TradeName", "ScientificName", "use", "sideEffect"]
+# Bumped when build_database's tables change, so older databases are rebuilt
+SCHEMA_VERSION = "2"
+# FacetIndex's tokens: \w+ runs, lowercased, accents kept
+TEXT_TOKENIZER = "unicode61 remove_diacritics 0 tokenchars '_'"
+
+
+class PandasStore:
+    def __init__(self, df, labels, name_index=None):
+        self.df = df
+        self.size = len(df)
+        self._index = name_index or NameIndex(df)
+        self._records = compile_records(df, labels)
+
+    def names(self):
+        return self.columns(NAME_COLUMNS)
+
+    def columns(self, columns):
+        """The given columns (those that exist), in row order."""
+        return self.df[[col for col in columns if col in self.df.columns]]
+
+    def search(self, query):
+        return self._index.search(query)
+
+    def records(self, rows, language):
+        records = self._records[language]
+        return [records[row_id] for row_id in rows]
+
+    def stats(self):
+        return {"backend": "pandas", "rows": self.size}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def database_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".sqlite3"
+
+
+def ensure_database(csv_path="Drugs_discription.csv", db_path=None):
+    """Path of an up-to-date database for csv_path, (re)building it if the CSV changed."""
+    db_path = db_path or database_path_for(csv_path)
+    digest = file_digest(csv_path)
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            stored = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        stored = {}
+    if stored.get("source_sha256") != digest or stored.get("schema_version") != SCHEMA_VERSION:
+        build_database(load_table(csv_path), db_path, digest)
+    return db_path
+
+
+def build_database(df, db_path, digest=""):
+    """Write the cleaned table (row_id = row position), its FTS5 indexes and the substitute graph."""
+    columns = list(df.columns)
+    fts_columns = [col for col in FTS_COLUMNS if col in columns]
+    text_columns = [col for col in TEXT_COLUMNS.values() if col in columns]
+    graph = SubstituteGraph(df) if "substitute" in columns and "TradeName" in columns else None
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("source_sha256", digest), ("schema_version", SCHEMA_VERSION)
+            ])
+            conn.execute(
+                f"CREATE TABLE drugs (row_id INTEGER PRIMARY KEY, {', '.join(_quote(c) + ' TEXT' for c in columns)})"
+            )
+            conn.executemany(
+                f"INSERT INTO drugs VALUES ({', '.join('?' * (len(columns) + 1))})",
+                ((i, *map(str, values)) for i, values in enumerate(df.itertuples(index=False))),
+            )
+            conn.execute(
+                f"CREATE VIRTUAL TABLE drugs_fts USING fts5({', '.join(map(_quote, fts_columns))}, "
+                "content='drugs', content_rowid='row_id')"
+            )
+            conn.execute("INSERT INTO drugs_fts(drugs_fts) VALUES ('rebuild')")
+
+            # /query text filters; "Unknown" is no text, as in FacetIndex
+            conn.execute(
+                f"CREATE VIRTUAL TABLE drugs_text USING fts5({', '.join(map(_quote, text_columns or ['none']))}, "
+                f"content='', tokenize=\"{TEXT_TOKENIZER}\")"
+            )
+            if text_columns:
+                conn.executemany(
+                    f"INSERT INTO drugs_text(rowid, {', '.join(map(_quote, text_columns))}) "
+                    f"VALUES ({', '.join('?' * (len(text_columns) + 1))})",
+                    (
+                        (i, *(None if value == "Unknown" else value for value in values))
+                        for i, values in enumerate(df[text_columns].astype(str).itertuples(index=False))
+                    ),
+                )
+            for i, col in enumerate(col for col in FACET_COLUMNS if col in columns):
+                conn.execute(f"CREATE INDEX drugs_facet_{i} ON drugs ({_quote(col)})")
+
+            # /substitutes: node IDs as in SubstituteGraph (table rows first, then listed products)
+            conn.execute("CREATE TABLE substitute_nodes (node INTEGER PRIMARY KEY, name TEXT, scientific_name TEXT)")
+            conn.execute("CREATE TABLE substitute_classes (node INTEGER NOT NULL, class TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE substitute_edges (source INTEGER NOT NULL, target INTEGER NOT NULL, "
+                "PRIMARY KEY (source, target)) WITHOUT ROWID"
+            )
+            if graph is not None:
+                conn.executemany("INSERT INTO substitute_nodes VALUES (?, ?, ?)", (
+                    (node, name, graph.scientific[node] if node < graph.size else None)
+                    for node, name in enumerate(graph.names)
+                ))
+                conn.executemany("INSERT INTO substitute_classes VALUES (?, ?)", (
+                    (node, cls) for node, classes in enumerate(graph.node_classes) for cls in classes
+                ))
+                conn.executemany("INSERT INTO substitute_edges VALUES (?, ?)", (
+                    (node, target) for node in range(len(graph.names)) for target in graph.neighbours(node).tolist()
+                ))
+            conn.execute("CREATE INDEX substitute_classes_node ON substitute_classes (node)")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+
+
+class SQLiteStore:
+    def __init__(self, db_path, labels, pool_size=4):
+        self.db_path = db_path
+        self.labels = labels
+        self.pool_size = pool_size
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            # Read-only; sync endpoints run in a threadpool, so connections move between threads
+            self._pool.put(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False))
+
+        with self._connection() as conn:
+            self._columns = [d[0] for d in conn.execute("SELECT * FROM drugs LIMIT 0").description][1:]
+        self._names = self.columns(NAME_COLUMNS)
+        self.size = len(self._names)
+        self._lower = [self._names[col].str.lower().tolist() for col in NAME_COLUMNS]
+
+    def fetch(self, sql, args=()):
+        with self._connection() as conn:
+            return conn.execute(sql, args).fetchall()
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def names(self):
+        return self._names
+
+    def columns(self, columns):
+        """The given columns (those that exist), read from the database in row order."""
+        columns = [col for col in columns if col in self._columns]
+        with self._connection() as conn:
+            cursor = conn.execute(f"SELECT {', '.join(map(_quote, columns))} FROM drugs ORDER BY row_id")
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+    def search(self, query):
+        """Same semantics as NameIndex.search: FTS5 candidates verified with ``\\b<query>\\b``."""
+        q = query.lower().strip()
+        pattern = re.compile(rf"\b{re.escape(q)}\b")
+        tokens = TOKEN_RE.findall(q)
+        if tokens:
+            match = "{%s} : %s" % (
+                " ".join(NAME_COLUMNS),
+                " AND ".join('"' + token.replace('"', '""') + '"' for token in set(tokens)),
+            )
+            with self._connection() as conn:
+                candidates = [
+                    row_id for (row_id,) in conn.execute(
+                        "SELECT rowid FROM drugs_fts WHERE drugs_fts MATCH ? ORDER BY rowid", (match,)
+                    )
+                ]
+        else:
+            candidates = range(self.size)
+        return [
+            row_id for row_id in candidates
+            if any(pattern.search(values[row_id]) for values in self._lower)
+        ]
+
+    def records(self, rows, language):
+        if not rows:
+            return []
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"SELECT * FROM drugs WHERE row_id IN ({', '.join('?' * len(rows))})", list(rows)
+            )
+            columns = [d[0] for d in cursor.description]
+            fetched = {values[0]: dict(zip(columns, values)) for values in cursor}
+        text = self.labels[language]
+        return [compile_record(fetched[row_id], text) for row_id in rows]
+
+    def stats(self):
+        return {"backend": "sqlite", "rows": self.size, "database": self.db_path, "pool_size": self.pool_size}
+
+
+class SQLiteFacetIndex:
+    """``FacetIndex.query`` / ``rows`` answered by a SQLiteStore: FTS5 text filters, GROUP BY facet counts."""
+
+    def __init__(self, store, text_columns=TEXT_COLUMNS, facet_columns=FACET_COLUMNS):
+        self.store = store
+        self.text_columns = {name: col for name, col in text_columns.items() if col in store._columns}
+        self.facet_columns = [col for col in facet_columns if col in store._columns]
+        # Filters match facet values case-insensitively
+        self.facet_keys = {
+            col: {value.casefold(): value for (value,) in store.fetch(f"SELECT DISTINCT {_quote(col)} FROM drugs")}
+            for col in self.facet_columns
+        }
+
+    def _text_match(self, names, query):
+        """(condition, args) for rows where every query token is in one of the named columns; none without tokens."""
+        tokens = set(tokenize(query))
+        columns = [self.text_columns[name] for name in names if name in self.text_columns]
+        if not tokens or not columns:
+            return "0", []
+        expression = "{%s} : (%s)" % (
+            " ".join(map(_quote, columns)), " AND ".join('"' + token + '"' for token in sorted(tokens))
+        )
+        return "row_id IN (SELECT rowid FROM drugs_text WHERE drugs_text MATCH ?)", [expression]
+
+    def _facet_match(self, col, values):
+        keys = self.facet_keys.get(col, {})
+        matched = sorted({keys[value.casefold()] for value in values if value.casefold() in keys})
+        if not matched:
+            return "0", []
+        return f"{_quote(col)} IN ({', '.join('?' * len(matched))})", matched
+
+    @staticmethod
+    def _where(conditions):
+        conditions = [condition for condition in conditions if condition is not None]
+        if not conditions:
+            return "", []
+        return " WHERE " + " AND ".join(sql for sql, _ in conditions), [arg for _, args in conditions for arg in args]
+
+    def query(self, text=None, fields=None, facets=None):
+        """(matching row IDs, facet counts), as FacetIndex.query gives (bitmap, facet counts)."""
+        base = []
+        if text:
+            base.append(self._text_match(list(self.text_columns), text))
+        for name, value in (fields or {}).items():
+            if value:
+                base.append(self._text_match([name], value))
+        selected = {col: self._facet_match(col, values) for col, values in (facets or {}).items() if values}
+
+        where, args = self._where(base + list(selected.values()))
+        rows = [row_id for (row_id,) in self.store.fetch(f"SELECT row_id FROM drugs{where} ORDER BY row_id", args)]
+
+        counts = {}
+        for col in self.facet_columns:
+            where, args = self._where(base + [condition for other, condition in selected.items() if other != col])
+            col_counts = self.store.fetch(f"SELECT {_quote(col)}, COUNT(*) FROM drugs{where} GROUP BY 1", args)
+            counts[col] = dict(sorted(col_counts, key=lambda item: (-item[1], item[0])))
+        return rows, counts
+
+    def rows(self, rows):
+        return rows
+
+
+class SQLiteSubstituteGraph:
+    """``SubstituteGraph.substitutes`` answered by a SQLiteStore from its substitute tables."""
+
+    def __init__(self, store):
+        self.store = store
+        self.size = store.size
+        # Table rows' names (node IDs below size), for /substitutes' "matched"
+        self.names = store.names()["TradeName"].astype(str).tolist()
+        (self.node_count,) = store.fetch("SELECT COUNT(*) FROM substitute_nodes")[0]
+        (edges,) = store.fetch("SELECT COUNT(*) FROM substitute_edges")[0]
+        self.edge_count = edges // 2
+        self.class_keys = {cls.casefold(): cls for (cls,) in store.fetch("SELECT DISTINCT class FROM substitute_classes")}
+        self.within = lru_cache(maxsize=4096)(self._within)
+
+    def _within(self, sources, hops):
+        """{node: hop distance} for nodes within hops of any source, sources excluded."""
+        found = self.store.fetch(
+            "WITH RECURSIVE walk(node, hops) AS ("
+            " SELECT value, 0 FROM json_each(?)"
+            " UNION SELECT e.target, w.hops + 1 FROM walk w JOIN substitute_edges e ON e.source = w.node"
+            " WHERE w.hops < ?"
+            ") SELECT node, MIN(hops) FROM walk GROUP BY node HAVING MIN(hops) > 0",
+            (json.dumps(sources), hops),
+        )
+        return dict(found)
+
+    def substitutes(self, rows, hops=1, therapeutic_class=None):
+        """Same results, in the same order, as SubstituteGraph.substitutes."""
+        found = self.within(tuple(sorted(set(rows))), hops)
+        wanted = self.class_keys.get(therapeutic_class.casefold(), therapeutic_class) if therapeutic_class else None
+        nodes = {}
+        for node, name, scientific, cls in self.store.fetch(
+            "SELECT n.node, n.name, n.scientific_name, c.class FROM substitute_nodes n "
+            "LEFT JOIN substitute_classes c ON c.node = n.node WHERE n.node IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted(found)),),
+        ):
+            classes = nodes.setdefault(node, (name, scientific, set()))[2]
+            if cls is not None:
+                classes.add(cls)
+        results = []
+        for node in sorted(found):
+            name, scientific, classes = nodes[node]
+            if wanted is not None and wanted not in classes:
+                continue
+            item = {"name": name, "hops": found[node], "in_table": node < self.size}
+            if node < self.size:
+                item["scientific_name"] = scientific
+            item["therapeutic_classes"] = sorted(classes)
+            results.append(item)
+        results.sort(key=lambda item: (item["hops"], not item["in_table"], item["name"]))
+        return results
+
+    def stats(self):
+        return {
+            "nodes": self.node_count,
+            "table_rows": self.size,
+            "edges": self.edge_count,
+            "cached_lookups": self.within.cache_info().currsize,
+        }
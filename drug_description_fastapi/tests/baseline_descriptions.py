@@ -0,0 +1,60 @@
+"""The original table-scanning /search, kept as the reference the indexed service must match."""
+import re
+
+QUERIES = [
+    "panadol", "PANADOL", "  Panadol  ", "paracetamol", "panadol 500mg", "500mg", "tablet", "film-coated",
+    "amoxicillin", "atorvastatin", "metformin", "tab", "pan", "c", "0.5", "not-a-drug", "-", "",
+]
+
+
+def regex_search(df, query):
+    """The original /search row scan: ``\\b<query>\\b`` over the lowercased name columns."""
+    q = query.lower().strip()
+    pattern = rf"\b{re.escape(q)}\b"
+    mask = None
+    for col in ["TradeName", "ScientificName"]:
+        matches = df[col].astype(str).str.lower().str.contains(pattern, na=False, regex=True)
+        mask = matches if mask is None else mask | matches
+    return mask[mask].index.tolist()
+
+
+EN = {"use": "Use", "side": "Side Effects", "sub": "Substitutes", "tclass": "Therapeutic Class",
+      "cclass": "Chemical Class", "habit": "Habit Forming", "trade": "Trade Name", "sci": "Scientific Name",
+      "no_match": "No matching drug found."}
+AR = {"use": "الاستخدام", "side": "الأعراض الجانبية", "sub": "البدائل", "tclass": "الفئة العلاجية",
+      "cclass": "الفئة الكيميائية", "habit": "قابلية الإدمان", "trade": "الاسم التجاري", "sci": "الاسم العلمي",
+      "no_match": "لم يتم العثور على دواء مطابق."}
+
+
+def format_list(text):
+    if not isinstance(text, str):
+        return text
+    parts = [p.strip() for p in re.split(r"[;,]", text) if p.strip()]
+    return "\n".join(f"- {p}" for p in parts)
+
+
+def baseline_search(df, name, language="english", use=True, side=True, sub=True, tclass=True, cclass=True,
+                    habit=False):
+    """The original /search response, built by scanning the table row by row."""
+    text = AR if language == "arabic" else EN
+    results = df.loc[regex_search(df, name)]
+    if results.empty:
+        return {"query": name, "count": 0, "message": text["no_match"], "results": []}
+
+    data = []
+    for _, row in results.head(5).iterrows():
+        trade, sci = row.get("TradeName", "Unknown"), row.get("ScientificName", "Unknown")
+        if name.lower() in str(sci).lower():
+            item = {"main": f"{sci}", "secondary": f"{text['trade']}: {trade}"}
+        else:
+            item = {"main": f"{trade}", "secondary": f"{text['sci']}: {sci}"}
+        fields = [("use", "use", False), ("side", "sideEffect", True), ("sub", "substitute", True),
+                  ("tclass", "Therapeutic Class", False), ("cclass", "Chemical Class", False),
+                  ("habit", "Habit Forming", False)]
+        toggles = {"use": use, "side": side, "sub": sub, "tclass": tclass, "cclass": cclass, "habit": habit}
+        for toggle, col, is_list in fields:
+            if toggles[toggle]:
+                value = row.get(col, "Unknown")
+                item[text[toggle]] = format_list(value) if is_list else value
+        data.append(item)
+    return {"query": name, "count": len(data), "language": language, "results": data}
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# The baseline_* reference implementations
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def service_dir(monkeypatch):
+    """Data files are opened relative to the service directory, as when it is deployed."""
+    monkeypatch.chdir(SERVICE_DIR)
+
+
+@pytest.fixture(scope="session")
+def api():
+    os.chdir(SERVICE_DIR)
+    import drug_description_api
+
+    return drug_description_api
+
+
+@pytest.fixture(scope="session")
+def client(api):
+    from fastapi.testclient import TestClient
+
+    return TestClient(api.app)
+
+
+@pytest.fixture(scope="session")
+def df(api):
+    """The table exactly as the original service loaded it."""
+    import pandas as pd
+
+    df = pd.read_csv(os.path.join(SERVICE_DIR, "Drugs_discription.csv"), dtype=str, low_memory=False)
+    df.columns = df.columns.str.strip()
+    return df.dropna(how="all").drop_duplicates().fillna("Unknown").reset_index(drop=True)
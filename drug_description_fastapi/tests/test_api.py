@@ -0,0 +1,148 @@
+import os
+import time
+
+import pytest
+
+from medvision_common.drug_entities import read_artifact
+
+from baseline_descriptions import QUERIES, baseline_search
+
+
+@pytest.mark.parametrize("name", [query for query in QUERIES if query.strip()])
+@pytest.mark.parametrize("params", [
+    {},
+    {"language": "arabic"},
+    {"use": False, "side": False, "habit": True},
+])
+def test_search_matches_baseline(client, df, name, params):
+    response = client.get("/search", params={"name": name, **params}).json()
+    response.pop("mode", None)
+    assert response == baseline_search(df, name, **params)
+
+
+def test_search_resolves_through_entities(client, df):
+    # No row spells it "acetaminophen"; the entity links the PARACETAMOL rows
+    assert baseline_search(df, "acetaminophen")["count"] == 0
+    rows = client.get("/entity", params={"name": "acetaminophen"}).json()["entity"]["description_rows"]
+    response = client.get("/search", params={"name": "acetaminophen"}).json()
+    assert [item["main"] for item in response["results"]] == df.iloc[rows[:5]]["TradeName"].tolist()
+    substitutes = client.get("/substitutes", params={"name": "acetaminophen"}).json()
+    assert substitutes["matched"] == [item["main"] for item in response["results"]]
+
+
+def test_search_is_case_insensitive_and_cached(client):
+    first = client.get("/search", params={"name": "Panadol"}).json()
+    second = client.get("/search", params={"name": "PANADOL"}).json()
+    assert first["results"] == second["results"]
+    assert second["query"] == "PANADOL"
+
+
+def test_fuzzy_search_reports_distances(client):
+    response = client.get("/search", params={"name": "panadl", "mode": "fuzzy"}).json()
+    assert response["mode"] == "fuzzy"
+    assert response["count"] == 5
+    assert all(item["match_distance"] == 1 for item in response["results"])
+    assert all(item["main"].startswith("PANADOL") for item in response["results"])
+
+
+def test_arabic_search_finds_latin_names(client):
+    response = client.get("/search", params={"name": "بنادول"}).json()
+    assert response["count"] > 0
+    assert any("PANADOL" in item["main"] for item in response["results"])
+
+
+def test_search_bulk_renders_each_name_once(client, df):
+    names = ["panadol", "PANADOL", "metformin", "not-a-drug"]
+    response = client.post("/search_bulk", json={"names": names}).json()
+    assert response["count"] == 4
+    assert response["unique"] == 3
+    assert response["unmatched"] == ["not-a-drug"]
+    for name in names:
+        result = dict(response["results"][name])
+        result.pop("mode", None)
+        assert result == baseline_search(df, name)
+
+
+def test_query_pages_and_facets(client):
+    response = client.get("/query", params={"text": "pain", "tclass": "PAIN ANALGESICS", "page_size": 5}).json()
+    assert response["total"] > 5
+    assert response["pages"] == -(-response["total"] // 5)
+    assert len(response["results"]) == 5
+    assert response["facets"]["Therapeutic Class"]["PAIN ANALGESICS"] == response["total"]
+    second = client.get(
+        "/query", params={"text": "pain", "tclass": "PAIN ANALGESICS", "page_size": 5, "page": 2}
+    ).json()
+    assert {item["main"] for item in second["results"]}.isdisjoint(item["main"] for item in response["results"])
+
+
+def test_query_rejects_empty_filters(client):
+    # No word tokens: matches nothing rather than everything
+    assert client.get("/query", params={"side_effect": "!!!"}).json()["total"] == 0
+    assert client.get("/query", params={"text": " - "}).json()["total"] == 0
+    # The shipped table has no "Habit Forming" column
+    response = client.get("/query", params={"habit": "Yes"})
+    assert response.status_code == 400 and "Habit Forming" in response.json()["detail"]
+
+
+def test_substitutes_resolve_like_search(client):
+    response = client.get("/substitutes", params={"name": "panadol"}).json()
+    assert response["matched"] == [
+        item["main"] for item in client.get("/search", params={"name": "panadol"}).json()["results"]
+    ]
+    assert response["count"] == len(response["substitutes"]) > 0
+
+
+def test_suggest_prefix(client):
+    suggestions = client.get("/suggest", params={"prefix": "pana", "limit": 5}).json()["suggestions"]
+    assert suggestions
+    assert all(item["name"].lower().startswith("pana") for item in suggestions)
+    assert client.get("/suggest", params={"prefix": "بنا"}).json()["count"] > 0
+
+
+def test_entity_lookup(client):
+    response = client.get("/entity", params={"name": "paracetamol"}).json()
+    # Merged with the formulary's spelling of the same ingredient
+    assert response["entity"]["scientific_name"] == "Acetaminophen"
+    assert "PARACETAMOL" in response["entity"]["synonyms"]
+    assert response["count"] == 5
+    assert client.get("/entity", params={"name": "not-a-drug"}).json()["entity"] is None
+
+
+def test_entities_load_the_configured_artifact(api):
+    # The interaction service reads the same file (DRUG_ENTITIES_PATH, set by the root conftest)
+    artifact = read_artifact(os.environ["DRUG_ENTITIES_PATH"])
+    entities = api.reloader.current.entities
+    assert entities.sources == artifact["sources"] and entities.scientific == artifact["scientific"]
+    watched = {os.path.basename(path) for path in api.reloader.paths}
+    assert {"Drugs_discription.csv", "Complete_Saudi_Drugs_Database.csv", "DDI_data.csv"} <= watched
+
+
+@pytest.mark.parametrize("brand", ["panadol", "بنادول", "Lipitor", "Concor", "Glucophage"])
+def test_entity_brand_lookup_finds_description_rows(client, brand):
+    response = client.get("/entity", params={"name": brand}).json()
+    search = client.get("/search", params={"name": brand}).json()
+    assert search["count"] > 0
+    # The rows /search finds for the brand are linked to its entity, and listed first
+    found = [item["main"] for item in response["results"]]
+    assert found[:search["count"]] == [item["main"] for item in search["results"]]
+
+
+def test_health(client):
+    health = client.get("/health").json()
+    assert health["status"] == "ok"
+    assert health["storage"]["rows"] == 2515
+
+
+def test_admin_reload_swaps_state(api, client, monkeypatch):
+    monkeypatch.setenv("RELOAD_TOKEN", "s3cret")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    before, version = api.reloader.current, api.reloader.version
+    expected = client.get("/search", params={"name": "panadol"}).json()
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "s3cret"}).status_code == 202
+    deadline = time.monotonic() + 60
+    while api.reloader.version == version and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert api.reloader.current is not before
+    assert client.get("/health").json()["data"]["version"] == version + 1
+    assert client.get("/search", params={"name": "panadol"}).json() == expected
@@ -0,0 +1,99 @@
+import pytest
+
+from drug_index import FacetIndex, FuzzyNameIndex, NameIndex, allowed_distance, edit_distance, tokenize
+from medvision_common.arabic_names import PhoneticIndex
+
+from baseline_descriptions import QUERIES, regex_search
+
+
+@pytest.fixture(scope="module")
+def name_index(df):
+    return NameIndex(df)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_name_index_matches_regex_scan(df, name_index, query):
+    assert name_index.search(query) == regex_search(df, query)
+
+
+def fuzzy_scan(name_index, query, max_distance):
+    """Every row scored against every name token by brute force."""
+    scores = {}
+    for row_id in range(name_index.size):
+        tokens = {token for values in name_index.names for token in tokenize(values[row_id])}
+        total = 0
+        for word in set(tokenize(query)):
+            budget = allowed_distance(word, max_distance)
+            distances = [edit_distance(word, token) for token in tokens]
+            best = min((d for d in distances if d <= budget), default=None)
+            if best is None:
+                break
+            total += best
+        else:
+            scores[row_id] = total
+    return sorted(scores.items(), key=lambda item: (item[1], item[0]))
+
+
+@pytest.mark.parametrize("query", ["panadl", "paracetmol 500mg", "atorvastatine", "amoxicilin", "xq"])
+def test_fuzzy_index_matches_brute_force(name_index, query):
+    fuzzy = FuzzyNameIndex(name_index, max_distance=2)
+    assert fuzzy.search(query, 2) == fuzzy_scan(name_index, query, 2)
+
+
+def test_fuzzy_index_ranks_exact_rows_first(name_index):
+    rows = FuzzyNameIndex(name_index).search("panadol")
+    assert rows[0][1] == 0
+    assert [row_id for row_id, distance in rows if distance == 0] == name_index.search("panadol")
+
+
+def test_phonetic_index_finds_latin_names_from_arabic(df):
+    index = PhoneticIndex([df["TradeName"].tolist(), df["ScientificName"].tolist()])
+    panadol = df.index[df["TradeName"].str.contains("PANADOL")].tolist()
+    rows = [row_id for row_id, _ in index.search("بنادول")]
+    assert panadol and set(panadol) <= set(rows)
+
+    rows = index.lookup("باراسيتامول")
+    assert rows and all(df["ScientificName"].iloc[row_id] == "PARACETAMOL" for row_id in rows)
+    assert index.search("xq") == []
+
+
+def text_mask(df, columns, query):
+    mask = None
+    for token in set(tokenize(query)):
+        hit = None
+        for col in columns:
+            cells = df[col].astype(str)
+            words = cells.map(lambda value: value != "Unknown" and token in tokenize(value))
+            hit = words if hit is None else hit | words
+        mask = hit if mask is None else mask & hit
+    return mask
+
+
+def value_counts(values):
+    return dict(sorted(values.value_counts().items(), key=lambda item: (-item[1], item[0])))
+
+
+@pytest.mark.parametrize("text, fields, facets", [
+    ("headache", {}, {}),
+    (None, {"side_effect": "nausea"}, {"Therapeutic Class": ["PAIN ANALGESICS"]}),
+    (None, {"indication": "pain relief"}, {"Therapeutic Class": ["pain analgesics", "CARDIAC"]}),
+    ("infection", {"substitute": "tablet"}, {}),
+])
+def test_facet_index_matches_masks(df, text, fields, facets):
+    index = FacetIndex(df)
+    bitmap, counts = index.query(text=text, fields=fields, facets=facets)
+
+    mask = df.index >= 0
+    if text:
+        mask &= text_mask(df, ["sideEffect", "use", "substitute"], text)
+    columns = {"side_effect": "sideEffect", "indication": "use", "substitute": "substitute"}
+    for name, value in fields.items():
+        mask &= text_mask(df, [columns[name]], value)
+    base = mask.copy()
+    for col, values in facets.items():
+        mask &= df[col].str.casefold().isin([value.casefold() for value in values])
+
+    assert index.rows(bitmap) == df.index[mask].tolist()
+    # Each facet is counted under every filter but its own selection
+    assert counts["Chemical Class"] == value_counts(df.loc[mask, "Chemical Class"])
+    assert counts["Therapeutic Class"] == value_counts(df.loc[base, "Therapeutic Class"])
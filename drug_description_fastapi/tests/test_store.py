@@ -0,0 +1,74 @@
+import pytest
+
+from drug_graph import SubstituteGraph
+from drug_index import FACET_COLUMNS, TEXT_COLUMNS, FacetIndex
+from drug_store import PandasStore, SQLiteFacetIndex, SQLiteStore, SQLiteSubstituteGraph, build_database
+
+from baseline_descriptions import QUERIES
+
+
+@pytest.fixture(scope="module")
+def stores(api, df, tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("drug_store") / "drugs.sqlite3")
+    build_database(df, db_path)
+    return PandasStore(df, api.LABELS), SQLiteStore(db_path, api.LABELS, pool_size=2)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_sqlite_store_matches_pandas_store(stores, query):
+    pandas_store, sqlite_store = stores
+    rows = pandas_store.search(query)
+    assert sqlite_store.search(query) == rows
+    for language in ["english", "arabic"]:
+        assert sqlite_store.records(rows[:5], language) == pandas_store.records(rows[:5], language)
+
+
+def test_sqlite_store_columns_match(stores):
+    pandas_store, sqlite_store = stores
+    columns = ["TradeName", "ScientificName", "substitute", "Therapeutic Class"]
+    assert sqlite_store.columns(columns).values.tolist() == pandas_store.columns(columns).values.tolist()
+
+
+@pytest.fixture(scope="module")
+def sql_indexes(df, stores):
+    _, sqlite_store = stores
+    memory = (
+        FacetIndex(df[[col for col in list(TEXT_COLUMNS.values()) + FACET_COLUMNS if col in df.columns]]),
+        SubstituteGraph(df),
+    )
+    return memory, (SQLiteFacetIndex(sqlite_store), SQLiteSubstituteGraph(sqlite_store))
+
+
+@pytest.mark.parametrize("text, fields, facets", [
+    (None, {}, {}),
+    ("pain", {}, {}),
+    ("headache nausea", {}, {}),
+    (None, {"side_effect": "dizziness"}, {}),
+    (None, {"indication": "infection", "side_effect": "nausea"}, {}),
+    (None, {"substitute": "tablet"}, {}),
+    (None, {}, {"Therapeutic Class": ["ANTI INFECTIVES"]}),
+    ("pain", {}, {"Therapeutic Class": ["pain analgesics", "NEURO CNS"], "Chemical Class": ["Unknown"]}),
+    (None, {"side_effect": "rash"}, {"Chemical Class": ["no such class"]}),
+    ("zzzunknownword", {}, {}),
+    (None, {"side_effect": "!!!"}, {}),
+    ("pain", {"no_such_field": "pain"}, {"no such column": ["x"]}),
+])
+def test_sql_facet_queries_match_memory(sql_indexes, text, fields, facets):
+    (memory, _), (sql, _) = sql_indexes
+    bitmap, counts = memory.query(text, fields, facets)
+    rows, sql_counts = sql.query(text, fields, facets)
+    assert sql.rows(rows) == memory.rows(bitmap)
+    assert sql_counts == counts
+
+
+@pytest.mark.parametrize("hops", [1, 2, 3])
+def test_sql_substitutes_match_memory(df, sql_indexes, hops):
+    (_, memory), (_, sql) = sql_indexes
+    listed = [row_id for row_id, value in enumerate(df["substitute"].astype(str)) if value != "Unknown"]
+    for rows in [[row_id] for row_id in listed[::97]] + [listed[:3]]:
+        assert sql.substitutes(rows, hops) == memory.substitutes(rows, hops)
+        tclass = memory.node_classes[rows[0]]
+        for cls in sorted(tclass):
+            assert sql.substitutes(rows, hops, cls.lower()) == memory.substitutes(rows, hops, cls.lower())
+    stats = memory.stats()
+    assert {**sql.stats(), "cached_lookups": 0} == {**stats, "cached_lookups": 0}
@@ -7,6 +7,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from streamlit.components.v1 import html
 
+from medvision_common.ddi_store import load_ddi
+
 # ==============================
 # PAGE CONFIGURATION
 # ==============================
@@ -128,11 +130,13 @@ def get_text(key):
 # ==============================
 # LOAD DATA
 # ==============================
-@st.cache_data
+# One shared copy per process (not one per session); the table is only read
+@st.cache_resource
 def load_data():
     # Create sample data if file doesn't exist
     try:
-        df = pd.read_csv("DDI_data.csv")
+        # Interned codes from DDI_data.ddi (rebuilt from the CSV when it changes), as categorical columns
+        df = load_ddi("DDI_data.csv").frame(categorical=True)
     except:
         # Sample data for demonstration
         data = {
@@ -326,12 +330,13 @@ with tab1:
     # Network Analysis (Simplified)
     st.subheader("🕸️ Drug Interaction Network Overview")
     
-    # Create a simple network summary
-    interaction_matrix = pd.crosstab(data['drug1_name'], data['drug2_name'])
+    # Create a simple network summary: only edges among the top drugs are tabulated, not the full drug x drug matrix
     top_drugs_network = drug_counts.head(8).index
+    among_top = data['drug1_name'].isin(top_drugs_network) & data['drug2_name'].isin(top_drugs_network)
+    interaction_matrix = pd.crosstab(data.loc[among_top, 'drug1_name'], data.loc[among_top, 'drug2_name'])
     
     st.write("**Top Drugs Interaction Matrix (Sample)**")
-    sample_matrix = interaction_matrix.loc[top_drugs_network, top_drugs_network]
+    sample_matrix = interaction_matrix.reindex(index=top_drugs_network, columns=top_drugs_network, fill_value=0)
     st.dataframe(sample_matrix.replace(0, ""), use_container_width=True)
 
 # ==============================
@@ -0,0 +1,446 @@
+"""
+Benchmarks for the drug interaction lookups.
+
+Run from this directory:
+
+    python benchmark.py
+
+The DDI table is synthetic: random pairs over the Saudi formulary's
+scientific names, scaled up to millions of rows, so per-query latency can be
+compared against the table size.
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from medvision_common.ddi_store import DDITable, read_artifact
+
+import main
+from ddi_backends import MemoryStore, SQLiteDriver, SQLStore, ensure_tables
+from ddi_graph import InteractionGraph
+from ddi_index import NameMatchIndex, PairIndex
+from ddi_payloads import PayloadStore
+
+SCALES = [10_000, 100_000, 1_000_000, 4_000_000]
+INTERACTION_TYPES = [
+    "Increased bleeding risk", "Hypoglycemia", "Hyperkalemia", "Rhabdomyolysis", "Reduced efficacy",
+    "Reduced absorption", "Bradycardia", "Increased statin levels", "Electrolyte imbalance",
+]
+
+
+def synthetic_ddi(names, size, seed=0):
+    """size DrugBank-shaped rows between random pairs of names (repeats and both orders included)."""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"DB{i:05d}" for i in range(len(names))], dtype=object)
+    names = np.array(names, dtype=object)
+    drug1, drug2 = rng.integers(len(names), size=size), rng.integers(len(names), size=size)
+    return pd.DataFrame({
+        "drug1_id": ids[drug1],
+        "drug2_id": ids[drug2],
+        "drug1_name": names[drug1],
+        "drug2_name": names[drug2],
+        "interaction_type": np.array(INTERACTION_TYPES, dtype=object)[rng.integers(len(INTERACTION_TYPES), size=size)],
+    })
+
+
+def with_ddi(base, ddi):
+    """The service state with ddi (a DataFrame) as its DDI table, interned as at load time."""
+    table = DDITable.from_frame(ddi)
+    pair_index = PairIndex(table)
+    name_index = NameMatchIndex(table, pair_index)
+    graph = InteractionGraph(table, pair_index)
+    return SimpleNamespace(**{
+        **vars(base), "ddi_data": table, "pair_index": pair_index, "name_index": name_index,
+        "payloads": PayloadStore(table, name_index, base.resolver), "graph": graph,
+        "store": MemoryStore(table, pair_index, graph), "entity_nodes": base.entities.ddi_nodes(pair_index.ids),
+    })
+
+
+LOOP = asyncio.new_event_loop()
+
+
+def run(coroutine):
+    """Run a coroutine on the benchmark's one event loop."""
+    return LOOP.run_until_complete(coroutine)
+
+
+def mask_check(data, ddi_data, drug1, drug2):
+    """The original two-direction mask lookup over the DDI DataFrame, kept as the reference implementation."""
+    sci1, brand1 = main.search_drug_name(data, drug1)
+    sci2, brand2 = main.search_drug_name(data, drug2)
+    if sci1 is None or sci2 is None:
+        return None
+    mask1 = (ddi_data['drug1_name'].str.lower() == sci1.lower()) & (ddi_data['drug2_name'].str.lower() == sci2.lower())
+    mask2 = (ddi_data['drug1_name'].str.lower() == sci2.lower()) & (ddi_data['drug2_name'].str.lower() == sci1.lower())
+    interaction = ddi_data[mask1 | mask2]
+    if interaction.empty:
+        return None
+    row = interaction.iloc[0].to_dict()
+    row['drug1_brand'] = brand1
+    row['drug2_brand'] = brand2
+    row['drug1_scientific'] = sci1
+    row['drug2_scientific'] = sci2
+    return row
+
+
+def without_brand_lists(row):
+    """Drop the drug1_brands / drug2_brands lists, which the reference implementations don't produce."""
+    return row if row is None else {k: v for k, v in row.items() if not k.endswith("_brands")}
+
+
+def unordered(rows):
+    """Rows in a canonical order, for comparing results whose row order differs."""
+    return sorted(rows, key=lambda row: [repr(value) for value in row.values()])
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(*q)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def sample_pairs(names, trades, n, ddi, seed=0):
+    """Half pairs from the table (either order, any case), half scientific/brand/unknown names."""
+    rng = random.Random(seed)
+    pool = names + trades + [name.upper() for name in names[:50]] + ["not-a-drug"]
+    pairs = []
+    for _ in range(n // 2):
+        a, b = ddi.iloc[rng.randrange(len(ddi))][["drug1_name", "drug2_name"]]
+        pairs.append((b.lower(), a) if rng.random() < 0.5 else (a, b))
+    return pairs + [(rng.choice(pool), rng.choice(pool)) for _ in range(n - n // 2)]
+
+
+def bench_check_interaction(base):
+    print("== /check_interaction: column masks vs canonical pair index")
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    trades = base.saudi_drugs["trade_name_saudi"].dropna().astype(str).tolist()
+    for size in SCALES:
+        ddi = synthetic_ddi(names, size)
+        start = time.perf_counter()
+        data = with_ddi(base, ddi)
+        build_s = time.perf_counter() - start
+
+        # The mask reference costs a full-table pass per query, so it is sampled more sparsely as the table grows
+        checked = sample_pairs(names, trades, max(20, 2_000_000 // size), ddi, seed=size)
+        mismatches = sum(mask_check(data, ddi, *q) != without_brand_lists(run(main.check_drug_interaction(data, *q))) for q in checked)
+        mask_ms = timed(lambda a, b: mask_check(data, ddi, a, b), checked[:20])
+
+        queries = sample_pairs(names, trades, 2000, ddi, seed=1)
+        resolved = [main.search_drug_name(data, a)[0] for a, _ in queries], [main.search_drug_name(data, b)[0] for _, b in queries]
+        resolved = [(a, b) for a, b in zip(*resolved) if a is not None and b is not None]
+        lookup_ms = timed(data.pair_index.lookup, resolved)
+        check_ms = timed(lambda a, b: run(main.check_drug_interaction(data, a, b)), queries)
+        print(f"rows={size:>8}  pairs={data.pair_index.stats()['pairs']:>8}  build={build_s:6.2f} s  "
+              f"masks={mask_ms:8.2f} ms  index check={check_ms:6.3f} ms  pair lookup={1000 * lookup_ms:5.2f} us  "
+              f"mismatches={mismatches}/{len(checked)}")
+
+
+def apply_find_interactions(data, ddi_data, drug_name):
+    """The original per-row .apply enrichment (two formulary scans per result row), kept as the reference."""
+    saudi_drugs = data.saudi_drugs
+
+    def scan_brand(name):
+        name = name.strip().lower()
+        for col in ["scientific_name", "trade_name_saudi"]:
+            match = saudi_drugs[saudi_drugs[col].str.lower() == name]
+            if not match.empty:
+                return match.iloc[0]["trade_name_saudi"]
+        return None
+
+    sci_name, _ = main.search_drug_name(data, drug_name)
+    if sci_name is None:
+        return []
+    mask1 = ddi_data['drug1_name'].str.lower().str.contains(sci_name.lower(), na=False)
+    mask2 = ddi_data['drug2_name'].str.lower().str.contains(sci_name.lower(), na=False)
+    results = pd.concat([ddi_data.loc[mask1], ddi_data.loc[mask2]]).drop_duplicates()
+    if results.empty:
+        return []
+    results['drug1_brand'] = results['drug1_name'].apply(scan_brand)
+    results['drug2_brand'] = results['drug2_name'].apply(scan_brand)
+    return results.to_dict(orient="records")
+
+
+def bench_find_interactions(base):
+    print("== /search_drug: per-row .apply name resolution vs resolver join")
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    rng = random.Random(3)
+    queries = rng.sample(names, 10)
+    for size in SCALES[:3]:
+        ddi = synthetic_ddi(names, size)
+        data = with_ddi(base, ddi)
+        rows = sum(len(json.loads(main.find_interactions(data, q))) for q in queries) / len(queries)
+        mismatches = 0
+        for q in queries[:3]:
+            new = [without_brand_lists(row) for row in json.loads(main.find_interactions(data, q))]
+            # Rows now come grouped by ranked match instead of in table order
+            mismatches += unordered(new) != unordered(apply_find_interactions(data, ddi, q))
+        apply_ms = timed(lambda q: apply_find_interactions(data, ddi, q), [(q,) for q in queries[:3]])
+        data.payloads.interactions.cache_clear()
+        join_ms = timed(lambda q: main.find_interactions(data, q), [(q,) for q in queries])
+        print(f"rows={size:>8}  results={rows:7.0f}/query  apply={apply_ms:9.1f} ms  join={join_ms:7.1f} ms  "
+              f"speedup={apply_ms / join_ms:6.1f}x  mismatches={mismatches}")
+
+
+def frame_find_interactions(data, drug_name, match="substring"):
+    """The DataFrame path /search_drug used before payloads were pre-encoded, kept as the reference."""
+    sci_name, _ = main.search_drug_name(data, drug_name)
+    if sci_name is None:
+        return []
+    matches = data.name_index.match(sci_name, match)
+    if not matches:
+        return []
+    positions = np.concatenate([data.name_index.rows(name_id) for name_id, _ in matches])
+    _, first = np.unique(positions, return_index=True)
+    results = data.ddi_data.frame(positions[np.sort(first)]).drop_duplicates()
+    if results.empty:
+        return []
+    brand1, brands1 = data.resolver.join(results["drug1_name"])
+    brand2, brands2 = data.resolver.join(results["drug2_name"])
+    results = results.assign(drug1_brand=brand1, drug2_brand=brand2, drug1_brands=brands1, drug2_brands=brands2)
+    return results.to_dict(orient="records")
+
+
+def bench_payloads(base):
+    print("== /search_drug body: DataFrame + to_dict + JSON encode vs pre-encoded payloads (cold / cached)")
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    queries = random.Random(4).sample(names, 10)
+    for size in SCALES[:3]:
+        # A few exact repeats, which the lists must drop as drop_duplicates did
+        ddi = synthetic_ddi(names, size)
+        ddi = pd.concat([ddi, ddi.sample(frac=0.01, random_state=0)], ignore_index=True)
+        data = with_ddi(base, ddi)
+        start = time.perf_counter()
+        PayloadStore(data.ddi_data, data.name_index, data.resolver)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        mismatches = sum(
+            json.loads(main.find_interactions(data, q)) != frame_find_interactions(data, q) for q in queries[:3]
+        )
+        frame_ms = timed(lambda q: main.json_bytes(frame_find_interactions(data, q)), [(q,) for q in queries])
+        data.payloads.interactions.cache_clear()
+        cold_ms = timed(lambda q: main.find_interactions(data, q), [(q,) for q in queries])
+        cached_ms = timed(lambda q: main.find_interactions(data, q), [(q,) for q in queries])
+        print(f"rows={len(ddi):>8}  build={build_ms:6.1f} ms  frame={frame_ms:7.2f} ms  cold={cold_ms:6.2f} ms  "
+              f"cached={cached_ms:6.4f} ms  speedup={frame_ms / cold_ms:5.1f}x / {frame_ms / cached_ms:7.0f}x  "
+              f"mismatches={mismatches}")
+
+
+def synthetic_names(count, seed=0):
+    """count distinct DrugBank-like names: one to three words, some with salt forms."""
+    rng = random.Random(seed)
+    stems = ["ami", "ator", "bupro", "cef", "clo", "dexa", "eso", "flu", "keto", "levo", "met", "nitro",
+             "ome", "pra", "rosu", "sulfa", "tri", "vals", "war", "zol"]
+    endings = ["vastatin", "prazole", "mycin", "cillin", "formin", "sartan", "olol", "pril", "oxacin", "farin",
+               "dipine", "azole", "tidine", "profen", "lukast"]
+    salts = ["", "", "", " hydrochloride", " sodium", " potassium", " maleate", " sulfate"]
+    names = set()
+    while len(names) < count:
+        name = rng.choice(stems) + rng.choice(stems) + rng.choice(endings) + rng.choice(salts)
+        if rng.random() < 0.2:
+            name += f" {rng.randrange(1000)}"
+        names.add(name.capitalize())
+    return sorted(names)
+
+
+def bench_name_match(base):
+    print("== Partial name match: str.contains over the name vocabulary vs token / trigram index")
+    for count in [4_000, 40_000, 400_000]:
+        names = synthetic_names(count)
+        data = with_ddi(base, synthetic_ddi(names, count * 5))
+        vocabulary = pd.Series(list(data.name_index.names), dtype=object)
+        queries = random.Random(5).sample(names, 20)
+        partial = [name.lower().split()[0][2:9] for name in queries]
+
+        mismatches = 0
+        for q in partial[:5]:
+            expected = set(np.flatnonzero(vocabulary.str.contains(q, regex=False)).tolist())
+            mismatches += expected != {name_id for name_id, _ in data.name_index.match(q, "substring")}
+        scan_ms = timed(lambda q: vocabulary.str.contains(q, regex=False), [(q,) for q in partial[:5]])
+        exact_ms = timed(lambda q: data.name_index.match(q, "exact"), [(q,) for q in queries])
+        token_ms = timed(lambda q: data.name_index.match(q.split()[0], "token"), [(q,) for q in queries])
+        substring_ms = timed(lambda q: data.name_index.match(q, "substring"), [(q,) for q in partial])
+        print(f"names={count:>7}  scan={scan_ms:7.2f} ms  exact={exact_ms:6.3f} ms  token={token_ms:6.3f} ms  "
+              f"substring={substring_ms:6.3f} ms  speedup={scan_ms / substring_ms:6.1f}x  mismatches={mismatches}")
+
+
+def bench_regimen(base):
+    print("== Medication list: one /check_regimen vs pairwise /check_interaction calls (1M-row DDI table)")
+    from fastapi.testclient import TestClient
+
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    data = with_ddi(base, synthetic_ddi(names, 1_000_000))
+    main.reloader.current = data
+    client = TestClient(main.app)
+    rng = random.Random(6)
+    # Regimens drawn from a few hundred common drugs, so pairs actually interact
+    common = rng.sample(names, 300)
+    try:
+        for size in [5, 10, 20, 50]:
+            regimens = [rng.sample(common, size) for _ in range(10)]
+            found = 0
+            mismatches = 0
+            for regimen in regimens:
+                result = run(main.check_regimen(data, regimen))
+                found += result["interaction_count"]
+                pairwise = [
+                    {"drug1": a, "drug2": b, "interaction": run(main.check_drug_interaction(data, a, b))}
+                    for i, a in enumerate(regimen) for b in regimen[i + 1:]
+                ]
+                mismatches += result["interactions"] != [item for item in pairwise if item["interaction"] is not None]
+
+            start = time.perf_counter()
+            for regimen in regimens[:3]:
+                for i, a in enumerate(regimen):
+                    for b in regimen[i + 1:]:
+                        client.post("/check_interaction", json={"drug1": a, "drug2": b})
+            pairwise_ms = 1000 * (time.perf_counter() - start) / 3
+            start = time.perf_counter()
+            for regimen in regimens:
+                client.post("/check_regimen", json={"drugs": regimen})
+            regimen_ms = 1000 * (time.perf_counter() - start) / len(regimens)
+            print(f"drugs={size:>3}  pairs={size * (size - 1) // 2:>5}  interacting={found / len(regimens):6.1f}  "
+                  f"pairwise={pairwise_ms:8.2f} ms  regimen={regimen_ms:6.2f} ms  "
+                  f"speedup={pairwise_ms / regimen_ms:5.1f}x  mismatches={mismatches}")
+    finally:
+        main.reloader.current = base
+
+
+# Peak RSS is read from VmHWM, after the parent's pages are out of the picture
+LOAD_PROBE = """
+import sys, time
+start = time.perf_counter()
+import pandas as pd
+from medvision_common.ddi_store import build_artifact, read_artifact
+if sys.argv[1] == "csv":
+    table = pd.read_csv(sys.argv[2])
+elif sys.argv[1] == "build":
+    build_artifact(sys.argv[2], sys.argv[3])
+else:
+    table = read_artifact(sys.argv[3])
+    table.codes["drug1_name"].sum()
+elapsed = time.perf_counter() - start
+status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+print(1000 * elapsed, int(status["VmHWM"].split()[0]) / 1024)
+"""
+
+
+def bench_compact(base):
+    print("== DDI table storage: pandas strings vs interned int codes (memory-mapped artifact)")
+    here = os.path.dirname(os.path.abspath(__file__))
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [1_000_000, 4_000_000]:
+            ddi = synthetic_ddi(names, size)
+            csv_path = os.path.join(tmp, f"ddi_{size}.csv")
+            artifact_path = os.path.join(tmp, f"ddi_{size}.ddi")
+            ddi.to_csv(csv_path, index=False)
+            frame_mb = pd.read_csv(csv_path).memory_usage(deep=True).sum() / 2 ** 20
+            row = [f"rows={size:>8}"]
+            for mode in ["csv", "build", "mmap"]:
+                out = subprocess.run(
+                    [sys.executable, "-c", LOAD_PROBE, mode, csv_path, artifact_path],
+                    capture_output=True, text=True, check=True, cwd=here,
+                ).stdout.split()
+                row.append(f"{mode}={float(out[0]):7.0f} ms peak={float(out[1]):6.0f} MB")
+            stats = read_artifact(artifact_path).stats()
+            print("  ".join(row))
+            print(f"{'':13}pandas={frame_mb / size * 1e6:6.1f} MB/M pairs  codes={stats['mb_per_million_pairs']:5.1f} MB/M pairs  "
+                  f"file={os.path.getsize(artifact_path) / 2 ** 20:6.1f} MB")
+
+
+def bench_storage(base):
+    print("== Pair / neighbour lookups: memory store vs SQLite store (async pool, prepared statements)")
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    trades = base.saudi_drugs["trade_name_saudi"].dropna().astype(str).tolist()
+    for size in SCALES[:3]:
+        ddi = synthetic_ddi(names, size)
+        data = with_ddi(base, ddi)
+        pairs = [
+            (main.search_drug_name(data, a)[0], main.search_drug_name(data, b)[0])
+            for a, b in sample_pairs(names, trades, 400, ddi, seed=2)
+        ]
+        pairs = [(a, b) for a, b in pairs if a is not None and b is not None]
+        drugs = random.Random(2).sample(names, 50)
+        with tempfile.TemporaryDirectory() as tmp:
+            driver = SQLiteDriver(os.path.join(tmp, "ddi.sqlite3"))
+            start = time.perf_counter()
+            ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+            build_s = time.perf_counter() - start
+            memory = data.store
+            for pool_size in [1, 4]:
+                sql = SQLStore(driver, data.ddi_data.columns, pool_size=pool_size)
+                mismatches = sum(run(memory.pair(a, b)) != run(sql.pair(a, b)) for a, b in pairs)
+                mismatches += sum(run(memory.neighbours(d)) != run(sql.neighbours(d)) for d in drugs)
+                mismatches += sum(
+                    run(memory.neighbours(d, "hypoglycemia")) != run(sql.neighbours(d, "hypoglycemia")) for d in drugs
+                )
+
+                async def burst(store):
+                    # 200 lookups in flight at once, as concurrent requests would issue them
+                    await asyncio.gather(*(store.pair(a, b) for a, b in pairs[:200]))
+
+                memory_ms = timed(lambda: run(burst(memory)), [()] * 5)
+                sql_ms = timed(lambda: run(burst(sql)), [()] * 5)
+                latency = sql.stats()["latency"]
+                print(f"rows={size:>8}  build={build_s:5.2f} s  pool={pool_size}  burst of 200: memory={memory_ms:6.2f} ms "
+                      f"sql={sql_ms:7.2f} ms  pair p50={latency['pair']['p50_ms']:.3f} ms  "
+                      f"neighbours p50={latency['neighbours']['p50_ms']:.3f} ms  waits={sql.pool.waits}  "
+                      f"mismatches={mismatches}")
+
+
+def scan_neighbours(ddi, name):
+    """Interacting drugs by masking the whole table, the flat-table reference."""
+    name = name.lower()
+    lower1, lower2 = ddi["drug1_name"].str.lower(), ddi["drug2_name"].str.lower()
+    return set(lower2[lower1 == name]) | set(lower1[lower2 == name])
+
+
+def bench_graph(base):
+    print("== Interaction graph: table masks vs CSR graph (neighbors / 2-hop / shared / hubs)")
+    from ddi_graph import InteractionGraph
+
+    names = base.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    rng = random.Random(7)
+    for size in SCALES[1:]:
+        ddi = synthetic_ddi(names, size)
+        data = with_ddi(base, ddi)
+        start = time.perf_counter()
+        graph = InteractionGraph(data.ddi_data, data.pair_index)
+        build_s = time.perf_counter() - start
+        queries = rng.sample(names, 20)
+
+        mismatches = 0
+        for name in queries[:3]:
+            expected = scan_neighbours(ddi, name) - {name.lower()}
+            mismatches += expected != {item["name"].lower() for item in graph.interactions(graph.node(name))}
+        scan_ms = timed(lambda q: scan_neighbours(ddi, q), [(q,) for q in queries[:3]])
+        neighbours_ms = timed(lambda q: graph.interactions(graph.node(q)), [(q,) for q in queries])
+        graph.within.cache_clear()
+        within_ms = timed(lambda q: graph.reachable(graph.node(q), 2), [(q,) for q in queries])
+        shared_ms = timed(lambda a, b: graph.shared(graph.node(a), graph.node(b)), list(zip(queries, queries[1:])))
+        hubs_ms = timed(lambda: graph.top_hubs(20), [()] * 100)
+        print(f"rows={size:>8}  edges={graph.edge_count:>8}  build={build_s:5.2f} s  scan={scan_ms:7.1f} ms  "
+              f"neighbors={neighbours_ms:6.2f} ms  2-hop={within_ms:6.2f} ms  shared={shared_ms:5.2f} ms  "
+              f"hubs={hubs_ms:5.3f} ms  mismatches={mismatches}")
+
+
+if __name__ == "__main__":
+    base = main.reloader.current
+    bench_check_interaction(base)
+    bench_find_interactions(base)
+    bench_name_match(base)
+    bench_payloads(base)
+    bench_regimen(base)
+    bench_compact(base)
+    bench_graph(base)
+    bench_storage(base)
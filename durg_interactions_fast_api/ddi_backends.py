@@ -0,0 +1,392 @@
+"""
+Storage backends for the pair and neighbour lookups.
+
+``MemoryStore`` answers from the in-process ``PairIndex`` and
+``InteractionGraph``. The stores serve /check_interaction, /check_regimen and
+/interactions/neighbors; the multi-hop endpoints (/interactions/within,
+/shared, /hubs), /entity and the export walk the in-memory graph whichever
+backend is configured. ``SQLStore`` answers from a SQL database through an
+async connection pool, with the lookups as prepared statements over three
+tables:
+
+- ``ddi_names``: one row per lowercased DDI drug name (the ``PairIndex`` IDs)
+  with its display name.
+- ``ddi_edges``: each interacting pair in both directions with the row of its
+  first interaction, keyed ``(source, target)`` plus a ``(source, type_key,
+  target)`` index for type-filtered neighbours.
+- ``ddi_rows``: those first interaction rows.
+
+Two drivers are provided: ``SQLiteDriver`` (stdlib sqlite3 run in worker
+threads; an embedded stand-in that needs nothing installed) and
+``PostgresDriver`` (asyncpg, imported only when used; its table setup runs
+on a worker thread with its own event loop, so it also works when called
+under the serving loop). Statements are
+written with ``$n`` parameters, which SQLite reads as ``?n``. The tables
+are rebuilt whenever the DDI data changes (a digest is stored in
+``ddi_meta``).
+
+Both stores return the same records in the same order, so responses do not
+depend on ``DDI_STORAGE_BACKEND``. A reload builds a new store (a rebuilt
+SQLite file is only visible to new connections) and closes the previous
+one: its idle connections at once, the ones still serving in-flight
+requests as they are released.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+PARAM_RE = re.compile(r"\$(\d+)")
+LATENCY_SAMPLES = 1024
+
+
+def _run_in_thread(coroutine_function):
+    """Run a coroutine on a fresh event loop in a worker thread; safe whether or not the caller's thread has one running."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(lambda: asyncio.run(coroutine_function())).result()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_digest(ddi):
+    """SHA-256 of a DDI table's vocabularies and codes: changes whenever its content does."""
+    sha = hashlib.sha256(json.dumps(
+        [ddi.columns, {name: values.tolist() for name, values in ddi.vocabularies.items()}]
+    ).encode())
+    for column in ddi.columns:
+        sha.update(np.ascontiguousarray(ddi.codes[column]).tobytes())
+    return sha.hexdigest()
+
+
+def schema(columns):
+    return [
+        "CREATE TABLE ddi_meta (key TEXT PRIMARY KEY, value TEXT)",
+        "CREATE TABLE ddi_names (id INTEGER PRIMARY KEY, name TEXT NOT NULL, name_key TEXT NOT NULL UNIQUE)",
+        f"CREATE TABLE ddi_rows (row_id INTEGER PRIMARY KEY, {', '.join(_quote(c) + ' TEXT' for c in columns)})",
+        "CREATE TABLE ddi_edges (source INTEGER NOT NULL, target INTEGER NOT NULL, row_id INTEGER NOT NULL, "
+        "interaction_type TEXT, type_key TEXT, PRIMARY KEY (source, target))",
+        "CREATE INDEX ddi_edges_type ON ddi_edges (source, type_key, target)",
+    ]
+
+
+def statements(columns):
+    name_id = "(SELECT id FROM ddi_names WHERE name_key = ${})"
+    neighbours = (
+        "SELECT n.name, e.interaction_type FROM ddi_edges e JOIN ddi_names n ON n.id = e.target "
+        f"WHERE e.source = {name_id.format(1)} AND e.target <> e.source"
+    )
+    return {
+        "pair": f"SELECT {', '.join('r.' + _quote(c) for c in columns)} "
+                "FROM ddi_edges e JOIN ddi_rows r ON r.row_id = e.row_id "
+                f"WHERE e.source = {name_id.format(1)} AND e.target = {name_id.format(2)}",
+        "neighbours": neighbours,
+        "neighbours_by_type": neighbours + " AND e.type_key = $2",
+    }
+
+
+def table_rows(ddi, pair_index, graph):
+    """(table, columns, rows) for each data table, from the in-memory indexes."""
+    names = [(i, name, key) for i, (name, key) in enumerate(zip(graph.names.tolist(), pair_index.ids))]
+
+    size = pair_index.size
+    low, high = np.divmod(pair_index.keys, size) if size else (pair_index.keys, pair_index.keys)
+    positions = pair_index.positions
+    types = ddi.values("interaction_type", positions)
+    forward = list(zip(low.tolist(), high.tolist(), positions.tolist(), types.tolist()))
+    edges = [
+        (source, target, row, kind, None if kind is None else kind.casefold())
+        for low_id, high_id, row, kind in forward
+        for source, target in ([(low_id, high_id)] if low_id == high_id else [(low_id, high_id), (high_id, low_id)])
+    ]
+
+    decoded = [ddi.values(column, positions).tolist() for column in ddi.columns]
+    rows = [(row, *values) for row, *values in zip(positions.tolist(), *decoded)]
+    return [
+        ("ddi_names", ["id", "name", "name_key"], names),
+        ("ddi_edges", ["source", "target", "row_id", "interaction_type", "type_key"], edges),
+        ("ddi_rows", ["row_id", *ddi.columns], rows),
+    ]
+
+
+class MemoryStore:
+    def __init__(self, ddi, pair_index, graph):
+        self.ddi = ddi
+        self.pair_index = pair_index
+        self.graph = graph
+
+    async def pair(self, name1, name2):
+        position = self.pair_index.lookup(name1, name2)
+        return None if position is None else self.ddi.row(position)
+
+    async def pairs(self, name_pairs):
+        """The rows of several pairs (None where they don't interact), fetched from the table in one go."""
+        positions = [self.pair_index.lookup(name1, name2) for name1, name2 in name_pairs]
+        rows = iter(self.ddi.rows([position for position in positions if position is not None]))
+        return [None if position is None else next(rows) for position in positions]
+
+    async def neighbours(self, name, interaction_type=None):
+        node = self.graph.node(name)
+        return [] if node is None else self.graph.interactions(node, interaction_type)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"backend": "memory"}
+
+
+class SQLiteDriver:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def stored_digest(self):
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                (digest,) = conn.execute("SELECT value FROM ddi_meta WHERE key = 'source_sha256'").fetchone()
+            finally:
+                conn.close()
+        except (sqlite3.Error, TypeError):
+            return None
+        return digest
+
+    def replace(self, ddl, tables, digest):
+        """Write a new database beside the old one and rename it over, so open readers keep their snapshot."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with conn:
+                for statement in ddl:
+                    conn.execute(statement)
+                for table, columns, rows in tables:
+                    conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})", rows)
+                conn.execute("INSERT INTO ddi_meta VALUES ('source_sha256', ?)", (digest,))
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.path)
+
+    async def connect(self):
+        # Read-only; the pool hands a connection to one coroutine at a time, whichever thread runs it
+        return await asyncio.to_thread(
+            sqlite3.connect, f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    async def prepare(self, conn, sql):
+        # sqlite3 compiles a statement on first use and keeps it in the connection's statement cache
+        return PARAM_RE.sub(r"?\1", sql)
+
+    async def fetch(self, conn, statement, args):
+        return await asyncio.to_thread(lambda: conn.execute(statement, args).fetchall())
+
+    async def close(self, conn):
+        await asyncio.to_thread(conn.close)
+
+    def describe(self):
+        return {"driver": self.name, "database": self.path}
+
+
+class PostgresDriver:
+    name = "postgres"
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+
+    def stored_digest(self):
+        async def read():
+            import asyncpg
+
+            conn = await asyncpg.connect(self.dsn)
+            try:
+                return await conn.fetchval("SELECT value FROM ddi_meta WHERE key = 'source_sha256'")
+            except asyncpg.UndefinedTableError:
+                return None
+            finally:
+                await conn.close()
+
+        return _run_in_thread(read)
+
+    def replace(self, ddl, tables, digest):
+        """Recreate the tables in one transaction; readers see the old tables until it commits."""
+        async def write():
+            import asyncpg
+
+            conn = await asyncpg.connect(self.dsn)
+            try:
+                async with conn.transaction():
+                    for table in ["ddi_edges", "ddi_rows", "ddi_names", "ddi_meta"]:
+                        await conn.execute(f"DROP TABLE IF EXISTS {table}")
+                    for statement in ddl:
+                        await conn.execute(statement)
+                    for table, columns, rows in tables:
+                        await conn.copy_records_to_table(table, records=rows, columns=columns)
+                    await conn.execute("INSERT INTO ddi_meta VALUES ('source_sha256', $1)", digest)
+            finally:
+                await conn.close()
+
+        _run_in_thread(write)
+
+    async def connect(self):
+        import asyncpg
+
+        return await asyncpg.connect(self.dsn)
+
+    async def prepare(self, conn, sql):
+        return await conn.prepare(sql)
+
+    async def fetch(self, conn, statement, args):
+        return [tuple(record) for record in await statement.fetch(*args)]
+
+    async def close(self, conn):
+        await conn.close()
+
+    def describe(self):
+        return {"driver": self.name}
+
+
+def ensure_tables(driver, ddi, pair_index, graph):
+    """(Re)build the driver's tables unless they already hold this DDI data."""
+    digest = table_digest(ddi)
+    if driver.stored_digest() != digest:
+        driver.replace(schema(ddi.columns), table_rows(ddi, pair_index, graph), digest)
+
+
+class ConnectionPool:
+    """Up to size connections, opened on first need; each keeps its own prepared statements."""
+
+    def __init__(self, driver, size=4):
+        self.driver = driver
+        self.size = size
+        self.opened = 0
+        self.waits = 0
+        self.closed = False
+        self._waiting = 0
+        # Created on first use, inside the serving event loop
+        self._idle = None
+        self._loop = None
+
+    async def acquire(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            self._loop = asyncio.get_running_loop()
+        if not self._idle.empty():
+            return self._idle.get_nowait()
+        if self.opened < self.size or self.closed:
+            self.opened += 1
+            try:
+                return {"conn": await self.driver.connect(), "prepared": {}}
+            except BaseException:
+                self.opened -= 1
+                raise
+        self.waits += 1
+        self._waiting += 1
+        try:
+            return await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+    async def release(self, connection):
+        # After close, connections still go to requests already waiting for one
+        if self.closed and not self._waiting:
+            await self._close_connection(connection)
+        else:
+            self._idle.put_nowait(connection)
+
+    async def fetch(self, name, sql, args):
+        connection = await self.acquire()
+        try:
+            statement = connection["prepared"].get(name)
+            if statement is None:
+                statement = connection["prepared"][name] = await self.driver.prepare(connection["conn"], sql)
+            return await self.driver.fetch(connection["conn"], statement, args)
+        finally:
+            await self.release(connection)
+
+    async def _close_connection(self, connection):
+        self.opened -= 1
+        await self.driver.close(connection["conn"])
+
+    async def _close_idle(self):
+        while not self._idle.empty():
+            await self._close_connection(self._idle.get_nowait())
+
+    def close(self):
+        """
+        Stop pooling: idle connections are closed on the serving loop, busy ones
+        when released. Callable from any thread (the reloader's).
+        """
+        self.closed = True
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_idle(), self._loop)
+
+    def stats(self):
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return {
+            "size": self.size,
+            "open": self.opened,
+            "idle": idle,
+            "in_use": self.opened - idle,
+            "waits": self.waits,
+            "closed": self.closed,
+        }
+
+
+class SQLStore:
+    def __init__(self, driver, columns, pool_size=4):
+        self.driver = driver
+        self.columns = list(columns)
+        self.statements = statements(self.columns)
+        self.pool = ConnectionPool(driver, pool_size)
+        self.latencies = {name: deque(maxlen=LATENCY_SAMPLES) for name in self.statements}
+        self.calls = dict.fromkeys(self.statements, 0)
+
+    async def _fetch(self, name, *args):
+        start = time.perf_counter()
+        rows = await self.pool.fetch(name, self.statements[name], args)
+        self.latencies[name].append(time.perf_counter() - start)
+        self.calls[name] += 1
+        return rows
+
+    async def pair(self, name1, name2):
+        rows = await self._fetch("pair", name1.lower(), name2.lower())
+        return dict(zip(self.columns, rows[0])) if rows else None
+
+    async def pairs(self, name_pairs):
+        # Concurrent lookups, bounded by the pool size
+        return list(await asyncio.gather(*(self.pair(name1, name2) for name1, name2 in name_pairs)))
+
+    async def neighbours(self, name, interaction_type=None):
+        name = name.strip().lower()
+        if interaction_type is None:
+            rows = await self._fetch("neighbours", name)
+        else:
+            rows = await self._fetch("neighbours_by_type", name, interaction_type.casefold())
+        return [{"name": neighbour, "interaction_type": kind} for neighbour, kind in sorted(rows)]
+
+    def close(self):
+        self.pool.close()
+
+    def stats(self):
+        latencies = {}
+        for name, samples in self.latencies.items():
+            ms = np.array(samples) * 1000
+            latencies[name] = {
+                "calls": self.calls[name],
+                "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+                "p95_ms": round(float(np.percentile(ms, 95)), 3) if len(ms) else None,
+                "max_ms": round(float(ms.max()), 3) if len(ms) else None,
+            }
+        return {"backend": "sql", **self.driver.describe(), "pool": self.pool.stats(), "latency": latencies}
@@ -0,0 +1,152 @@
+"""
+Drug interaction graph over the DDI table.
+
+Each drug (a lowercased DDI name, as in ``PairIndex``) is a node and each
+interacting pair an undirected edge, carrying the interaction type and the
+table row of the pair's first interaction. Adjacency is stored CSR-style
+(``indptr`` offsets into ``indices``, int32 node IDs), with edge attributes in arrays
+parallel to ``indices``, so a drug's neighbours are one array slice and a
+k-hop expansion is a few vectorized gathers per hop. Degrees and the hub
+ranking are computed once per data version.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+class InteractionGraph:
+    def __init__(self, ddi, pair_index):
+        size = pair_index.size
+        self.size = size
+        self.ids = pair_index.ids
+
+        # Display name: the first spelling of each lowercased name in the vocabulary
+        vocabulary = ddi.vocabulary("drug1_name")
+        order = np.argsort(pair_index.vocabulary_ids, kind="stable")
+        first = order[np.unique(pair_index.vocabulary_ids[order], return_index=True)[1]]
+        self.names = vocabulary[first]
+
+        # Unique pairs from the pair index; self-interactions are not edges
+        low, high = np.divmod(pair_index.keys, size) if size else (pair_index.keys, pair_index.keys)
+        rows = pair_index.positions
+        keep = low != high
+        low, high, rows = low[keep], high[keep], rows[keep]
+        self.edge_count = len(rows)
+
+        source = np.concatenate([low, high])
+        target = np.concatenate([high, low])
+        edge_rows = np.concatenate([rows, rows])
+        order = np.lexsort((target, source))
+        self.indices = target[order].astype(np.int32)
+        self.edge_rows = edge_rows[order]
+        self.edge_types = np.asarray(ddi.codes["interaction_type"])[self.edge_rows]
+        self.type_names = np.append(ddi.vocabulary("interaction_type"), None)
+        self.type_codes = {}
+        for code, name in enumerate(self.type_names[:-1].tolist()):
+            self.type_codes.setdefault(name.casefold(), []).append(code)
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=size), out=self.indptr[1:])
+
+        self.degree = np.diff(self.indptr).astype(np.int32)
+        # Alphabetical position of each name, for deterministic ordering without string sorts
+        self.name_rank = np.empty(size, dtype=np.int32)
+        self.name_rank[np.argsort(self.names.astype(str), kind="stable")] = np.arange(size, dtype=np.int32)
+        # Hubs: highest degree first, ties alphabetical
+        self.hubs = np.lexsort((self.name_rank, -self.degree)).astype(np.int32)
+        self.hub_rank = np.empty(size, dtype=np.int32)
+        self.hub_rank[self.hubs] = np.arange(1, size + 1, dtype=np.int32)
+        self.within = lru_cache(maxsize=1024)(self._within)
+
+    def node(self, name):
+        return self.ids.get(name.strip().lower())
+
+    def neighbours(self, node):
+        """Neighbour node IDs of node (sorted by ID) and the positions of those edges."""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], np.arange(start, end)
+
+    def _expand(self, frontier):
+        """All neighbours of the frontier nodes (with repeats), as one gather over the CSR arrays."""
+        starts = self.indptr[frontier]
+        lengths = self.indptr[frontier + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[offsets + np.arange(lengths.sum())]
+
+    def _within(self, node, hops):
+        """(nodes, hop distances) within hops of node, node excluded, in BFS order."""
+        seen = np.zeros(self.size, dtype=bool)
+        seen[node] = True
+        frontier = np.array([node], dtype=np.int64)
+        found, distances = [], []
+        for distance in range(1, hops + 1):
+            # A boolean mark dedupes the gathered neighbours without sorting them
+            reached = np.zeros(self.size, dtype=bool)
+            reached[self._expand(frontier)] = True
+            frontier = np.flatnonzero(reached & ~seen)
+            if not len(frontier):
+                break
+            seen[frontier] = True
+            found.append(frontier)
+            distances.append(np.full(len(frontier), distance, dtype=np.int32))
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(found), np.concatenate(distances)
+
+    def interactions(self, node, interaction_type=None):
+        """Neighbours of node as dicts, alphabetical; interaction_type (case-insensitive) filters edges."""
+        neighbours, edges = self.neighbours(node)
+        codes = self.edge_types[edges]
+        if interaction_type is not None:
+            keep = np.isin(codes, self.type_codes.get(interaction_type.casefold(), []))
+            neighbours, codes = neighbours[keep], codes[keep]
+        types = self.type_names[codes]
+        order = np.argsort(self.name_rank[neighbours], kind="stable")
+        return [
+            {"name": name, "interaction_type": kind}
+            for name, kind in zip(self.names[neighbours[order]].tolist(), types[order].tolist())
+        ]
+
+    def reachable(self, node, hops):
+        """Nodes within hops as dicts, sorted by hop distance, then hub rank."""
+        nodes, distances = self.within(node, hops)
+        order = np.lexsort((self.hub_rank[nodes], distances))
+        nodes, distances = nodes[order], distances[order]
+        return [
+            {"name": name, "hops": hop, "degree": degree}
+            for name, hop, degree in zip(
+                self.names[nodes].tolist(), distances.tolist(), self.degree[nodes].tolist()
+            )
+        ]
+
+    def shared(self, node1, node2):
+        """Drugs interacting with both nodes, alphabetical, with each side's interaction type."""
+        neighbours1, edges1 = self.neighbours(node1)
+        neighbours2, edges2 = self.neighbours(node2)
+        common, at1, at2 = np.intersect1d(neighbours1, neighbours2, assume_unique=True, return_indices=True)
+        order = np.argsort(self.name_rank[common], kind="stable")
+        common, at1, at2 = common[order], at1[order], at2[order]
+        return [
+            {"name": name, "drug1_interaction": first, "drug2_interaction": second}
+            for name, first, second in zip(
+                self.names[common].tolist(),
+                self.type_names[self.edge_types[edges1[at1]]].tolist(),
+                self.type_names[self.edge_types[edges2[at2]]].tolist(),
+            )
+        ]
+
+    def top_hubs(self, limit=20, offset=0):
+        nodes = self.hubs[offset:offset + limit]
+        return [
+            {"rank": rank, "name": name, "degree": degree}
+            for rank, name, degree in zip(
+                range(offset + 1, offset + len(nodes) + 1), self.names[nodes].tolist(), self.degree[nodes].tolist()
+            )
+        ]
+
+    def stats(self):
+        return {
+            "nodes": self.size,
+            "edges": self.edge_count,
+            "max_degree": int(self.degree.max()) if self.size else 0,
+            "cached_lookups": self.within.cache_info().currsize,
+        }
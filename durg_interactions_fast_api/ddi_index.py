@@ -0,0 +1,234 @@
+"""
+Lookup indexes over the DDI (drug-drug interaction) table and the Saudi
+formulary.
+
+Built once per data version so a request costs dictionary lookups instead of
+lowercasing and masking whole columns.
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class PairIndex:
+    """
+    Order-independent (drug, drug) -> interaction row index.
+
+    Every lowercased drug name gets an integer ID (names differing only in
+    case share one); a pair is keyed by ``min(id) * size + max(id)``, so
+    (A, B) and (B, A) share one key. Each key maps to the position of its
+    first row in the table, which is the row the two-direction mask lookup
+    returned (``interaction.iloc[0]``). Rows with a missing name never match,
+    as with the masks.
+    """
+
+    def __init__(self, ddi):
+        # Built from the interned name codes: only the vocabulary is lowercased, not every row
+        lower_ids, uniques = pd.factorize(pd.Series(ddi.vocabulary("drug1_name"), dtype=object).str.lower())
+        self.size = len(uniques)
+        self.ids = {name: i for i, name in enumerate(uniques)}
+
+        # Trailing -1 keeps missing names (code -1) missing
+        lower_ids = np.append(lower_ids, -1).astype(np.int64)
+        code1, code2 = lower_ids[ddi.codes["drug1_name"]], lower_ids[ddi.codes["drug2_name"]]
+        positions = np.flatnonzero((code1 >= 0) & (code2 >= 0))
+        keys = np.minimum(code1, code2)[positions] * self.size + np.maximum(code1, code2)[positions]
+        # np.unique reports the first occurrence of each key, i.e. the lowest row position
+        unique_keys, first = np.unique(keys, return_index=True)
+        self.rows = dict(zip(unique_keys.tolist(), positions[first].tolist()))
+        # The same, as sorted arrays, plus the name ID of every vocabulary entry (for the graph)
+        self.keys = unique_keys
+        self.positions = positions[first]
+        self.vocabulary_ids = lower_ids[:-1]
+
+    def key(self, name1, name2):
+        id1, id2 = self.ids.get(name1.lower()), self.ids.get(name2.lower())
+        if id1 is None or id2 is None:
+            return None
+        return min(id1, id2) * self.size + max(id1, id2)
+
+    def lookup(self, name1, name2):
+        """Row position of the first interaction between two names (any case, either order), or None."""
+        key = self.key(name1, name2)
+        return None if key is None else self.rows.get(key)
+
+    def stats(self):
+        return {"drugs": self.size, "pairs": len(self.rows)}
+
+
+class NameMatchIndex:
+    """
+    Partial-name lookup over the DDI drug names, plus each name's table rows.
+
+    Names are the lowercased names of ``PairIndex`` (same IDs). ``match``
+    finds names for a query in one of three modes, using a word-token
+    inverted index and a character trigram index so only names sharing the
+    query's tokens / trigrams are checked:
+
+    - ``exact``: the name equals the query.
+    - ``token``: every word of the query is a whole word of the name.
+    - ``substring``: the query occurs anywhere in the name (literal text).
+
+    Matches are ranked exact, then prefix, then whole-word, then other
+    substring matches; ties go to the shorter, then alphabetically first
+    name. ``rows`` returns the table rows (ascending) mentioning a name, from
+    CSR postings, so fetching interactions never scans the table.
+    """
+
+    MODES = ("exact", "token", "substring")
+    KINDS = ("exact", "prefix", "token", "substring")
+
+    def __init__(self, ddi, pair_index, gram=3):
+        self.gram = gram
+        self.ids = pair_index.ids
+        self.names = list(pair_index.ids)
+
+        tokens = defaultdict(set)
+        grams = defaultdict(set)
+        self.name_tokens = []
+        for name_id, name in enumerate(self.names):
+            words = TOKEN_RE.findall(name)
+            self.name_tokens.append(set(words))
+            for word in words:
+                tokens[word].add(name_id)
+            for i in range(len(name) - gram + 1):
+                grams[name[i:i + gram]].add(name_id)
+        self.tokens = {token: sorted(ids) for token, ids in tokens.items()}
+        self.grams = {key: sorted(ids) for key, ids in grams.items()}
+
+        # Rows mentioning each name, drug1 or drug2 side (a self-interaction row is listed once)
+        lower_ids = np.append(pair_index.vocabulary_ids, -1)
+        name1, name2 = lower_ids[ddi.codes["drug1_name"]], lower_ids[ddi.codes["drug2_name"]]
+        positions = np.arange(len(ddi), dtype=np.int64)
+        second = name2 != name1
+        names = np.concatenate([name1, name2[second]])
+        rows = np.concatenate([positions, positions[second]])
+        keep = names >= 0
+        names, rows = names[keep], rows[keep]
+        order = np.lexsort((rows, names))
+        self.row_indices = rows[order].astype(np.int32)
+        self.row_indptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(names, minlength=len(self.names)), out=self.row_indptr[1:])
+
+    @staticmethod
+    def _intersect(lists):
+        if not lists or any(ids is None for ids in lists):
+            return set()
+        lists = sorted(lists, key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+        return result
+
+    def _kind(self, name_id, query, words):
+        name = self.names[name_id]
+        if name == query:
+            return 0
+        if name.startswith(query):
+            return 1
+        if words and words <= self.name_tokens[name_id]:
+            return 2
+        return 3
+
+    def match(self, query, mode="substring"):
+        """[(name ID, kind)] ranked best first; kind is one of KINDS."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        words = set(TOKEN_RE.findall(query))
+        if mode == "exact":
+            name_id = self.ids.get(query)
+            return [] if name_id is None else [(name_id, "exact")]
+        if mode == "token":
+            candidates = self._intersect([self.tokens.get(word) for word in words])
+        elif len(query) >= self.gram:
+            candidates = self._intersect([
+                self.grams.get(query[i:i + self.gram]) for i in range(len(query) - self.gram + 1)
+            ])
+            candidates = {name_id for name_id in candidates if query in self.names[name_id]}
+        else:
+            # Too short for a trigram: only a scan can tell
+            candidates = {name_id for name_id, name in enumerate(self.names) if query in name}
+
+        ranked = []
+        for name_id in candidates:
+            kind = self._kind(name_id, query, words)
+            ranked.append((kind, len(self.names[name_id]), self.names[name_id], name_id))
+        ranked.sort()
+        return [(name_id, self.KINDS[kind]) for kind, _, _, name_id in ranked]
+
+    def rows(self, name_id):
+        return self.row_indices[self.row_indptr[name_id]:self.row_indptr[name_id + 1]]
+
+    def stats(self):
+        return {"names": len(self.names), "tokens": len(self.tokens), "trigrams": len(self.grams)}
+
+
+class NameResolver:
+    """
+    Lowercased scientific / Saudi trade name -> canonical drug ID.
+
+    A drug is one distinct (lowercased) scientific name; IDs follow the
+    formulary's row order. ``scientific[id]`` is the name as first written and
+    ``brands[id]`` lists all of the drug's trade names. Scientific names win
+    over trade names, and earlier rows over later ones, as with the row-by-row
+    lookup this replaces. ``table`` holds the same data keyed by every name,
+    for joining onto DDI rows.
+    """
+
+    def __init__(self, saudi_drugs):
+        codes, _ = pd.factorize(saudi_drugs["scientific_name"].str.lower())
+        rows = [
+            (code, sci, trade if isinstance(trade, str) else None)
+            for code, sci, trade in zip(
+                codes.tolist(), saudi_drugs["scientific_name"].tolist(), saudi_drugs["trade_name_saudi"].tolist()
+            )
+            if code >= 0
+        ]
+        # Formulary row -> drug ID (-1 for a missing scientific name)
+        self.row_ids = codes
+        self.scientific = []
+        self.brands = []
+        for code, sci, trade in rows:
+            if code == len(self.scientific):
+                self.scientific.append(sci)
+                self.brands.append([])
+            if trade is not None and trade not in self.brands[code]:
+                self.brands[code].append(trade)
+
+        # name -> (drug ID, trade name shown for it): the first row's trade name, or the one matched
+        self.matches = {}
+        for code, sci, trade in rows:
+            self.matches.setdefault(sci.lower(), (code, trade))
+        for code, _, trade in rows:
+            if trade is not None:
+                self.matches.setdefault(trade.lower(), (code, trade))
+
+        self.table = pd.DataFrame(
+            [(code, trade, self.brands[code]) for code, trade in self.matches.values()],
+            columns=["drug_id", "brand", "brands"],
+            index=pd.Index(list(self.matches), dtype=object),
+        ).astype({"brand": object})
+
+    def resolve(self, name):
+        """(drug ID, trade name) for a scientific or trade name in any case, or (None, None)."""
+        return self.matches.get(name.strip().lower(), (None, None))
+
+    def join(self, names):
+        """brand / brands Series for a column of names, unmatched as None / [] (a hash join on the lowercased names)."""
+        matched = self.table.reindex(names.str.strip().str.lower().to_numpy())
+        brand = matched["brand"].where(matched["brand"].notna(), None)
+        brands = [value if isinstance(value, list) else [] for value in matched["brands"].tolist()]
+        return (
+            pd.Series(brand.tolist(), index=names.index, dtype=object),
+            pd.Series(brands, index=names.index, dtype=object),
+        )
+
+    def stats(self):
+        return {"drugs": len(self.scientific), "names": len(self.matches)}
@@ -0,0 +1,69 @@
+"""
+Pre-encoded JSON payloads for the interaction lists served by /search_drug.
+
+Every vocabulary value of every DDI column is JSON-encoded once per data
+version, as a ready ``"column":value`` member, and so are the brand fields
+joined onto each drug name. A drug's interaction list is then its row IDs
+(the ``NameMatchIndex`` postings) turned into bytes by joining those members,
+with no DataFrame, ``to_dict`` or JSON encoder in the request path. Finished
+lists are kept in an LRU cache, so the most-queried drugs are a single
+lookup. The bytes are exactly what FastAPI's JSON response would render for
+the same records.
+"""
+import json
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+def json_bytes(value):
+    """value encoded as Starlette's JSONResponse encodes it."""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _members(key, values):
+    """Object array of ``"key":value`` members, one per value plus a trailing null for code -1."""
+    prefix = json_bytes(key) + b":"
+    return np.array([prefix + json_bytes(value) for value in list(values) + [None]], dtype=object)
+
+
+class PayloadStore:
+    def __init__(self, ddi, name_index, resolver, cache_size=256):
+        self.ddi = ddi
+        self.name_index = name_index
+        self.columns = list(ddi.columns)
+        self.members = {column: _members(column, ddi.vocabulary(column)) for column in self.columns}
+
+        # Brand fields per drug name code, in the order the records carry them
+        names = ddi.vocabulary("drug1_name")
+        brand, brands = resolver.join(pd.Series(names, dtype=object))
+        self.brand_members = [
+            (column, _members(f"drug{side}_{field}", values.tolist()))
+            for field, values in (("brand", brand), ("brands", brands))
+            for side, column in ((1, "drug1_name"), (2, "drug2_name"))
+        ]
+        self.interactions = lru_cache(maxsize=cache_size)(self._interactions)
+
+    def positions(self, name_ids):
+        """Rows of the names in order, each row once and identical rows once (first kept), as drop_duplicates did."""
+        if not name_ids:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate([self.name_index.rows(name_id) for name_id in name_ids])
+        content = np.stack([np.asarray(self.ddi.codes[column])[positions] for column in self.columns], axis=1)
+        _, first = np.unique(content, axis=0, return_index=True)
+        return positions[np.sort(first)]
+
+    def encode(self, positions):
+        """JSON array of the records at positions."""
+        parts = [self.members[column][self.ddi.codes[column][positions]] for column in self.columns]
+        parts += [members[self.ddi.codes[column][positions]] for column, members in self.brand_members]
+        return b"[" + b",".join(b"{" + b",".join(record) + b"}" for record in zip(*parts)) + b"]"
+
+    def _interactions(self, name_ids):
+        """JSON array of the interactions of a tuple of name IDs (ranked matches), cached."""
+        return self.encode(self.positions(name_ids))
+
+    def stats(self):
+        info = self.interactions.cache_info()
+        return {"cached_lists": info.currsize, "cache_hits": info.hits, "cache_misses": info.misses}
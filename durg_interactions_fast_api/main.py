@@ -1,8 +1,24 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from types import SimpleNamespace
+from typing import List, Optional
+import logging
+import os
+import numpy as np
 import pandas as pd
 
+from medvision_common.arabic_names import PhoneticIndex, has_arabic
+from medvision_common.ddi_store import DDITable, load_ddi
+from medvision_common.drug_entities import SOURCES as ENTITY_SOURCES, load_entities
+from medvision_common.reloader import Reloader, authorized
+
+from ddi_backends import MemoryStore, PostgresDriver, SQLiteDriver, SQLStore, ensure_tables
+from ddi_graph import InteractionGraph
+from ddi_index import NameMatchIndex, NameResolver, PairIndex
+from ddi_payloads import PayloadStore, json_bytes
+
 # ==============================
 # APP SETUP
 # ==============================
@@ -24,11 +40,24 @@ app.add_middleware(
 # ==============================
 # LOAD DATA
 # ==============================
+logger = logging.getLogger(__name__)
+
+# A missing CSV falls back to a small built-in sample (logged and reported in /health) unless disabled;
+# any other load error fails the load, and a reload then keeps the current data
+ALLOW_SAMPLE_DATA = os.environ.get("DDI_ALLOW_SAMPLE_DATA", "1") == "1"
+
 def load_data():
+    """(DDI table, formulary, names of the files replaced by built-in samples)"""
+    samples = []
     # Load DDI data
     try:
-        ddi_df = pd.read_csv("DDI_data.csv")
-    except:
+        # Interned codes, memory-mapped from DDI_data.ddi (rebuilt from the CSV when it changes)
+        ddi_df = load_ddi("DDI_data.csv")
+    except FileNotFoundError:
+        if not ALLOW_SAMPLE_DATA:
+            raise
+        logger.warning("DDI_data.csv not found; serving the built-in sample interactions")
+        samples.append("DDI_data.csv")
         ddi_data = {
             'drug1_name': ['Aspirin', 'Warfarin', 'Metformin', 'Lisinopril', 'Simvastatin', 
                           'Aspirin', 'Ibuprofen', 'Warfarin', 'Levothyroxine', 'Metoprolol',
@@ -42,12 +71,16 @@ def load_data():
                                 'Bradycardia', 'Reduced antiplatelet effect', 'Reduced efficacy',
                                 'Increased statin levels', 'Increased side effects', 'Electrolyte imbalance']
         }
-        ddi_df = pd.DataFrame(ddi_data)
+        ddi_df = DDITable.from_frame(pd.DataFrame(ddi_data))
     
     # Load Saudi drugs database
     try:
         saudi_drugs_df = pd.read_csv("Complete_Saudi_Drugs_Database.csv")
-    except:
+    except FileNotFoundError:
+        if not ALLOW_SAMPLE_DATA:
+            raise
+        logger.warning("Complete_Saudi_Drugs_Database.csv not found; serving the built-in sample formulary")
+        samples.append("Complete_Saudi_Drugs_Database.csv")
         saudi_drugs_data = {
             'scientific_name': ['Aspirin', 'Warfarin', 'Metformin', 'Lisinopril', 'Simvastatin',
                                'Ibuprofen', 'Levothyroxine', 'Metoprolol', 'Omeprazole', 
@@ -62,80 +95,225 @@ def load_data():
         }
         saudi_drugs_df = pd.DataFrame(saudi_drugs_data)
     
-    return ddi_df, saudi_drugs_df
+    return ddi_df, saudi_drugs_df, samples
+
+# Pair / neighbour lookups: "memory" (in-process indexes, default), "sqlite" (local database file,
+# DDI_SQLITE_PATH) or "postgres" (DDI_DATABASE_URL), the SQL ones through a pool of DDI_POOL_SIZE connections
+STORAGE_BACKEND = os.environ.get("DDI_STORAGE_BACKEND", "memory")
 
-ddi_data, saudi_drugs = load_data()
+def build_store(ddi_data, pair_index, graph):
+    if STORAGE_BACKEND == "memory":
+        return MemoryStore(ddi_data, pair_index, graph)
+    if STORAGE_BACKEND == "sqlite":
+        driver = SQLiteDriver(os.environ.get("DDI_SQLITE_PATH", "DDI_data.sqlite3"))
+    elif STORAGE_BACKEND == "postgres":
+        driver = PostgresDriver(os.environ["DDI_DATABASE_URL"])
+    else:
+        raise ValueError(f"Unknown DDI_STORAGE_BACKEND: {STORAGE_BACKEND}")
+    ensure_tables(driver, ddi_data, pair_index, graph)
+    return SQLStore(driver, ddi_data.columns, pool_size=int(os.environ.get("DDI_POOL_SIZE", 4)))
+
+def link_formulary(entities, resolver):
+    """(formulary drug ID -> entity ID, entity ID -> trade names of the formulary drugs resolving to it)"""
+    drug_entities = [entities.resolve(name) for name in resolver.scientific]
+    entity_brands = [[] for _ in range(len(entities))]
+    for drug_id, entity_id in enumerate(drug_entities):
+        if entity_id is None:
+            continue
+        for brand in resolver.brands[drug_id]:
+            if brand not in entity_brands[entity_id]:
+                entity_brands[entity_id].append(brand)
+    return drug_entities, entity_brands
+
+def build_state():
+    ddi_data, saudi_drugs, samples = load_data()
+    # (drug, drug) in either order -> interaction row, for /check_interaction
+    pair_index = PairIndex(ddi_data)
+    # Exact / whole-word / substring DDI name matching and each name's rows, for /search_drug
+    name_index = NameMatchIndex(ddi_data, pair_index)
+    # Scientific / trade name -> canonical drug ID with all its Saudi brands
+    resolver = NameResolver(saudi_drugs)
+    # Drug -> interacting drugs graph, for the /interactions/* endpoints
+    graph = InteractionGraph(ddi_data, pair_index)
+    # Drug entities shared with the description API (one artifact, DRUG_ENTITIES_PATH); every name lookup goes through them
+    entities = load_entities()
+    drug_entities, entity_brands = link_formulary(entities, resolver)
+    return SimpleNamespace(
+        ddi_data=ddi_data,
+        saudi_drugs=saudi_drugs,
+        samples=samples,
+        # Arabic-typed names (e.g. بنادول) resolve by consonant skeleton, scientific names first
+        arabic_index=PhoneticIndex([
+            saudi_drugs['scientific_name'].astype(str).tolist(),
+            saudi_drugs['trade_name_saudi'].astype(str).tolist(),
+        ]),
+        resolver=resolver,
+        pair_index=pair_index,
+        name_index=name_index,
+        # Interaction lists pre-encoded as JSON, for /search_drug and the NDJSON export
+        payloads=PayloadStore(ddi_data, name_index, resolver),
+        graph=graph,
+        entities=entities,
+        # Per entity: its graph node and its formulary brands; per formulary drug ID: its entity
+        entity_nodes=entities.ddi_nodes(pair_index.ids),
+        entity_brands=entity_brands,
+        drug_entities=drug_entities,
+        # Backend answering the pair and neighbour lookups
+        store=build_store(ddi_data, pair_index, graph),
+    )
+
+# Current data version; rebuilt in the background and swapped in on POST /admin/reload
+# or, with DATA_WATCH_INTERVAL > 0, when a source file changes (the description table feeds the entities)
+reloader = Reloader(
+    build_state,
+    ["DDI_data.csv", "Complete_Saudi_Drugs_Database.csv", ENTITY_SOURCES["descriptions"]],
+    watch_interval=float(os.environ.get("DATA_WATCH_INTERVAL", 0)),
+    # The replaced version's SQL connection pool, closed as its in-flight requests finish
+    close=lambda data: data.store.close()
+).start()
 
 # ==============================
 # SEARCH FUNCTIONS
 # ==============================
-def search_drug_name(user_input: str):
-    """Search for drug name - handles both scientific and brand names"""
-    user_input = user_input.strip().lower()
-    
-    # Exact match in scientific names
-    sci_match = saudi_drugs[saudi_drugs['scientific_name'].str.lower() == user_input]
-    if not sci_match.empty:
-        return sci_match.iloc[0]['scientific_name'], sci_match.iloc[0]['trade_name_saudi']
-    
-    # Exact match in brand names
-    brand_match = saudi_drugs[saudi_drugs['trade_name_saudi'].str.lower() == user_input]
-    if not brand_match.empty:
-        return brand_match.iloc[0]['scientific_name'], brand_match.iloc[0]['trade_name_saudi']
-    
-    return None, None
+def resolve_drug(data, user_input: str):
+    """Entity ID and the brand name to show - scientific, synonym, brand and Arabic-script names, as /entity resolves them"""
+    entity_id = data.entities.resolve(user_input)
+    if entity_id is None:
+        return None, None
+    # The brand typed (for Arabic script, the formulary row it sounds like), else the drug's first brand
+    if has_arabic(user_input):
+        rows = data.arabic_index.lookup(user_input.strip().lower())
+        drug_id = int(data.resolver.row_ids[rows[0]]) if rows else -1
+        trade = data.saudi_drugs['trade_name_saudi'].iloc[rows[0]] if rows else None
+    else:
+        drug_id, trade = data.resolver.resolve(user_input)
+    if drug_id is not None and drug_id >= 0 and data.drug_entities[drug_id] == entity_id and isinstance(trade, str):
+        return entity_id, trade
+    brands = data.entity_brands[entity_id]
+    return entity_id, brands[0] if brands else None
+
+def ddi_name(data, entity_id):
+    """The entity's name in the served DDI table (its graph node's), else its scientific name"""
+    node = data.entity_nodes[entity_id]
+    return data.graph.names[node] if node is not None else data.entities.scientific[entity_id]
+
+def search_drug_name(data, user_input: str):
+    """DDI name to search for and the brand to show - handles scientific, synonym and brand names"""
+    entity_id, brand = resolve_drug(data, user_input)
+    if entity_id is None:
+        return None, None
+    return ddi_name(data, entity_id), brand
 
-def find_interactions(drug_name: str):
-    sci_name, brand_name = search_drug_name(drug_name)
+def find_interactions(data, drug_name: str, match: str = "substring"):
+    """The drug's interactions, with brand names, as a pre-encoded JSON array (bytes)."""
+    sci_name, brand_name = search_drug_name(data, drug_name)
     if sci_name is None:
-        return []
+        return b"[]"
 
-    # Check interactions
-    mask1 = ddi_data['drug1_name'].str.lower().str.contains(sci_name.lower(), na=False)
-    mask2 = ddi_data['drug2_name'].str.lower().str.contains(sci_name.lower(), na=False)
-    results = pd.concat([ddi_data.loc[mask1], ddi_data.loc[mask2]]).drop_duplicates()
-    
-    if results.empty:
-        return []
-    
-    # Add brand names
-    results['drug1_brand'] = results['drug1_name'].apply(lambda x: search_drug_name(x)[1])
-    results['drug2_brand'] = results['drug2_name'].apply(lambda x: search_drug_name(x)[1])
-    
-    return results.to_dict(orient="records")
+    # Check interactions: DDI names matching the scientific name, best match first, then their rows
+    matches = data.name_index.match(sci_name, match)
+    return data.payloads.interactions(tuple(name_id for name_id, _ in matches))
+
+def export_interactions(data, drug_names, match):
+    """NDJSON lines, one {"drug", "interactions"} object per drug; every DDI drug when drug_names is empty."""
+    if drug_names:
+        for drug_name in drug_names:
+            yield b'{"drug":' + json_bytes(drug_name) + b',"interactions":' + find_interactions(data, drug_name, match) + b"}\n"
+        return
+    # Bulk export bypasses the payload cache, so it does not evict the hot drugs
+    for node in np.argsort(data.graph.name_rank).tolist():
+        interactions = data.payloads.encode(data.payloads.positions((node,)))
+        yield b'{"drug":' + json_bytes(data.graph.names[node]) + b',"interactions":' + interactions + b"}\n"
+
+def add_drug_names(data, row, id1, brand1, id2, brand2):
+    """Add the resolved names and brands of the two drugs to an interaction row"""
+    row['drug1_brand'] = brand1
+    row['drug2_brand'] = brand2
+    row['drug1_scientific'] = data.entities.scientific[id1]
+    row['drug2_scientific'] = data.entities.scientific[id2]
+    row['drug1_brands'] = list(data.entity_brands[id1])
+    row['drug2_brands'] = list(data.entity_brands[id2])
+    return row
 
-def check_drug_interaction(drug1: str, drug2: str):
-    sci1, brand1 = search_drug_name(drug1)
-    sci2, brand2 = search_drug_name(drug2)
+async def check_drug_interaction(data, drug1: str, drug2: str):
+    id1, brand1 = resolve_drug(data, drug1)
+    id2, brand2 = resolve_drug(data, drug2)
     
-    if sci1 is None or sci2 is None:
+    if id1 is None or id2 is None:
         return None
     
-    mask1 = (ddi_data['drug1_name'].str.lower() == sci1.lower()) & (ddi_data['drug2_name'].str.lower() == sci2.lower())
-    mask2 = (ddi_data['drug1_name'].str.lower() == sci2.lower()) & (ddi_data['drug2_name'].str.lower() == sci1.lower())
-    
-    interaction = ddi_data[mask1 | mask2]
-    if interaction.empty:
+    row = await data.store.pair(ddi_name(data, id1), ddi_name(data, id2))
+    if row is None:
         return None
     
-    row = interaction.iloc[0].to_dict()
-    row['drug1_brand'] = brand1
-    row['drug2_brand'] = brand2
-    row['drug1_scientific'] = sci1
-    row['drug2_scientific'] = sci2
+    return add_drug_names(data, row, id1, brand1, id2, brand2)
+
+def graph_node(data, drug_name: str):
+    """Graph node and display name for a drug: through its entity, else by its DDI name"""
+    entity_id = data.entities.resolve(drug_name)
+    node = data.entity_nodes[entity_id] if entity_id is not None else None
+    if node is None:
+        node = data.graph.node(drug_name)
+    if node is None:
+        return None, None
+    return node, data.graph.names[node]
+
+async def check_regimen(data, drug_names):
+    """Every interacting pair in a medication list; each name is resolved once"""
+    resolved = []
+    unresolved = []
+    duplicates = []
+    seen = {}
+    for name in drug_names:
+        entity_id, brand = resolve_drug(data, name)
+        if entity_id is None:
+            unresolved.append(name)
+        elif entity_id in seen:
+            # Same drug under another name (e.g. brand + scientific, or a synonym); not checked against itself
+            duplicates.append({"name": name, "same_as": seen[entity_id]})
+        else:
+            seen[entity_id] = name
+            resolved.append((name, entity_id, brand))
     
-    return row
+    pairs = [
+        (name1, id1, brand1, name2, id2, brand2)
+        for i, (name1, id1, brand1) in enumerate(resolved)
+        for name2, id2, brand2 in resolved[i + 1:]
+    ]
+    # All pairs go to the storage backend in one call
+    rows = await data.store.pairs([
+        (ddi_name(data, id1), ddi_name(data, id2)) for _, id1, _, _, id2, _ in pairs
+    ])
+    interactions = [
+        {"drug1": name1, "drug2": name2, "interaction": add_drug_names(data, row, id1, brand1, id2, brand2)}
+        for row, (name1, id1, brand1, name2, id2, brand2) in zip(rows, pairs)
+        if row is not None
+    ]
+    
+    return {
+        "count": len(drug_names),
+        "resolved": len(resolved),
+        "pairs_checked": len(resolved) * (len(resolved) - 1) // 2,
+        "interaction_count": len(interactions),
+        "interactions": interactions,
+        "unresolved": unresolved,
+        "duplicates": duplicates
+    }
 
 # ==============================
 # API MODELS
 # ==============================
 class DrugQuery(BaseModel):
     drug_name: str
+    match: str = Field("substring", pattern="^(exact|token|substring)$")
 
 class DrugCompareQuery(BaseModel):
     drug1: str
     drug2: str
 
+class RegimenQuery(BaseModel):
+    drugs: List[str] = Field(..., min_length=1, max_length=100)
+
 # ==============================
 # API ENDPOINTS
 # ==============================
@@ -145,10 +323,151 @@ def home():
 
 @app.post("/search_drug")
 def api_search_drug(query: DrugQuery):
-    results = find_interactions(query.drug_name)
-    return {"drug": query.drug_name, "interactions": results}
+    results = find_interactions(reloader.current, query.drug_name, query.match)
+    # Already JSON: the body is assembled from the pre-encoded interaction list
+    return Response(
+        b'{"drug":' + json_bytes(query.drug_name) + b',"match":' + json_bytes(query.match)
+        + b',"interactions":' + results + b"}",
+        media_type="application/json",
+    )
 
 @app.post("/check_interaction")
-def api_check_interaction(query: DrugCompareQuery):
-    result = check_drug_interaction(query.drug1, query.drug2)
+async def api_check_interaction(query: DrugCompareQuery):
+    result = await check_drug_interaction(reloader.current, query.drug1, query.drug2)
     return {"drug1": query.drug1, "drug2": query.drug2, "interaction": result}
+
+@app.post("/check_regimen")
+async def api_check_regimen(query: RegimenQuery):
+    return {"drugs": query.drugs, **await check_regimen(reloader.current, query.drugs)}
+
+# ==============================
+# INTERACTION GRAPH ENDPOINTS
+# ==============================
+@app.get("/interactions/neighbors")
+async def api_neighbors(
+    drug: str = Query(...),
+    interaction_type: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    data = reloader.current
+    node, matched = graph_node(data, drug)
+    if node is None:
+        return {"drug": drug, "matched": None, "count": 0, "neighbors": []}
+    neighbors = await data.store.neighbours(matched, interaction_type)
+    return {
+        "drug": drug,
+        "matched": matched,
+        "degree": int(data.graph.degree[node]),
+        "hub_rank": int(data.graph.hub_rank[node]),
+        "count": len(neighbors),
+        "neighbors": neighbors[:limit]
+    }
+
+@app.get("/interactions/within")
+def api_within(
+    drug: str = Query(...),
+    hops: int = Query(2, ge=1, le=4),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    data = reloader.current
+    node, matched = graph_node(data, drug)
+    if node is None:
+        return {"drug": drug, "matched": None, "hops": hops, "count": 0, "counts_by_hop": {}, "drugs": []}
+    drugs = data.graph.reachable(node, hops)
+    counts = {}
+    for item in drugs:
+        counts[item["hops"]] = counts.get(item["hops"], 0) + 1
+    return {
+        "drug": drug,
+        "matched": matched,
+        "hops": hops,
+        "count": len(drugs),
+        "counts_by_hop": counts,
+        "drugs": drugs[:limit]
+    }
+
+@app.get("/interactions/shared")
+def api_shared(
+    drug1: str = Query(...),
+    drug2: str = Query(...),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    data = reloader.current
+    node1, matched1 = graph_node(data, drug1)
+    node2, matched2 = graph_node(data, drug2)
+    shared = data.graph.shared(node1, node2) if node1 is not None and node2 is not None else []
+    return {
+        "drug1": drug1,
+        "drug2": drug2,
+        "matched1": matched1,
+        "matched2": matched2,
+        "count": len(shared),
+        "shared": shared[:limit]
+    }
+
+@app.get("/interactions/hubs")
+def api_hubs(
+    limit: int = Query(20, ge=1, le=500),
+    offset: int = Query(0, ge=0)
+):
+    data = reloader.current
+    return {
+        "total": data.graph.size,
+        "offset": offset,
+        "hubs": data.graph.top_hubs(limit, offset)
+    }
+
+@app.get("/entity")
+def api_entity(
+    drug: str = Query(...),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Shared entity lookup: resolves names exactly as the description API's /entity does"""
+    data = reloader.current
+    entity_id = data.entities.resolve(drug)
+    node = None if entity_id is None else data.entity_nodes[entity_id]
+    interactions = [] if node is None else data.graph.interactions(node)
+    return {
+        "drug": drug,
+        # ddi_name follows the same rule as entity_nodes, so it names this node
+        "entity": None if entity_id is None else data.entities.record(entity_id, data.pair_index.ids),
+        "node": node,
+        "matched": None if node is None else data.graph.names[node],
+        "count": len(interactions),
+        "interactions": interactions[:limit]
+    }
+
+@app.get("/export/interactions")
+def api_export_interactions(
+    drug: Optional[List[str]] = Query(None, max_length=1000),
+    match: str = Query("substring", pattern="^(exact|token|substring)$")
+):
+    # Streamed one drug per line from one data version, never built as a whole response
+    data = reloader.current
+    return StreamingResponse(export_interactions(data, drug, match), media_type="application/x-ndjson")
+
+@app.post("/admin/reload", status_code=202)
+def api_reload(x_admin_token: Optional[str] = Header(None)):
+    """Rebuild the tables and indexes in the background, then swap them in"""
+    if not authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    started = reloader.reload()
+    return {"started": started, **reloader.stats()}
+
+@app.get("/health")
+def api_health():
+    data = reloader.current
+    return {
+        "status": "ok",
+        "data": reloader.stats(),
+        "sample_data": data.samples,
+        "storage": data.store.stats(),
+        "interactions": data.ddi_data.stats(),
+        "resolver": data.resolver.stats(),
+        "pair_index": data.pair_index.stats(),
+        "graph": data.graph.stats(),
+        "name_index": data.name_index.stats(),
+        "payloads": data.payloads.stats(),
+        "entities": data.entities.stats(),
+        "saudi_drugs": len(data.saudi_drugs)
+    }
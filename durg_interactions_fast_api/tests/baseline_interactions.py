@@ -0,0 +1,88 @@
+"""The original DataFrame-scanning lookups, kept as the reference the indexed service must match."""
+import pandas as pd
+
+from medvision_common.drug_entities import PLACEHOLDER_NAMES
+
+
+def _clean(value):
+    return None if not isinstance(value, str) and pd.isna(value) else value
+
+
+def records(df):
+    """to_dict records with missing values as None, as the service renders them."""
+    return [{key: _clean(value) for key, value in row.items()} for row in df.to_dict(orient="records")]
+
+
+def search_drug_name(saudi_drugs, user_input):
+    user_input = user_input.strip().lower()
+    # Fillers such as "Under Research" resolve to nothing, as in the shared entity table
+    if user_input in PLACEHOLDER_NAMES:
+        return None, None
+    sci_match = saudi_drugs[saudi_drugs["scientific_name"].str.lower() == user_input]
+    if not sci_match.empty:
+        return sci_match.iloc[0]["scientific_name"], _clean(sci_match.iloc[0]["trade_name_saudi"])
+    brand_match = saudi_drugs[saudi_drugs["trade_name_saudi"].str.lower() == user_input]
+    if not brand_match.empty:
+        return brand_match.iloc[0]["scientific_name"], _clean(brand_match.iloc[0]["trade_name_saudi"])
+    return None, None
+
+
+def find_interactions(saudi_drugs, ddi_data, drug_name):
+    sci_name, _ = search_drug_name(saudi_drugs, drug_name)
+    if sci_name is None:
+        return []
+    # Literal substring (the original passed the name as a regex, so "(" or "+" in a name broke it)
+    mask1 = ddi_data["drug1_name"].str.lower().str.contains(sci_name.lower(), na=False, regex=False)
+    mask2 = ddi_data["drug2_name"].str.lower().str.contains(sci_name.lower(), na=False, regex=False)
+    results = pd.concat([ddi_data.loc[mask1], ddi_data.loc[mask2]]).drop_duplicates()
+    if results.empty:
+        return []
+
+    def brand(name):
+        # The original crashed on a missing name; it has no brand
+        return search_drug_name(saudi_drugs, name)[1] if isinstance(name, str) else None
+
+    results["drug1_brand"] = results["drug1_name"].apply(brand)
+    results["drug2_brand"] = results["drug2_name"].apply(brand)
+    return records(results)
+
+
+def check_drug_interaction(saudi_drugs, ddi_data, drug1, drug2):
+    sci1, brand1 = search_drug_name(saudi_drugs, drug1)
+    sci2, brand2 = search_drug_name(saudi_drugs, drug2)
+    if sci1 is None or sci2 is None:
+        return None
+    lower1, lower2 = ddi_data["drug1_name"].str.lower(), ddi_data["drug2_name"].str.lower()
+    mask1 = (lower1 == sci1.lower()) & (lower2 == sci2.lower())
+    mask2 = (lower1 == sci2.lower()) & (lower2 == sci1.lower())
+    interaction = ddi_data[mask1 | mask2]
+    if interaction.empty:
+        return None
+    row = records(interaction.iloc[[0]])[0]
+    row["drug1_brand"] = brand1
+    row["drug2_brand"] = brand2
+    row["drug1_scientific"] = sci1
+    row["drug2_scientific"] = sci2
+    return row
+
+
+def scan_neighbours(ddi_data, name):
+    """{neighbour (lowercased): interaction type of the pair's first row}, by scanning the table; self excluded."""
+    name = name.lower()
+    found = {}
+    rows = zip(ddi_data["drug1_name"].str.lower(), ddi_data["drug2_name"].str.lower(), ddi_data["interaction_type"])
+    for name1, name2, kind in rows:
+        for own, other in ((name1, name2), (name2, name1)):
+            if own == name and isinstance(other, str) and other != name:
+                found.setdefault(other, _clean(kind))
+    return found
+
+
+def without_brand_lists(row):
+    """Drop the drug1_brands / drug2_brands lists, which the original did not return."""
+    return row if row is None else {k: v for k, v in row.items() if not k.endswith("_brands")}
+
+
+def unordered(rows):
+    """Rows in a canonical order, for comparing results whose row order differs."""
+    return sorted(rows, key=lambda row: [repr(value) for value in row.values()])
@@ -0,0 +1,82 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# The baseline_* reference implementations
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+INTERACTION_TYPES = ["Increased bleeding risk", "Hypoglycemia", "Hyperkalemia", "Rhabdomyolysis", "Bradycardia"]
+
+
+@pytest.fixture(autouse=True)
+def service_dir(monkeypatch):
+    """Data files are opened relative to the service directory, as when it is deployed."""
+    monkeypatch.chdir(SERVICE_DIR)
+
+
+@pytest.fixture(scope="session")
+def main():
+    os.chdir(SERVICE_DIR)
+    import main
+
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    from fastapi.testclient import TestClient
+
+    return TestClient(main.app)
+
+
+def synthetic_ddi(names, size, seed=0):
+    """DrugBank-shaped rows between random pairs of names: repeats, both orders, case variants, self pairs, gaps."""
+    rng = np.random.default_rng(seed)
+    names = np.array(names + [name.upper() for name in names[:10]] + ["Not In Formulary"], dtype=object)
+    drug1, drug2 = rng.integers(len(names), size=size), rng.integers(len(names), size=size)
+    df = pd.DataFrame({
+        "drug1_id": [f"DB{i:05d}" for i in drug1],
+        "drug2_id": [f"DB{i:05d}" for i in drug2],
+        "drug1_name": names[drug1],
+        "drug2_name": names[drug2],
+        "interaction_type": np.array(INTERACTION_TYPES, dtype=object)[rng.integers(len(INTERACTION_TYPES), size=size)],
+    })
+    df.loc[::97, "drug2_name"] = None
+    df.loc[::89, "interaction_type"] = None
+    df.loc[::61, "drug2_name"] = df.loc[::61, "drug1_name"]
+    # Exact repeats, which the interaction lists drop
+    return pd.concat([df, df.iloc[::50]], ignore_index=True)
+
+
+@pytest.fixture(scope="session")
+def ddi_frame(main):
+    names = main.reloader.current.saudi_drugs["scientific_name"].dropna().astype(str).tolist()
+    return synthetic_ddi(names[:200], 4000)
+
+
+@pytest.fixture(scope="session")
+def data(main, ddi_frame):
+    """The service state with the synthetic DDI table, built the way build_state builds it."""
+    from medvision_common.ddi_store import DDITable
+
+    from ddi_backends import MemoryStore
+    from ddi_graph import InteractionGraph
+    from ddi_index import NameMatchIndex, PairIndex
+    from ddi_payloads import PayloadStore
+
+    base = main.reloader.current
+    table = DDITable.from_frame(ddi_frame)
+    pair_index = PairIndex(table)
+    name_index = NameMatchIndex(table, pair_index)
+    graph = InteractionGraph(table, pair_index)
+    return SimpleNamespace(**{
+        **vars(base), "ddi_data": table, "pair_index": pair_index, "name_index": name_index,
+        "payloads": PayloadStore(table, name_index, base.resolver), "graph": graph,
+        "store": MemoryStore(table, pair_index, graph), "entity_nodes": base.entities.ddi_nodes(pair_index.ids),
+    })
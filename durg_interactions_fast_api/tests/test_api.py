@@ -0,0 +1,156 @@
+import json
+import os
+import random
+
+import pytest
+
+from medvision_common.drug_entities import read_artifact
+
+import baseline_interactions as baseline
+
+
+@pytest.fixture
+def synthetic(main, data, monkeypatch):
+    """Serve the synthetic DDI table for the duration of a test."""
+    monkeypatch.setattr(main.reloader, "current", data)
+    return data
+
+
+def drug_names(data, ddi_frame, n, seed=0):
+    """Scientific names, their trade names, case variants, DDI-only and unknown names."""
+    rng = random.Random(seed)
+    formulary = data.saudi_drugs.dropna().iloc[:200]
+    pool = formulary["scientific_name"].tolist() + formulary["trade_name_saudi"].tolist()
+    pool += [name.upper() for name in pool[:20]] + ["Not In Formulary", "not-a-drug"]
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def test_check_interaction_matches_baseline(client, synthetic, ddi_frame):
+    names = drug_names(synthetic, ddi_frame, 300)
+    pairs = list(zip(names[::2], names[1::2]))
+    pairs += [(a, b) for a, b in zip(ddi_frame["drug1_name"][:100], ddi_frame["drug2_name"][:100]) if isinstance(b, str)]
+    found = 0
+    for drug1, drug2 in pairs:
+        response = client.post("/check_interaction", json={"drug1": drug1, "drug2": drug2}).json()
+        expected = baseline.check_drug_interaction(synthetic.saudi_drugs, ddi_frame, drug1, drug2)
+        assert baseline.without_brand_lists(response["interaction"]) == expected
+        found += expected is not None
+    assert found > 50
+
+
+def test_search_drug_matches_baseline(client, synthetic, ddi_frame):
+    for name in drug_names(synthetic, ddi_frame, 40, seed=1):
+        response = client.post("/search_drug", json={"drug_name": name}).json()
+        expected = baseline.find_interactions(synthetic.saudi_drugs, ddi_frame, name)
+        # Rows come grouped by ranked name match instead of in table order
+        interactions = [baseline.without_brand_lists(row) for row in response["interactions"]]
+        assert baseline.unordered(interactions) == baseline.unordered(expected)
+
+
+def test_search_drug_match_modes_narrow(client, synthetic):
+    name = synthetic.resolver.scientific[0]
+    rows = {
+        mode: client.post("/search_drug", json={"drug_name": name, "match": mode}).json()["interactions"]
+        for mode in ["exact", "token", "substring"]
+    }
+    keys = {mode: {json.dumps(row, sort_keys=True) for row in found} for mode, found in rows.items()}
+    assert keys["exact"] <= keys["token"] <= keys["substring"]
+    assert rows["exact"]
+    assert all(name.lower() in {row["drug1_name"].lower(), (row["drug2_name"] or "").lower()} for row in rows["exact"])
+
+
+def test_check_regimen_matches_pairwise_checks(client, synthetic, ddi_frame):
+    drugs = drug_names(synthetic, ddi_frame, 12, seed=2) + [synthetic.resolver.scientific[0]] * 2
+    response = client.post("/check_regimen", json={"drugs": drugs}).json()
+    expected = []
+    for i, drug1 in enumerate(drugs):
+        for drug2 in drugs[i + 1:]:
+            row = client.post("/check_interaction", json={"drug1": drug1, "drug2": drug2}).json()["interaction"]
+            if row is not None:
+                expected.append(row)
+    found = [item["interaction"] for item in response["interactions"]]
+    assert all(row in expected for row in found)
+    assert response["duplicates"]
+    assert response["unresolved"] == [name for name in drugs if synthetic.entities.resolve(name) is None]
+
+
+def test_lookups_resolve_through_entities(client, synthetic):
+    # A salt form, the ingredient and its brand are one entity, as /entity resolves them
+    def search(name):
+        return client.post("/search_drug", json={"drug_name": name}).json()["interactions"]
+
+    assert search("ATORVASTATIN CALCIUM") == search("atorvastatin") == search("Lipitor") != []
+    partner = next(
+        row["drug2_name"] for row in search("atorvastatin")
+        if row["drug1_name"] == "Atorvastatin" and row["drug2_name"] not in (None, "Atorvastatin")
+    )
+    pair = client.post("/check_interaction", json={"drug1": "atorvastatin calcium", "drug2": partner}).json()
+    assert pair["interaction"]["drug1_scientific"] == "Atorvastatin"
+    regimen = client.post("/check_regimen", json={"drugs": ["Lipitor", "atorvastatin calcium", partner]}).json()
+    assert regimen["duplicates"] == [{"name": "atorvastatin calcium", "same_as": "Lipitor"}]
+    assert regimen["interaction_count"] == 1
+
+
+def test_export_lines_match_search_drug(client, synthetic):
+    drugs = [synthetic.resolver.scientific[i] for i in range(3)]
+    response = client.get("/export/interactions", params=[("drug", drug) for drug in drugs])
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["drug"] for line in lines] == drugs
+    for line in lines:
+        search = client.post("/search_drug", json={"drug_name": line["drug"]}).json()
+        assert line["interactions"] == search["interactions"]
+
+
+def test_neighbors_within_shared_hubs(client):
+    # The built-in sample interactions
+    neighbors = client.get("/interactions/neighbors", params={"drug": "warfarin"}).json()
+    assert neighbors["matched"] == "Warfarin"
+    assert [item["name"] for item in neighbors["neighbors"]] == ["Aspirin", "Ibuprofen", "Vitamin K"]
+
+    within = client.get("/interactions/within", params={"drug": "warfarin", "hops": 2}).json()
+    assert within["counts_by_hop"] == {"1": 3}
+
+    shared = client.get("/interactions/shared", params={"drug1": "ibuprofen", "drug2": "warfarin"}).json()
+    assert [item["name"] for item in shared["shared"]] == ["Aspirin"]
+
+    hubs = client.get("/interactions/hubs", params={"limit": 2}).json()["hubs"]
+    assert [hub["name"] for hub in hubs] == ["Warfarin", "Aspirin"]
+
+    missing = client.get("/interactions/neighbors", params={"drug": "not-a-drug"}).json()
+    assert missing["matched"] is None and missing["count"] == 0
+
+
+def test_entity_links_interactions(client):
+    response = client.get("/entity", params={"drug": "coumadin"}).json()
+    assert response["entity"]["scientific_name"] == "Warfarin"
+    assert {item["name"] for item in response["interactions"]} == {"Aspirin", "Ibuprofen", "Vitamin K"}
+    # The entity's DDI name and its node agree, including for the built-in sample table
+    for drug in ["coumadin", "aspirin", "paracetamol"]:
+        response = client.get("/entity", params={"drug": drug}).json()
+        ddi_name = response["entity"]["ddi_name"]
+        assert (ddi_name is None) == (response["node"] is None)
+        assert ddi_name is None or ddi_name == response["matched"].lower()
+    assert client.get("/entity", params={"drug": "not-a-drug"}).json()["entity"] is None
+
+
+def test_entities_load_the_configured_artifact(main):
+    # The description service reads the same file (DRUG_ENTITIES_PATH, set by the root conftest)
+    artifact = read_artifact(os.environ["DRUG_ENTITIES_PATH"])
+    entities = main.reloader.current.entities
+    assert entities.sources == artifact["sources"] and entities.scientific == artifact["scientific"]
+
+
+def test_health(client):
+    health = client.get("/health").json()
+    assert health["status"] == "ok"
+    assert health["sample_data"] == ["DDI_data.csv"]
+    assert health["storage"]["backend"] == "memory"
+    assert 0 < health["pair_index"]["pairs"] <= health["interactions"]["rows"]
+
+
+def test_admin_reload_requires_token(main, client, monkeypatch):
+    monkeypatch.delenv("RELOAD_TOKEN", raising=False)
+    assert client.post("/admin/reload").status_code == 403
+    monkeypatch.setenv("RELOAD_TOKEN", "s3cret")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert "Drugs_discription.csv" in {os.path.basename(path) for path in main.reloader.paths}
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from ddi_backends import PostgresDriver, SQLiteDriver, SQLStore, ensure_tables, schema, table_digest
+
+
+def test_sqlite_store_matches_memory_store(data, ddi_frame, tmp_path):
+    driver = SQLiteDriver(str(tmp_path / "ddi.sqlite3"))
+    ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+    sql = SQLStore(driver, data.ddi_data.columns, pool_size=2)
+    memory = data.store
+    names = data.name_index.names
+    pairs = list(zip(ddi_frame["drug1_name"][:300], ddi_frame["drug2_name"][:300].fillna("missing")))
+    pairs += [(names[0].upper(), names[1]), ("not-a-drug", names[0])]
+
+    async def compare():
+        for name1, name2 in pairs:
+            assert await sql.pair(name1, name2) == await memory.pair(name1, name2)
+        for name in names[:80] + ["not-a-drug", f"  {names[0].upper()} "]:
+            assert await sql.neighbours(name) == await memory.neighbours(name)
+            for kind in ["Hypoglycemia", "BRADYCARDIA", "unknown type"]:
+                assert await sql.neighbours(name, kind) == await memory.neighbours(name, kind)
+        assert await sql.pairs(pairs) == await memory.pairs(pairs)
+        # More concurrent lookups than pooled connections
+        results = await asyncio.gather(*(sql.neighbours(name) for name in names[:20]))
+        assert results == [await memory.neighbours(name) for name in names[:20]]
+
+    asyncio.run(compare())
+    stats = sql.stats()
+    assert stats["pool"]["open"] <= 2
+    # Once one by one, once through pairs()
+    assert stats["latency"]["pair"]["calls"] == 2 * len(pairs)
+
+
+def test_sqlite_tables_rebuilt_only_when_data_changes(data, tmp_path):
+    driver = SQLiteDriver(str(tmp_path / "ddi.sqlite3"))
+    ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+    mtime = (tmp_path / "ddi.sqlite3").stat().st_mtime_ns
+    ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+    assert (tmp_path / "ddi.sqlite3").stat().st_mtime_ns == mtime
+
+
+def test_closed_pool_closes_idle_and_released_connections(data, tmp_path):
+    driver = SQLiteDriver(str(tmp_path / "ddi.sqlite3"))
+    ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+    sql = SQLStore(driver, data.ddi_data.columns, pool_size=2)
+    name = data.name_index.names[0]
+
+    async def run():
+        await asyncio.gather(*(sql.neighbours(name) for _ in range(4)))
+        assert sql.pool.stats()["idle"] == 2
+        in_flight = await sql.pool.acquire()
+        # Closed from the reloader's thread while a request still holds a connection
+        await asyncio.to_thread(sql.close)
+        while sql.pool.stats()["idle"]:
+            await asyncio.sleep(0.01)
+        assert sql.pool.stats()["open"] == 1
+        await sql.pool.release(in_flight)
+        assert sql.pool.stats()["open"] == 0
+        # A request that picked up the old version late still gets an answer
+        assert await sql.neighbours(name) == await data.store.neighbours(name)
+        assert sql.pool.stats()["open"] == 0
+
+    asyncio.run(run())
+
+
+class FakeAsyncpg:
+    """The slice of asyncpg PostgresDriver's table setup uses, over an in-memory dict of tables."""
+
+    class UndefinedTableError(Exception):
+        pass
+
+    def __init__(self):
+        self.tables = {}
+        self.loops = set()
+
+    async def connect(self, dsn):
+        self.loops.add(asyncio.get_running_loop())
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    async def fetchval(self, sql):
+        if "ddi_meta" not in self.db.tables:
+            raise self.db.UndefinedTableError(sql)
+        return self.db.tables["ddi_meta"][0][1]
+
+    async def execute(self, sql, *args):
+        words = sql.split()
+        if words[:2] == ["DROP", "TABLE"]:
+            self.db.tables.pop(words[-1], None)
+        elif words[:2] == ["CREATE", "TABLE"]:
+            self.db.tables[words[2]] = []
+        elif words[0] == "INSERT":
+            self.db.tables[words[2]].append(("source_sha256", *args))
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.db.tables[table].extend(records)
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def close(self):
+        pass
+
+
+def test_postgres_tables_built_inside_serving_loop(data, monkeypatch):
+    # A reload or an import under uvicorn calls ensure_tables with an event loop already running
+    fake = FakeAsyncpg()
+    monkeypatch.setitem(sys.modules, "asyncpg", fake)
+    driver = PostgresDriver("postgresql://ddi")
+
+    async def serving():
+        ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+        return asyncio.get_running_loop()
+
+    serving_loop = asyncio.run(serving())
+    assert driver.stored_digest() == table_digest(data.ddi_data)
+    assert len(fake.tables["ddi_rows"]) == len(data.pair_index.positions) and serving_loop not in fake.loops
+    assert set(fake.tables) == {statement.split()[2] for statement in schema(data.ddi_data.columns)} - {"ddi_edges_type"}
+
+
+@pytest.mark.skipif(not os.environ.get("DDI_TEST_DATABASE_URL"), reason="DDI_TEST_DATABASE_URL not set")
+def test_postgres_store_matches_memory_store(data, ddi_frame):
+    pytest.importorskip("asyncpg")
+    driver = PostgresDriver(os.environ["DDI_TEST_DATABASE_URL"])
+    sql = SQLStore(driver, data.ddi_data.columns, pool_size=2)
+    names = data.name_index.names
+    pairs = list(zip(ddi_frame["drug1_name"][:100], ddi_frame["drug2_name"][:100].fillna("missing")))
+
+    async def compare():
+        ensure_tables(driver, data.ddi_data, data.pair_index, data.graph)
+        assert await sql.pairs(pairs) == await data.store.pairs(pairs)
+        for name in names[:40]:
+            assert await sql.neighbours(name) == await data.store.neighbours(name)
+            assert await sql.neighbours(name, "Hypoglycemia") == await data.store.neighbours(name, "Hypoglycemia")
+        sql.close()
+
+    asyncio.run(compare())
@@ -0,0 +1,126 @@
+import random
+
+import numpy as np
+import pytest
+
+from medvision_common.ddi_store import DDITable, build_artifact, read_artifact
+
+from baseline_interactions import records, scan_neighbours
+
+
+def lowercase_names(ddi_frame):
+    return sorted(set(ddi_frame["drug1_name"].dropna().str.lower()) | set(ddi_frame["drug2_name"].dropna().str.lower()))
+
+
+def first_row(ddi_frame, name1, name2):
+    lower1, lower2 = ddi_frame["drug1_name"].str.lower(), ddi_frame["drug2_name"].str.lower()
+    mask = ((lower1 == name1) & (lower2 == name2)) | ((lower1 == name2) & (lower2 == name1))
+    return int(np.flatnonzero(mask)[0]) if mask.any() else None
+
+
+def test_pair_index_matches_masks(data, ddi_frame):
+    names = lowercase_names(ddi_frame)
+    rng = random.Random(0)
+    pairs = [tuple(rng.sample(names, 2)) for _ in range(300)]
+    pairs += [(a, b) for a, b in zip(ddi_frame["drug1_name"][:200], ddi_frame["drug2_name"][:200]) if isinstance(b, str)]
+    for name1, name2 in pairs:
+        expected = first_row(ddi_frame, name1.lower(), name2.lower())
+        assert data.pair_index.lookup(name1, name2) == expected
+        assert data.pair_index.lookup(name2.upper(), name1) == expected
+    assert data.pair_index.lookup("not-a-drug", names[0]) is None
+
+
+@pytest.mark.parametrize("mode", ["exact", "token", "substring"])
+@pytest.mark.parametrize("query", ["acid", "Not In Formulary", "formulary", "a", "in", "  ", "zzz"])
+def test_name_match_index_matches_scan(data, ddi_frame, mode, query):
+    index = data.name_index
+    q = query.strip().lower()
+    names = index.names
+    words = set(q.split())
+    if not q:
+        expected = set()
+    elif mode == "exact":
+        expected = {name for name in names if name == q}
+    elif mode == "token":
+        expected = {name for name in names if words <= set(index.name_tokens[index.ids[name]])}
+    else:
+        expected = {name for name in names if q in name}
+    matches = index.match(query, mode)
+    assert {names[name_id] for name_id, _ in matches} == expected
+    # Ranked exact, prefix, whole word, other substring
+    kinds = [index.KINDS.index(kind) for _, kind in matches]
+    assert kinds == sorted(kinds)
+
+
+def test_name_match_rows_match_scan(data, ddi_frame):
+    lower1, lower2 = ddi_frame["drug1_name"].str.lower(), ddi_frame["drug2_name"].str.lower()
+    for name, name_id in list(data.name_index.ids.items())[:50]:
+        expected = np.flatnonzero((lower1 == name) | (lower2 == name)).tolist()
+        assert data.name_index.rows(name_id).tolist() == expected
+
+
+def test_graph_neighbours_match_scan(data, ddi_frame):
+    graph = data.graph
+    for name in lowercase_names(ddi_frame)[:60]:
+        expected = scan_neighbours(ddi_frame, name)
+        interactions = graph.interactions(graph.node(name))
+        assert {item["name"].lower(): item["interaction_type"] for item in interactions} == expected
+        assert [item["name"] for item in interactions] == sorted(item["name"] for item in interactions)
+        assert graph.degree[graph.node(name)] == len(expected)
+
+
+def test_graph_interaction_type_filter(data, ddi_frame):
+    graph = data.graph
+    name = lowercase_names(ddi_frame)[0]
+    expected = {other for other, kind in scan_neighbours(ddi_frame, name).items() if kind == "Hypoglycemia"}
+    filtered = graph.interactions(graph.node(name), "HYPOGLYCEMIA")
+    assert {item["name"].lower() for item in filtered} == expected
+
+
+def test_graph_reachable_is_breadth_first(data, ddi_frame):
+    graph = data.graph
+    name = lowercase_names(ddi_frame)[5]
+    one_hop = set(scan_neighbours(ddi_frame, name))
+    two_hop = set()
+    for other in one_hop:
+        two_hop |= set(scan_neighbours(ddi_frame, other))
+    two_hop -= one_hop | {name}
+
+    reached = graph.reachable(graph.node(name), 2)
+    assert {item["name"].lower() for item in reached if item["hops"] == 1} == one_hop
+    assert {item["name"].lower() for item in reached if item["hops"] == 2} == two_hop
+    assert [item["hops"] for item in reached] == sorted(item["hops"] for item in reached)
+
+
+def test_graph_shared_and_hubs(data, ddi_frame):
+    graph = data.graph
+    names = lowercase_names(ddi_frame)
+    first, second = scan_neighbours(ddi_frame, names[1]), scan_neighbours(ddi_frame, names[2])
+    shared = graph.shared(graph.node(names[1]), graph.node(names[2]))
+    assert {item["name"].lower() for item in shared} == set(first) & set(second)
+    assert all(item["drug1_interaction"] == first[item["name"].lower()] for item in shared)
+
+    degrees = {name: len(scan_neighbours(ddi_frame, name)) for name in names}
+    hubs = graph.top_hubs(10)
+    assert [hub["degree"] for hub in hubs] == sorted(degrees.values(), reverse=True)[:10]
+    assert all(degrees[hub["name"].lower()] == hub["degree"] for hub in hubs)
+
+
+def test_name_resolver_keeps_every_brand(data):
+    formulary = data.saudi_drugs[data.saudi_drugs["trade_name_saudi"].notna()]
+    for drug_id, name in enumerate(data.resolver.scientific[:100]):
+        brands = formulary.loc[formulary["scientific_name"].str.lower() == name.lower(), "trade_name_saudi"]
+        assert data.resolver.brands[drug_id] == brands.drop_duplicates().tolist()
+        assert data.resolver.resolve(f" {name.upper()} ")[0] == drug_id
+
+
+def test_ddi_artifact_matches_frame(ddi_frame, tmp_path):
+    csv_path = str(tmp_path / "DDI_data.csv")
+    ddi_frame.to_csv(csv_path, index=False)
+    # Chunks smaller than the table, so vocabularies grow across chunks
+    table = read_artifact(build_artifact(csv_path, chunk_rows=1000))
+    assert table.memory_mapped
+    positions = np.arange(len(ddi_frame))
+    assert table.rows(positions) == DDITable.from_frame(ddi_frame).rows(positions)
+    assert table.rows(positions[:200]) == records(ddi_frame.iloc[:200])
+    assert read_artifact(csv_path + ".missing") is None